@@ -3,6 +3,10 @@ import os
 import sys
 import subprocess
 from app.scripts.cleanup_sessions import cleanup_expired_sessions
+from app.core.config import settings
+from app.core import storage, write_behind
+from app.db import get_dedup_report
+from app.workers.autoscaler import get_metrics_store
 
 router = APIRouter()
 
@@ -16,25 +20,6 @@ async def trigger_cleanup(background_tasks: BackgroundTasks):
     background_tasks.add_task(cleanup_expired_sessions)
     return {"status": "Cleanup task started in background."}
 
-# Robust Path Resolution (Duplicated from documents.py for self-containment)
-import pathlib
-BASE_DIR = pathlib.Path(__file__).resolve().parent.parent.parent.parent
-DATA_DIR = BASE_DIR / "data"
-if not DATA_DIR.exists() and pathlib.Path("/app/data").exists():
-    DATA_DIR = pathlib.Path("/app/data")
-
-def get_directory_size(path):
-    total = 0
-    try:
-        if not path.exists():
-            return 0
-        for entry in path.rglob('*'):
-            if entry.is_file():
-                total += entry.stat().st_size
-    except Exception as e:
-        print(f"Error calculating size: {e}")
-    return total
-
 def format_size(size_bytes):
     if size_bytes == 0:
         return "0 B"
@@ -46,19 +31,68 @@ def format_size(size_bytes):
     return f"{s}{size_name[i]}"
 
 @router.get("/storage", summary="Get Storage Usage")
-async def get_storage_usage():
+def get_storage_usage():
     """
-    Get current storage usage with formatted units.
-    Limit is 5GB.
+    Storage usage from the ledger (no directory walk): total against
+    STORAGE_QUOTA_GB, bytes/files per data category and the largest sessions.
     """
-    used_bytes = get_directory_size(DATA_DIR)
-    total_bytes = 5 * 1024 * 1024 * 1024 # 5 GB
-    
+    usage = storage.usage()
+    used_bytes, total_bytes = usage["used_bytes"], usage["total_bytes"]
     return {
-        "used_bytes": used_bytes,
-        "total_bytes": total_bytes,
+        **usage,
         "used_gb": round(used_bytes / (1024**3), 2),
-        "total_gb": 5,
+        "total_gb": settings.STORAGE_QUOTA_GB,
         "used_formatted": format_size(used_bytes),
-        "percentage": round((used_bytes / total_bytes) * 100, 1)
+        "percentage": round((used_bytes / total_bytes) * 100, 1) if total_bytes else 0.0,
+    }
+
+@router.post("/storage/reconcile", summary="Rescan data/ and Correct the Storage Ledger")
+def reconcile_storage():
+    drift = storage.reconcile()
+    return {"status": "reconciled", "drift": drift, **storage.usage()}
+
+@router.get("/dedup", summary="Near-Duplicate Chunk Report")
+async def get_dedup_stats():
+    """
+    Duplication ratio of the static library (session uploads are not
+    deduplicated): chunks seen at ingestion vs. canonical chunks stored in Qdrant.
+    """
+    corpora = get_dedup_report()
+    chunks = sum(c["chunks"] for c in corpora)
+    duplicates = sum(c["duplicates"] for c in corpora)
+    return {
+        "mode": settings.DEDUP_MODE,
+        "threshold": settings.DEDUP_THRESHOLD,
+        "chunks": chunks,
+        "duplicates": duplicates,
+        "duplication_ratio": round(duplicates / chunks, 4) if chunks else 0.0,
+        "corpora": corpora,
+    }
+
+@router.get("/autoscaler", summary="Worker Autoscaler Decisions")
+async def get_autoscaler_stats():
+    """
+    Latest scaling decision (queue depth, queued bytes, throughput, workers,
+    warming, desired, action, reason), recent history and action counters.
+    """
+    report = get_metrics_store().report()
+    return {
+        "min_workers": settings.AUTOSCALE_MIN_WORKERS,
+        "max_workers": settings.AUTOSCALE_MAX_WORKERS,
+        "target_drain_seconds": settings.AUTOSCALE_TARGET_DRAIN_SECONDS,
+        "warmup_seconds": settings.AUTOSCALE_WARMUP_SECONDS,
+        **report,
+    }
+
+@router.get("/write-behind", summary="Write-Behind Queue of Query Logs and Chat Messages")
+async def get_write_behind_stats():
+    """Rows buffered, committed, written inline (buffer full), dropped and discarded (failed)."""
+    queue = write_behind.get_write_queue()
+    return {
+        "enabled": queue is not None,
+        "interval_ms": settings.WRITE_BEHIND_INTERVAL_MS,
+        "batch_rows": settings.WRITE_BEHIND_BATCH_ROWS,
+        "queue_size": settings.WRITE_BEHIND_QUEUE_SIZE,
+        "overflow": settings.WRITE_BEHIND_OVERFLOW,
+        **(queue.stats() if queue else {}),
     }
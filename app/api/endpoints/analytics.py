@@ -1,20 +1,35 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
+import time
+from app.core.config import settings
 from app.db import get_timeseries_stats
 
 router = APIRouter()
 
+# (range, start, end) -> (expires_at, stats); the rollups change with every query, so only briefly
+_cache = {}
+
 @router.get("/stats")
-async def get_analytics_stats(
+def get_analytics_stats(
     range: str = Query("7d", description="Time range for analytics (today, 7d, 30d, custom)"),
     start: Optional[str] = Query(None, description="Start date for custom range (ISO)"),
     end: Optional[str] = Query(None, description="End date for custom range (ISO)")
 ):
     """
     Retrieve aggregated analytics metrics for the dashboard with dynamic time range.
+    Answered from the hourly/daily rollups and cached for ANALYTICS_CACHE_TTL_SECONDS.
     """
     try:
+        key = (range, start, end)
+        now = time.monotonic()
+        cached = _cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
         stats = get_timeseries_stats(range_type=range, custom_start=start, custom_end=end)
+        if settings.ANALYTICS_CACHE_TTL_SECONDS > 0:
+            for k in [k for k, (expires, _) in _cache.items() if expires <= now]:
+                _cache.pop(k, None)
+            _cache[key] = (now + settings.ANALYTICS_CACHE_TTL_SECONDS, stats)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
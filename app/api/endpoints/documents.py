@@ -1,12 +1,16 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Path, Header, Response
+from typing import List, Optional
 from pydantic import BaseModel
-import datetime
-import fitz # PyMuPDF
+from urllib.parse import quote, urlencode
+import asyncio
 import pathlib
 import base64
 import os
 
+from app.core import page_render
+from app.core.config import settings
+from app.db import list_documents_page
+
 router = APIRouter()
 
 # Robust Path Resolution
@@ -20,186 +24,179 @@ if not DATA_DIR.exists() and pathlib.Path("/app/data").exists():
 UPLOAD_DIR = DATA_DIR / "uploads"
 STATIC_DIR = DATA_DIR / "static"
 
+VERSION_CHARS = 16   # File-hash prefix used as the image URL version
+MIN_ZOOM, MAX_ZOOM = 0.25, 4.0
+
 class DocumentResponse(BaseModel):
     filename: str
     size: int
     upload_date: str
     session_id: str
     status: str
+    category: Optional[str] = None
+    file_hash: Optional[str] = None
+    page_count: Optional[int] = None
+    chunk_count: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    ingested_at: Optional[str] = None
 
 @router.get("/documents", response_model=List[DocumentResponse])
-async def list_documents():
-    """List all uploaded documents (uploads and static)."""
-    print(f"DEBUG: Scanning for documents...")
-    print(f"DEBUG: BASE_DIR: {BASE_DIR}")
-    print(f"DEBUG: DATA_DIR: {DATA_DIR} (Exists: {DATA_DIR.exists()})")
-    print(f"DEBUG: UPLOAD_DIR: {UPLOAD_DIR} (Exists: {UPLOAD_DIR.exists()})")
-    print(f"DEBUG: STATIC_DIR: {STATIC_DIR} (Exists: {STATIC_DIR.exists()})")
-    
-    docs = []
-    
-    # 1. Scan Static Files (Permanent)
-    if STATIC_DIR.exists():
-        for file_path in STATIC_DIR.iterdir():
-            if file_path.is_file():
-                try:
-                    stat = file_path.stat()
-                    docs.append(DocumentResponse(
-                        filename=file_path.name,
-                        size=stat.st_size,
-                        upload_date=datetime.datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d"),
-                        session_id="static", # Special ID for static files
-                        status="Ready"
-                    ))
-                except Exception as e:
-                    print(f"Error reading static file {file_path}: {e}")
-
-    # 2. Scan Uploads (Session-based)
-    if UPLOAD_DIR.exists():
-        for session_dir in UPLOAD_DIR.iterdir():
-            if session_dir.is_dir():
-                session_id = session_dir.name
-                for file_path in session_dir.iterdir():
-                    if file_path.is_file():
-                        try:
-                            stat = file_path.stat()
-                            docs.append(DocumentResponse(
-                                filename=file_path.name,
-                                size=stat.st_size,
-                                upload_date=datetime.datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d"),
-                                session_id=session_id,
-                                status="Processed"
-                            ))
-                        except Exception as e:
-                            print(f"Error reading upload file {file_path}: {e}")
-                            
-    return docs
+def list_documents(
+    response: Response,
+    session_id: str = Query(None, description="Only this session's files ('static' for the permanent library)"),
+    category: str = Query(None, description="user | static"),
+    status: str = Query(None, description="queued | processing | ready | failed | cancelled | unindexed"),
+    cursor: int = Query(None, ge=1, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Documents from the catalog, newest first. When more documents match, the
+    response carries an X-Next-Cursor header to pass as `cursor` for the next page.
+    """
+    rows, next_cursor = list_documents_page(session_id, category, status, cursor, limit)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return [
+        DocumentResponse(
+            filename=row["filename"],
+            size=row["size_bytes"] or 0,
+            upload_date=(row["created_at"] or "")[:10],
+            session_id=row["session_id"],
+            status=row["status"] or "unknown",
+            **{k: row[k] for k in (
+                "category", "file_hash", "page_count", "chunk_count", "error",
+                "created_at", "updated_at", "ingested_at",
+            )},
+        )
+        for row in rows
+    ]
+
+def resolve_document(filename: str, session_id: str = None) -> pathlib.Path:
+    """Session upload first, then the static library; 404 if neither exists."""
+    candidates = []
+    if session_id:
+        candidates.append(UPLOAD_DIR / session_id / filename)
+    candidates.append(STATIC_DIR / filename)
+    for path in candidates:
+        # Refuse anything that resolves outside the data directory
+        if path.resolve().is_relative_to(DATA_DIR.resolve()) and path.is_file():
+            return path
+    raise HTTPException(status_code=404, detail=f"Document not found. Checked session '{session_id}' and static.")
+
+
+def page_image_url(filename: str, page: int, query: str, session_id: str, version: str,
+                   zoom: float, fmt: str) -> str:
+    params = {"zoom": f"{zoom:g}", "format": fmt, "v": version}
+    if query:
+        params["query"] = query
+    if session_id:
+        params["session_id"] = session_id
+    return f"{settings.API_V1_STR}/documents/{quote(filename)}/pages/{page}?{urlencode(params)}"
+
+
+@router.get("/documents/{filename}/pages/{page}")
+async def get_page_image(
+    filename: str,
+    page: int = Path(..., ge=1, description="1-based page number"),
+    zoom: float = Query(None, ge=MIN_ZOOM, le=MAX_ZOOM, description="Render scale (default PAGE_ZOOM)"),
+    format: str = Query("jpeg", pattern="^(jpeg|webp)$"),
+    query: str = Query(None, description="Text to highlight"),
+    session_id: str = Query(None, description="Session ID for isolated files"),
+    v: str = Query(None, description="File version (from the context response); makes the response immutable"),
+    if_none_match: str = Header(None),
+):
+    """
+    One rendered page as image/jpeg or image/webp. Served from the rendered-page
+    cache when possible; the ETag identifies file version, page, zoom, format and highlights.
+    """
+    if format == "webp" and not page_render.webp_supported():
+        raise HTTPException(status_code=415, detail="WebP rendering is not available; use format=jpeg")
+    file_path = resolve_document(filename, session_id)
+    zoom = zoom or settings.PAGE_ZOOM
+    file_hash, key = await page_render.page_etag(file_path, page, zoom, format, query)
+    etag = f'"{key}"'
+    if v and v == file_hash[:VERSION_CHARS]:
+        cache_control = "private, max-age=31536000, immutable"
+    else:
+        cache_control = "private, no-cache"  # Revalidate with If-None-Match (cheap 304)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    try:
+        data = await page_render.get_page_image(file_path, page, zoom, format, query)
+    except page_render.PageOutOfRange as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=data, media_type=page_render.FORMATS[format], headers=headers)
+
 
 @router.get("/documents/{filename}/context")
 async def get_document_context(
     filename: str, 
     page: int = Query(..., description="1-based page number"),
     query: str = Query(None, description="Text to highlight"),
-    session_id: str = Query(None, description="Session ID for isolated files")
+    session_id: str = Query(None, description="Session ID for isolated files"),
+    inline: bool = Query(False, description="Also embed base64 JPEGs (legacy clients); default returns image URLs only"),
+    zoom: float = Query(None, ge=MIN_ZOOM, le=MAX_ZOOM, description="Full-resolution render scale (default PAGE_ZOOM)"),
+    format: str = Query(None, pattern="^(jpeg|webp)$", description="Format of image URLs (default PAGE_IMAGE_FORMAT)"),
 ):
-    # Logic: Check Session -> Check Static -> 404
-    file_path = None
-    
-    # 1. Try Session Path
-    if session_id:
-        session_path = UPLOAD_DIR / session_id / filename
-        if session_path.exists():
-            file_path = session_path
-            
-    # 2. Try Static Path (Fallback)
-    if not file_path:
-        static_path = pathlib.Path("/app/data/static") / filename
-        if static_path.exists():
-            file_path = static_path
-            
-    if not file_path or not file_path.exists():
-        # Debug info for user
-        raise HTTPException(status_code=404, detail=f"Document not found. Checked session '{session_id}' and static.")
-    
+    """
+    Text of the page and its neighbours, with highlighted page images as URLs
+    of the cached page image endpoint: each page has a low-resolution
+    thumbnail_url for a fast first paint and a full-resolution image_url.
+    Clients load the current page first and fetch or prefetch neighbours
+    separately; inline=true also embeds base64 JPEGs.
+    """
+    file_path = resolve_document(filename, session_id)
+    zoom = zoom or settings.PAGE_ZOOM
+    fmt = page_render.url_format(format)
+    current_idx = page - 1
+    indices = [current_idx - 1, current_idx, current_idx + 1]
+
     try:
-        doc = fitz.open(file_path)
-        total_pages = len(doc)
-        
-        # Adjust 1-based page to 0-based index
-        current_idx = page - 1
-        
+        total_pages, texts = await page_render.get_page_texts(file_path, indices)
         if current_idx < 0 or current_idx >= total_pages:
-             raise HTTPException(status_code=400, detail=f"Page {page} out of range")
-             
+            raise HTTPException(status_code=400, detail=f"Page {page} out of range")
+
+        file_hash, _ = await page_render.page_etag(file_path, page, zoom, fmt, query)
+        version = file_hash[:VERSION_CHARS]
+        present = [i for i in indices if i in texts]
+        images = {}
+        if inline:
+            # Pages render in parallel in the pool (or come from the cache)
+            rendered = await asyncio.gather(*(
+                page_render.get_page_image(file_path, i + 1, zoom, "jpeg", query) for i in present
+            ))
+            images = {i: base64.b64encode(data).decode("utf-8") for i, data in zip(present, rendered)}
+
         def get_page_data(idx):
-            if 0 <= idx < total_pages:
-                pg = doc[idx]
-                text = pg.get_text()
-                
-                # Highlighting Logic
-                if query:
-                    # Robust Search Strategy
-                    # 1. Try Exact Match first
-                    quads = pg.search_for(query)
-                    
-                    # 2. If exact match fails or query is long, try splitting into smaller chunks
-                    # This helps when the PDF has weird newlines or hyphens that break the string
-                    pg.add_highlight_annot(quads)
-                    
-                    # 2. Optimized Fallback: Extract Once, Search In-Memory
-                    # Only triggered if exact match fails and query is long enough to justify fuzzy/chunk search
-                    if not quads and len(query) > 20:
-                        # Extract all words with coordinates: (x0, y0, x1, y1, "word", block, line, word_no)
-                        page_words = pg.get_text("words", sort=True)
-                        
-                        # Prepare Query Tokens
-                        q_tokens = [w.strip(".,!?;:\"").lower() for w in query.split()]
-                        chunk_size = 4
-                        
-                        if len(q_tokens) >= chunk_size:
-                            # Prepare Document Tokens (normalized)
-                            # Keep index mapping to access original rects
-                            doc_tokens = [w[4].strip(".,!?;:\"").lower() for w in page_words]
-                            doc_rects = [fitz.Rect(w[:4]) for w in page_words]
-                            
-                            found_rects = []
-                            doc_len = len(doc_tokens)
-                            
-                            # Sliding Window Search (O(M*N) but fast in Python for typical page sizes)
-                            # Iterate over Query Chunks
-                            for i in range(len(q_tokens) - chunk_size + 1):
-                                q_chunk = q_tokens[i : i + chunk_size]
-                                
-                                # Search this chunk in Document
-                                for j in range(doc_len - chunk_size + 1):
-                                    # Compare sequence
-                                    match = True
-                                    for k in range(chunk_size):
-                                        if doc_tokens[j+k] != q_chunk[k]:
-                                            match = False
-                                            break
-                                    
-                                    if match:
-                                        # Add rects for the matched sequence
-                                        for k in range(chunk_size):
-                                            found_rects.append(doc_rects[j+k])
-
-                            # Deduplicate and highlighting
-                            # add_highlight_annot handles lists of rects (even duplicates) reasonably well,
-                            # but we can filter unique rects to be clean
-                            if found_rects:
-                                pg.add_highlight_annot(found_rects)
-                
-                # Render High-Quality Image
-                # Matrix(2, 2) = 2x Zoom (Supersampling) for clear text
-                mat = fitz.Matrix(2, 2)
-                pix = pg.get_pixmap(matrix=mat)
-                
-                # Use JPEG for speed (Dimensions are large due to 2x zoom, PNG would be huge)
-                # Quality 85 is good balance
-                img_bytes = pix.tobytes("jpg", jpg_quality=85)
-                
-                img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-                
-                return {"text": text, "image": img_b64}
-            return None
+            if idx not in texts:
+                return None
+            data = {
+                "number": idx + 1,
+                "text": texts[idx],
+                "thumbnail_url": page_image_url(filename, idx + 1, query, session_id, version,
+                                                settings.PAGE_THUMBNAIL_ZOOM, fmt),
+                "image_url": page_image_url(filename, idx + 1, query, session_id, version, zoom, fmt),
+            }
+            if inline:
+                data["image"] = images[idx]
+            return data
 
         return {
             "filename": filename,
             "total_pages": total_pages,
-            "current_page": {
-                "number": page,
-                **get_page_data(current_idx)
-            },
-            "prev_page": {
-                "number": page - 1,
-                **get_page_data(current_idx - 1)
-            } if current_idx > 0 else None,
-            "next_page": {
-                "number": page + 1,
-                **get_page_data(current_idx + 1)
-            } if current_idx < total_pages - 1 else None
+            "version": version,
+            "zoom": zoom,
+            "format": fmt,
+            "current_page": get_page_data(current_idx),
+            "prev_page": get_page_data(current_idx - 1),
+            "next_page": get_page_data(current_idx + 1),
         }
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
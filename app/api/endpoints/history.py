@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException, Path, Body, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Path, Body, BackgroundTasks, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional, Any
-from app.db import create_session, get_recent_sessions, add_message, get_session_messages, delete_session
+from app.db import create_session, get_recent_sessions, get_messages_page, get_message_sources, delete_session, set_session_documents_status
+from app.core.write_behind import add_message, flush as flush_writes
 import shutil
 import os
 import pathlib
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
+from app.workers.file_sharing import release_session
+from app.core.projection import vector_collections
 
 router = APIRouter()
 
@@ -45,20 +48,25 @@ def delete_vectors_background(session_id: str):
              client = QdrantClient(path=os.getenv("QDRANT_LOCATION"))
         else:
              client = QdrantClient(host=host, port=port)
-        
-        client.delete(
-            collection_name=collection,
-            points_selector=models.FilterSelector(
-                filter=models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key="session_id",
-                            match=models.MatchValue(value=session_id)
-                        )
-                    ]
+
+        # Shared uploads: drop only this session's reference
+        release_session(client, collection, session_id)
+        for name in vector_collections(collection):
+            client.delete(
+                collection_name=name,
+                points_selector=models.FilterSelector(
+                    filter=models.Filter(
+                        must=[
+                            models.FieldCondition(
+                                key="session_id",
+                                match=models.MatchValue(value=session_id)
+                            )
+                        ]
+                    )
                 )
             )
-        )
+        # Files are kept but no longer searchable
+        set_session_documents_status(session_id, "unindexed")
         print(f"Background: Deleted vectors for {session_id}")
     except Exception as e:
         print(f"Background Delete Failed for {session_id}: {e}")
@@ -96,14 +104,39 @@ def append_message(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{session_id}/messages", response_model=List[MessageResponse])
-def get_history(session_id: str):
-    """Get messsage history for a session."""
+def get_history(
+    session_id: str,
+    response: Response,
+    before: int = Query(None, ge=1, description="Messages older than this message id"),
+    after: int = Query(None, ge=1, description="Messages newer than this message id"),
+    limit: int = Query(50, ge=1, le=500),
+    full_sources: bool = Query(False, description="Full sources (chunk texts) instead of references"),
+):
+    """
+    A page of the session's messages in chronological order: the latest `limit`,
+    or those before/after a message id. Sources are references (filename,
+    page_label, score); GET /{session_id}/messages/{message_id}/sources has the
+    full text. When more messages remain in the paging direction, the response
+    carries an X-Next-Cursor header to pass as `before` (or `after`).
+    """
     try:
-        rows = get_session_messages(session_id)
+        flush_writes()  # Include messages still in the write-behind buffer
+        rows, next_cursor = get_messages_page(session_id, before, after, limit, full_sources)
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = str(next_cursor)
         return [MessageResponse(**row) for row in rows]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/{session_id}/messages/{message_id}/sources", response_model=List[dict])
+def get_sources(session_id: str, message_id: int):
+    """Full sources (with chunk text) of one message."""
+    flush_writes()
+    sources = get_message_sources(session_id, message_id)
+    if sources is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return sources
+
 @router.delete("/sessions/{session_id}")
 def delete_session_endpoint(
     session_id: str,
@@ -111,7 +144,8 @@ def delete_session_endpoint(
 ):
     """Delete session from DB immediately. Queue Vector delete in background."""
     try:
-        # 1. Delete from DB
+        # 1. Delete from DB (after buffered messages, which would otherwise outlive it)
+        flush_writes()
         delete_session(session_id)
         
         # 2. Delete from Qdrant (Background)
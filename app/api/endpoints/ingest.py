@@ -1,8 +1,21 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Query, BackgroundTasks
-from app.models.schemas import IngestResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Query, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
+from typing import List
+from app.models.schemas import IngestResponse, TaskStatus, TaskStatusEnum
 from app.workers.tasks import process_document, ingest_file_logic, celery_app
+from app.workers.jobs import new_job_id, register_job, cancel_job
+from app.workers.pipeline import save_upload, discard_upload, upload_path
+from app.workers.local_executor import get_local_executor, QueueFull
+from app.db import get_job, list_jobs, save_job, delete_documents
+from fastapi.concurrency import run_in_threadpool
 from app.core.config import settings
+from app.core.admission import estimate_pages, get_admission_controller
+from app.core import storage
+from app.core.notifications import get_event_bus
 import base64
+import json
+import threading
+import time
 import redis
 
 import logging
@@ -16,59 +29,234 @@ try:
 except Exception:
     redis_client = None # Run without Redis
 
-def check_backpressure():
-    if not redis_client or "mock" in settings.REDIS_URL:
-        return # Skip check in local mode
-    
-    # Simple check: length of the celery queue
+def check_backpressure(job_id, session_id, content, filename):
+    """
+    Size-aware admission control (Celery and local mode alike).
+    Raises 429 (session limits) or 503 (global limits) with a computed Retry-After.
+    """
     try:
-        queue_len = redis_client.llen("celery")
-        if queue_len > 50:
-            raise HTTPException(status_code=503, detail="System busy. Ingestion queue full.")
+        pages = estimate_pages(content, filename)
+        get_admission_controller().admit(job_id, session_id, len(content), pages)
+    except HTTPException:
+        raise
     except Exception as e:
-        pass
+        # Admission store unavailable (e.g. Redis down): fail open, the queue itself still works
+        logging.warning(f"Admission check skipped: {e}")
+
+# Inline ingestions running at once (beyond that, small files take the queue)
+fast_lane_slots = threading.BoundedSemaphore(max(1, settings.FAST_LANE_CONCURRENCY))
+
+def fast_lane_eligible(filename: str, size_bytes: int) -> bool:
+    extensions = tuple(e.strip().lower() for e in settings.FAST_LANE_EXTENSIONS.split(",") if e.strip())
+    return 0 < size_bytes <= settings.FAST_LANE_MAX_BYTES and filename.lower().endswith(extensions)
+
+def run_fast_lane(content, filename, session_id, job_id):
+    """
+    Ingest a small file inline (API thread pool, warmed embed model).
+    Returns once the vectors are written and verified, with the latency in ms.
+    """
+    started = time.perf_counter()
+    file_path = save_upload(content, filename, "user", session_id)
+    ingest_file_logic(None, filename, "user", session_id, job_id=job_id, source_path=str(file_path))
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    save_job(job_id, latency_ms=latency_ms)
+    logging.info(f"Fast lane: {filename} ({len(content)} bytes) queryable in {latency_ms} ms")
+    return latency_ms
 
 # Wrapper to run Celery task logic synchronously in a thread (for local mode)
-def run_ingestion_sync(file_content_b64, filename, category, session_id):
+def run_ingestion_sync(file_content_b64, filename, category, session_id, job_id=None):
     logging.info(f"Background Task Started: {filename}")
+    elapsed = None
     try:
-        ingest_file_logic(file_content_b64, filename, category, session_id)
+        result = ingest_file_logic(file_content_b64, filename, category, session_id, job_id=job_id)
+        elapsed = result.get("elapsed_seconds")
         print(f"Local Ingestion Complete for {filename}")
     except Exception as e:
         print(f"Local Ingestion Failed for {filename}: {e}")
+    finally:
+        get_admission_controller().release(job_id, elapsed)
 
 @router.post("/upload", response_model=IngestResponse)
 async def upload_document(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    session_id: str = Query(..., description="Browser Session ID for isolation")
+    session_id: str = Query(..., description="Browser Session ID for isolation"),
+    priority: int = Query(5, ge=0, le=9, description="Ingestion priority (0 = highest)")
 ):
     """
     Upload a document (PDF, TXT, MD) for ingestion.
     """
     logging.info(f"API Request Received: {file.filename} (Session: {session_id})")
-    check_backpressure()
     
     if not file.filename.endswith(('.txt', '.md', '.pdf')):
         raise HTTPException(status_code=400, detail="Only .txt, .md, .pdf files supported")
+    try:
+        upload_path(file.filename, "user", session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     content = await file.read()
-    file_content_b64 = base64.b64encode(content).decode('utf-8')
+    # Session / global storage quota (413 / 507), before anything is stored or queued
+    await run_in_threadpool(storage.check_quota, session_id, len(content))
+    task_id = new_job_id()
+
+    # Admission limits apply to inline ingestions too: they hold a ticket while they run
+    await run_in_threadpool(check_backpressure, task_id, session_id, content, file.filename)
+
+    # Fast lane: small text files skip the queue and are queryable on return
+    if fast_lane_eligible(file.filename, len(content)) and fast_lane_slots.acquire(blocking=False):
+        try:
+            register_job(task_id, file.filename, "user", session_id, size_bytes=len(content), lane="fast")
+            latency_ms = await run_in_threadpool(run_fast_lane, content, file.filename, session_id, task_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ingestion failed: {e}")
+        finally:
+            fast_lane_slots.release()
+            # No throughput sample: per-file overhead dominates tiny files and would skew the queue's estimate
+            get_admission_controller().release(task_id)
+        return {
+            "task_id": task_id,
+            "filename": file.filename,
+            "message": "File ingested and ready to query",
+            "status": TaskStatusEnum.SUCCESS,
+            "queryable": True,
+            "latency_ms": latency_ms,
+        }
+
+    # Register the job up-front so progress can be polled right away
+    register_job(task_id, file.filename, "user", session_id, size_bytes=len(content))
     
     # Check if running in local mode (Redis mock)
     if not redis_client or "mock" in settings.REDIS_URL:
-        # Local mode: Use BackgroundTasks to run in a thread, returning immediately.
-        # This fixes the UI hanging issue.
-        logging.info("Dispatching to Local Background Thread")
-        background_tasks.add_task(run_ingestion_sync, file_content_b64, file.filename, "user", session_id)
-        task_id = "local-background"
+        executor = get_local_executor()
+        if executor:
+            # Local mode: parsing & embedding run in separate worker processes,
+            # keeping the API process (and query latency) unaffected.
+            logging.info("Dispatching to Local Ingestion Executor")
+            file_path = await run_in_threadpool(save_upload, content, file.filename, "user", session_id)
+            try:
+                executor.submit(task_id, file_path, file.filename, "user", session_id, priority=priority)
+            except QueueFull as e:
+                # Nothing of the rejected upload stays behind: file, ledger bytes, catalog entry
+                await run_in_threadpool(discard_upload, file_path, "user", session_id)
+                delete_documents(session_id, file.filename)
+                admission = get_admission_controller()
+                admission.release(task_id)
+                cancel_job(task_id)
+                retry_after = admission.retry_after()
+                raise HTTPException(status_code=503, detail=f"{e}. Retry in ~{retry_after}s.",
+                                    headers={"Retry-After": str(retry_after)})
+        else:
+            # Local mode: Use BackgroundTasks to run in a thread, returning immediately.
+            # This fixes the UI hanging issue.
+            logging.info("Dispatching to Local Background Thread")
+            file_content_b64 = base64.b64encode(content).decode('utf-8')
+            background_tasks.add_task(run_ingestion_sync, file_content_b64, file.filename, "user", session_id, task_id)
     else:
         logging.info("Dispatching to Celery")
-        task = process_document.delay(file_content_b64, file.filename, "user", session_id)
-        task_id = task.id
+        file_content_b64 = base64.b64encode(content).decode('utf-8')
+        # Celery task ID == job ID, so the worker reports progress against the same record
+        try:
+            process_document.apply_async(
+                args=(file_content_b64, file.filename, "user", session_id),
+                task_id=task_id,
+                priority=priority,
+            )
+        except Exception:
+            # Broker unreachable: drop the ticket, job record and catalog entry like a rejected upload
+            delete_documents(session_id, file.filename)
+            get_admission_controller().release(task_id)
+            cancel_job(task_id)
+            raise
     
     return {
         "task_id": task_id,
         "filename": file.filename,
         "message": "File queued for ingestion"
     }
+
+
+@router.get("/ingest/jobs/{job_id}", response_model=TaskStatus)
+def get_ingestion_job(job_id: str):
+    """Get stage, progress counters, throughput and errors of one ingestion job."""
+    job = get_job(job_id)
+    if job:
+        return TaskStatus.from_job(job)
+
+    # Not in the registry (e.g. queued by an older API instance): fall back to Celery state
+    if redis_client and "mock" not in settings.REDIS_URL:
+        result = celery_app.AsyncResult(job_id)
+        if result.state in TaskStatusEnum.__members__:
+            return TaskStatus(
+                task_id=job_id,
+                status=result.state,
+                error=str(result.result) if result.failed() else None,
+            )
+    raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+@router.delete("/ingest/jobs/{job_id}", response_model=TaskStatus)
+def cancel_ingestion_job(job_id: str):
+    """Cancel a queued or running ingestion job (Celery and local mode)."""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] in ("SUCCESS", "FAILURE", "REVOKED"):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already finished ({job['status']})")
+
+    executor = get_local_executor() if (not redis_client or "mock" in settings.REDIS_URL) else None
+    if executor:
+        executor.cancel(job_id)
+    else:
+        # Queued tasks are dropped by the worker; running ones stop at their next embed batch
+        cancel_job(job_id)
+        get_admission_controller().release(job_id)
+        try:
+            celery_app.control.revoke(job_id)
+        except Exception as e:
+            logging.warning(f"Celery revoke failed for {job_id}: {e}")
+    return TaskStatus.from_job(get_job(job_id))
+
+@router.get("/ingest/jobs", response_model=List[TaskStatus])
+def list_ingestion_jobs(
+    session_id: str = Query(..., description="Browser Session ID"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """List recent ingestion jobs of a session (newest first)."""
+    return [TaskStatus.from_job(job) for job in list_jobs(session_id, limit)]
+
+
+@router.get("/ingest/events")
+async def stream_ingestion_events(
+    request: Request,
+    session_id: str = Query(..., description="Browser Session ID")
+):
+    """
+    Server-Sent Events stream of a session's ingestion jobs (replaces polling).
+    Starts with the session's unfinished jobs, then pushes every state/progress
+    change as an `event: job` message carrying the job record.
+    """
+    bus = get_event_bus()
+
+    async def events():
+        active = [j for j in await run_in_threadpool(list_jobs, session_id, 50)
+                  if j["status"] not in ("SUCCESS", "FAILURE", "REVOKED")]
+        for job in reversed(active):
+            yield f"event: job\ndata: {json.dumps(job)}\n\n"
+        async for event in bus.subscribe(session_id):
+            if await request.is_disconnected():
+                break
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event['type']}\ndata: {json.dumps(event['job'])}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/ingest/admission")
+def get_admission_status(session_id: str = Query(None, description="Browser Session ID")):
+    """Queued jobs/bytes/pages (global and per session), measured throughput and drain estimate."""
+    return get_admission_controller().snapshot(session_id)
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List
 import time
-from app.rag.engine import get_rag_engine, generate_chat_title, generate_session_summary
-from app.db import log_query, init_db, get_session_messages, update_session_title, update_session_summary, get_recent_sessions
+from app.rag.engine import answer_query, StageTimer, generate_chat_title, generate_session_summary
+from app.core.write_behind import log_query, flush as flush_writes
+from app.db import init_db, get_shared_filenames, get_session_messages, update_session_title, update_session_summary, get_recent_sessions
 
 # Ensure DB is created on import (or handle in main lifespan)
 init_db()
@@ -28,6 +29,7 @@ class QueryResponse(BaseModel):
     latency_ms: float = 0.0
     input_tokens: int = 0
     output_tokens: int = 0
+    timings_ms: Dict[str, float] = {}
 
 def process_smart_metadata(session_id: str, user_query: str):
     """Background task to generate title and summary."""
@@ -47,6 +49,7 @@ def process_smart_metadata(session_id: str, user_query: str):
 
         # 2. Generate Summary
         # Fetch full history
+        flush_writes()
         msgs = get_session_messages(session_id)
         if msgs:
             # Format history for LLM
@@ -61,14 +64,11 @@ def process_smart_metadata(session_id: str, user_query: str):
 @router.post("/query", response_model=QueryResponse)
 async def query_knowledge_base(request: QueryRequest, background_tasks: BackgroundTasks):
     start_time = time.time()
+    timer = StageTimer()
     
     try:
-        # Get the query engine with retrieval AND session filtering
-        # Pass session_id to engine creation
-        query_engine = get_rag_engine(session_id=request.session_id)
-        
-        # Explicit search to get nodes (we need metadata)
-        response = query_engine.query(request.query_text)
+        # Retrieval with session filtering, then the answer; each stage timed
+        response, usage = answer_query(request.query_text, session_id=request.session_id, timer=timer)
         
         # DEBUG: Print response
         print("DEBUG RAW RESPONSE:", response)
@@ -82,14 +82,20 @@ async def query_knowledge_base(request: QueryRequest, background_tasks: Backgrou
         
         # Extract sources
         sources = []
-        if hasattr(response, 'source_nodes'):
-            for node in response.source_nodes:
-                sources.append(SourceNode(
-                    filename=node.metadata.get('filename', 'unknown'),
-                    page_label=node.metadata.get('page_label', '1'),
-                    score=node.score or 0.0,
-                    text=node.text
-                ))
+        with timer.stage("postprocess"):
+            # Shared points keep the first uploader's filename; show (and resolve) this session's own
+            shared_filenames = get_shared_filenames(request.session_id) if request.session_id else {}
+            if hasattr(response, 'source_nodes'):
+                for node in response.source_nodes:
+                    filename = node.metadata.get('filename', 'unknown')
+                    if node.metadata.get('category') != 'static' and node.metadata.get('session_id') != request.session_id:
+                        filename = shared_filenames.get(filename, filename)
+                    sources.append(SourceNode(
+                        filename=filename,
+                        page_label=node.metadata.get('page_label', '1'),
+                        score=node.score or 0.0,
+                        text=node.text
+                    ))
         
         # Calculate Latency
         latency_ms = (time.time() - start_time) * 1000
@@ -97,9 +103,13 @@ async def query_knowledge_base(request: QueryRequest, background_tasks: Backgrou
         # Get Confidence Score (Top 1)
         confidence_score = sources[0].score if sources else 0.0
         
-        # Calculate Token Estimates (Approximation: 1 token ~= 4 chars)
-        input_tokens = len(request.query_text) // 4
-        output_tokens = len(str(response)) // 4
+        # Token usage reported by Gemini; approximation (1 token ~= 4 chars) if it reported none
+        if usage:
+            input_tokens = usage["input_tokens"]
+            output_tokens = usage["output_tokens"]
+        else:
+            input_tokens = len(request.query_text) // 4
+            output_tokens = len(str(response)) // 4
         
         # Trigger Background Tasks (Title/Description)
         # Only if session_id is present
@@ -119,7 +129,7 @@ async def query_knowledge_base(request: QueryRequest, background_tasks: Backgrou
         # Serialize sources for DB
         sources_list = [s.dict() for s in sources]
 
-        # Log to DB
+        # Log to DB (write-behind: committed in the next batch)
         log_query(
             session_id=request.session_id,
             query_text=request.query_text,
@@ -128,7 +138,8 @@ async def query_knowledge_base(request: QueryRequest, background_tasks: Backgrou
             confidence_score=confidence_score,
             latency_ms=latency_ms,
             input_tokens=input_tokens,
-            output_tokens=output_tokens
+            output_tokens=output_tokens,
+            timings=timer.stages  # persist_ms is added when the row is written
         )
         
         print(f"DEBUG: Returning response with {len(sources_list)} sources.")
@@ -138,7 +149,8 @@ async def query_knowledge_base(request: QueryRequest, background_tasks: Backgrou
             confidence_score=confidence_score,
             latency_ms=latency_ms,
             input_tokens=input_tokens,
-            output_tokens=output_tokens
+            output_tokens=output_tokens,
+            timings_ms=timer.stages
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
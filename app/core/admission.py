@@ -0,0 +1,262 @@
+import json
+import math
+import threading
+import time
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+# Pages assumed per byte for non-PDF text (roughly one page of prose)
+TEXT_BYTES_PER_PAGE = 3000
+
+
+def estimate_pages(content: bytes, filename: str) -> int:
+    """Cheap page count for admission: real count for PDFs, size-based for text."""
+    if filename.lower().endswith(".pdf"):
+        try:
+            import fitz
+            with fitz.open(stream=content, filetype="pdf") as doc:
+                return max(1, doc.page_count)
+        except Exception:
+            pass
+    return max(1, math.ceil(len(content) / TEXT_BYTES_PER_PAGE))
+
+
+class LocalAdmissionStore:
+    """In-process ticket store (local mode: ingestion runs in this process)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tickets = {}
+        self._throughput = None
+
+    def add_if(self, job_id, ticket, check):
+        """Add a ticket unless check(tickets) raises; no other ticket changes in between."""
+        with self._lock:
+            check(list(self._tickets.items()))
+            self._tickets[job_id] = ticket
+
+    def pop(self, job_id):
+        with self._lock:
+            return self._tickets.pop(job_id, None)
+
+    def discard(self, job_ids):
+        with self._lock:
+            for job_id in job_ids:
+                self._tickets.pop(job_id, None)
+
+    def tickets(self):
+        with self._lock:
+            return list(self._tickets.items())
+
+    def get_throughput(self):
+        return self._throughput
+
+    def set_throughput(self, value):
+        self._throughput = value
+
+
+class RedisAdmissionStore:
+    """Ticket store shared by the API and Celery workers (Celery mode)."""
+
+    TICKETS_KEY = "admission:tickets"
+    THROUGHPUT_KEY = "admission:throughput"
+
+    def __init__(self, redis_client):
+        self.r = redis_client
+
+    @staticmethod
+    def _decode(items):
+        return [(k.decode() if isinstance(k, bytes) else k, json.loads(v)) for k, v in items.items()]
+
+    def add_if(self, job_id, ticket, check):
+        """
+        Add a ticket unless check(tickets) raises. Optimistic transaction: the
+        hash is WATCHed while checking, and the check is redone if another API
+        instance changed it before the add, so concurrent admissions cannot
+        both pass a limit.
+        """
+        from redis.exceptions import WatchError
+
+        with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.TICKETS_KEY)
+                    check(self._decode(pipe.hgetall(self.TICKETS_KEY)))
+                    pipe.multi()
+                    pipe.hset(self.TICKETS_KEY, job_id, json.dumps(ticket))
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def pop(self, job_id):
+        # MULTI: of two concurrent releases only one gets the ticket
+        pipe = self.r.pipeline(transaction=True)
+        pipe.hget(self.TICKETS_KEY, job_id)
+        pipe.hdel(self.TICKETS_KEY, job_id)
+        raw, _ = pipe.execute()
+        return json.loads(raw) if raw else None
+
+    def discard(self, job_ids):
+        if job_ids:
+            self.r.hdel(self.TICKETS_KEY, *job_ids)
+
+    def tickets(self):
+        return self._decode(self.r.hgetall(self.TICKETS_KEY))
+
+    def get_throughput(self):
+        raw = self.r.get(self.THROUGHPUT_KEY)
+        return float(raw) if raw else None
+
+    def set_throughput(self, value):
+        self.r.set(self.THROUGHPUT_KEY, value)
+
+
+class AdmissionController:
+    """
+    Size-aware admission control for uploads.
+
+    Every queued ingestion holds a ticket (bytes, pages, session). Uploads are
+    rejected when per-session or global limits on queued jobs/bytes/pages would
+    be exceeded, or when the estimated time to drain the queue (queued bytes /
+    measured ingestion throughput) is too long. Rejections carry a Retry-After
+    computed from the same estimate. Tickets older than ADMISSION_TICKET_TTL are
+    ignored, and deleted by the next snapshot(), so a crashed worker cannot
+    wedge the queue. The limit checks and the ticket insert are one atomic step
+    of the store (add_if).
+    """
+
+    def __init__(self, store, smoothing: float = 0.3):
+        self.store = store
+        self.smoothing = smoothing
+
+    # --- Measurements ---
+
+    def throughput(self) -> float:
+        """Measured ingestion throughput of one worker, in bytes/s (EWMA)."""
+        try:
+            value = self.store.get_throughput()
+        except Exception:
+            value = None
+        return value or settings.ADMISSION_DEFAULT_THROUGHPUT
+
+    def drain_rate(self) -> float:
+        return self.throughput() * max(1, settings.INGEST_CONCURRENCY)
+
+    def snapshot(self, session_id: str = None, tickets=None) -> dict:
+        """Queued jobs/bytes/pages (global and for session_id) of the given or the stored tickets."""
+        now = time.time()
+        totals = {"jobs": 0, "bytes": 0, "pages": 0}
+        session = {"jobs": 0, "bytes": 0, "pages": 0}
+        expired = []
+        for job_id, t in (self.store.tickets() if tickets is None else tickets):
+            if now - t.get("queued_at", now) > settings.ADMISSION_TICKET_TTL:
+                expired.append(job_id)
+                continue
+            for scope in ([totals, session] if session_id and t.get("session_id") == session_id else [totals]):
+                scope["jobs"] += 1
+                scope["bytes"] += t.get("bytes", 0)
+                scope["pages"] += t.get("pages", 0)
+        if expired and tickets is None:
+            try:
+                self.store.discard(expired)
+            except Exception as e:
+                print(f"Admission cleanup of {len(expired)} expired tickets failed: {e}")
+        rate = self.drain_rate()
+        return {
+            "global": totals,
+            "session": session,
+            "throughput_bytes_per_s": round(self.throughput(), 1),
+            "drain_seconds": round(totals["bytes"] / rate, 1) if rate else None,
+        }
+
+    # --- Admission ---
+
+    def _retry_after(self, excess_bytes: float) -> int:
+        seconds = excess_bytes / self.drain_rate() if excess_bytes > 0 else 1
+        return int(min(max(math.ceil(seconds), 1), 3600))
+
+    def retry_after(self) -> int:
+        """Seconds until one more job fits: the average queued job's drain time (for a full queue)."""
+        g = self.snapshot()["global"]
+        return self._retry_after(g["bytes"] / max(g["jobs"], 1))
+
+    def _reject(self, status_code: int, detail: str, excess_bytes: float):
+        retry_after = self._retry_after(excess_bytes)
+        raise HTTPException(
+            status_code=status_code,
+            detail=f"{detail} Retry in ~{retry_after}s.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    def admit(self, job_id: str, session_id: str, size_bytes: int, pages: int):
+        """Admit an upload or raise 429 (session limits) / 503 (global limits) with Retry-After."""
+        ticket = {
+            "session_id": session_id,
+            "bytes": size_bytes,
+            "pages": pages,
+            "queued_at": time.time(),
+        }
+        self.store.add_if(job_id, ticket, lambda tickets: self._check(session_id, size_bytes, pages, tickets))
+
+    def _check(self, session_id: str, size_bytes: int, pages: int, tickets):
+        snap = self.snapshot(session_id, tickets)
+        g, s = snap["global"], snap["session"]
+
+        # Per-session fairness -> 429
+        if s["jobs"] + 1 > settings.ADMISSION_SESSION_MAX_JOBS:
+            self._reject(429, "Too many documents queued for this session.", s["bytes"] / max(s["jobs"], 1))
+        if s["bytes"] + size_bytes > settings.ADMISSION_SESSION_MAX_BYTES:
+            self._reject(429, "Too much data queued for this session.",
+                         s["bytes"] + size_bytes - settings.ADMISSION_SESSION_MAX_BYTES)
+
+        # Global capacity -> 503
+        if g["jobs"] + 1 > settings.ADMISSION_MAX_QUEUED_JOBS:
+            self._reject(503, "System busy. Ingestion queue full.", g["bytes"] / max(g["jobs"], 1))
+        if g["bytes"] + size_bytes > settings.ADMISSION_MAX_QUEUED_BYTES:
+            self._reject(503, "System busy. Too much data queued for ingestion.",
+                         g["bytes"] + size_bytes - settings.ADMISSION_MAX_QUEUED_BYTES)
+        if g["pages"] + pages > settings.ADMISSION_MAX_QUEUED_PAGES:
+            bytes_per_page = g["bytes"] / max(g["pages"], 1)
+            self._reject(503, "System busy. Too many pages queued for ingestion.",
+                         (g["pages"] + pages - settings.ADMISSION_MAX_QUEUED_PAGES) * bytes_per_page)
+
+        drain_after = (g["bytes"] + size_bytes) / self.drain_rate()
+        if drain_after > settings.ADMISSION_MAX_DRAIN_SECONDS:
+            excess = (drain_after - settings.ADMISSION_MAX_DRAIN_SECONDS) * self.drain_rate()
+            self._reject(503, "System busy. Ingestion backlog too long.", excess)
+
+    def release(self, job_id: str, processing_seconds: float = None):
+        """
+        Release a job's ticket once it finished for good (success or final failure).
+        Successful jobs feed their measured bytes/s into the throughput estimate.
+        """
+        try:
+            ticket = self.store.pop(job_id)
+            if ticket and processing_seconds and processing_seconds > 0:
+                sample = ticket["bytes"] / processing_seconds
+                current = self.store.get_throughput()
+                value = sample if current is None else (1 - self.smoothing) * current + self.smoothing * sample
+                self.store.set_throughput(value)
+        except Exception as e:
+            print(f"Admission release failed for {job_id}: {e}")
+
+
+_controller = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Redis-backed in Celery mode, in-process in local mode (REDIS_URL=redis://mock)."""
+    global _controller
+    if _controller is None:
+        store = None
+        if "mock" not in settings.REDIS_URL:
+            try:
+                import redis
+                store = RedisAdmissionStore(redis.from_url(settings.REDIS_URL))
+            except Exception:
+                store = None
+        _controller = AdmissionController(store or LocalAdmissionStore())
+    return _controller
@@ -4,12 +4,82 @@ from typing import Optional
 class Settings(BaseSettings):
     GEMINI_API_KEY: Optional[str] = None
     EMBEDDING_MODEL: str = "models/embedding-001"
+    EMBED_MODEL: str = "bge-base"      # bge-base | bge-base-int8 | bge-small | bge-small-int8
+    VECTOR_PROJECTION: str = ""        # Projection artifact (data/projections), e.g. pca256-v1; empty = full vectors
     
     QDRANT_HOST: str = "qdrant"
     QDRANT_PORT: int = 6333
     QDRANT_COLLECTION_NAME: str = "knowledge_base"
     
     REDIS_URL: str = "redis://redis:6379/0"
+
+    # Ingestion: batched Qdrant upserts
+    UPSERT_BATCH_SIZE: int = 256
+    UPSERT_PARALLEL: int = 4
+    INGEST_WINDOW_PAGES: int = 25      # Pages per streaming window (checkpointed)
+    FANOUT_MIN_PAGES: int = 200        # Split documents with at least this many pages...
+    FANOUT_RANGE_PAGES: int = 100      # ...into page-range subtasks of this size
+    LAYOUT_CLEANING: bool = True       # Strip repeated headers/footers, chunk on block boundaries
+    MIN_PAGE_CHARS: int = 40           # Pages with less text than this after cleaning are skipped
+    DEDUP_MODE: str = "link"           # off | skip | link (skip + record alternates on the canonical point)
+    DEDUP_THRESHOLD: float = 0.9       # Estimated Jaccard similarity above which a chunk is a duplicate
+    WORD_INDEX: bool = True            # Persist per-page word boxes (data/word_index.db) for highlighting
+
+    # Fast lane: small uploads are ingested inline and are queryable when the upload returns
+    FAST_LANE_MAX_BYTES: int = 64 * 1024           # 0 disables the fast lane
+    FAST_LANE_EXTENSIONS: str = ".txt,.md"         # Comma-separated
+    FAST_LANE_CONCURRENCY: int = 4                 # Inline ingestions at once; beyond that -> queue
+
+    # Document viewer: rendered pages (process pool + disk LRU cache in data/page_cache)
+    PAGE_RENDER_WORKERS: int = 2
+    PAGE_CACHE_MAX_MB: int = 512
+    PAGE_JPEG_QUALITY: int = 85
+    PAGE_WEBP_QUALITY: int = 80
+    PAGE_ZOOM: float = 2.0             # Full-resolution render (2x supersampling keeps text sharp)
+    PAGE_THUMBNAIL_ZOOM: float = 0.5   # Low-resolution first paint
+    PAGE_IMAGE_FORMAT: str = "webp"    # Format of image URLs given to the viewer (jpeg if WebP is unavailable)
+
+    # Storage quotas (ledger in analytics.db, reconciled with data/ by the session cleanup)
+    STORAGE_QUOTA_GB: float = 5.0          # All of data/; uploads beyond it are rejected (507)
+    STORAGE_SESSION_QUOTA_MB: int = 500    # Uploads of one session (413); 0 = no limit
+
+    # Write-behind persistence of query logs and chat messages (app.core.write_behind)
+    WRITE_BEHIND: bool = True               # False = insert and commit on the request path
+    WRITE_BEHIND_INTERVAL_MS: int = 20      # Commit a batch this long after its first row...
+    WRITE_BEHIND_BATCH_ROWS: int = 500      # ...or as soon as this many rows are waiting
+    WRITE_BEHIND_QUEUE_SIZE: int = 10_000   # Rows buffered in memory (lost on a hard crash)
+    WRITE_BEHIND_OVERFLOW: str = "block"    # Buffer full: "block" (wait, then write inline) or "drop"
+    WRITE_BEHIND_BLOCK_MS: int = 100
+
+    # Analytics dashboard (answered from the query_rollups table)
+    ANALYTICS_CACHE_TTL_SECONDS: int = 10   # Response cache of /analytics/stats; 0 = off
+
+    # Ingestion admission control (backpressure)
+    INGEST_CONCURRENCY: int = 2                        # Workers draining the queue
+    ADMISSION_DEFAULT_THROUGHPUT: float = 200_000      # bytes/s per worker until measured
+    ADMISSION_MAX_QUEUED_JOBS: int = 50
+    ADMISSION_MAX_QUEUED_BYTES: int = 500 * 1024 * 1024
+    ADMISSION_MAX_QUEUED_PAGES: int = 20_000
+    ADMISSION_MAX_DRAIN_SECONDS: int = 900
+    ADMISSION_SESSION_MAX_JOBS: int = 10
+    ADMISSION_SESSION_MAX_BYTES: int = 100 * 1024 * 1024
+    ADMISSION_TICKET_TTL: int = 6 * 3600               # Ignore tickets of crashed jobs after this
+
+    # Celery worker autoscaler (app.workers.autoscaler): prefork processes per queue backlog
+    AUTOSCALE_QUEUE: str = "celery"
+    AUTOSCALE_MIN_WORKERS: int = 1
+    AUTOSCALE_MAX_WORKERS: int = 4
+    AUTOSCALE_TARGET_DRAIN_SECONDS: int = 300      # Size the pool to drain queued bytes within this
+    AUTOSCALE_WARMUP_SECONDS: int = 60             # Time a new process needs to load the embedding model
+    AUTOSCALE_SCALE_DOWN_DELAY: int = 300          # Backlog must stay low this long before shrinking
+    AUTOSCALE_DEFAULT_JOB_BYTES: int = 1024 * 1024  # Size of a queued task without a ticket until measured
+    AUTOSCALE_INTERVAL_SECONDS: int = 15
+
+    # Local mode ingestion executor (separate worker processes)
+    LOCAL_INGEST_WORKERS: int = 1       # 0 = run in an API thread (legacy behaviour)
+    LOCAL_INGEST_QUEUE_SIZE: int = 100
+    LOCAL_INGEST_NICE: int = 10         # Lower CPU priority than the API process
+    LOCAL_INGEST_THREADS: int = 2       # ONNX/OpenMP threads per worker process
     
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "RAG Knowledge Base"
@@ -0,0 +1,218 @@
+"""
+Embedding model selection (EMBED_MODEL), shared by ingestion and query.
+
+Options are FastEmbed ONNX models and int8 variants of the same models,
+produced once by onnxruntime dynamic quantization and cached under
+data/models. The model a collection was built with is recorded in a sentinel
+point (category/session "__meta__") so ingest and query refuse to run with a
+different model.
+"""
+import os
+import uuid
+import shutil
+import pathlib
+import threading
+from dataclasses import dataclass
+from typing import List
+
+from llama_index.core.embeddings import BaseEmbedding
+from pydantic import PrivateAttr
+
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class EmbeddingSpec:
+    key: str
+    model_name: str   # FastEmbed / Hugging Face model
+    dim: int
+    quantized: bool = False
+
+
+EMBEDDING_MODELS = {
+    "bge-base": EmbeddingSpec("bge-base", "BAAI/bge-base-en-v1.5", 768),
+    "bge-base-int8": EmbeddingSpec("bge-base-int8", "BAAI/bge-base-en-v1.5", 768, quantized=True),
+    "bge-small": EmbeddingSpec("bge-small", "BAAI/bge-small-en-v1.5", 384),
+    "bge-small-int8": EmbeddingSpec("bge-small-int8", "BAAI/bge-small-en-v1.5", 384, quantized=True),
+}
+
+# Collections created before the model was recorded were built with this one
+LEGACY_MODEL = "bge-base"
+
+META_POINT_ID = str(uuid.uuid5(uuid.NAMESPACE_URL, "rag-knowledge-base/__meta__"))
+META_MARKER = "__meta__"
+
+
+class EmbeddingModelMismatch(RuntimeError):
+    """The collection was built with a different embedding model than EMBED_MODEL."""
+
+
+def get_spec(key: str = None) -> EmbeddingSpec:
+    key = key or settings.EMBED_MODEL
+    if key not in EMBEDDING_MODELS:
+        raise ValueError(f"Unknown EMBED_MODEL '{key}'. Options: {', '.join(EMBEDDING_MODELS)}")
+    return EMBEDDING_MODELS[key]
+
+
+def models_dir() -> pathlib.Path:
+    return pathlib.Path(os.getcwd()) / "data" / "models"
+
+
+# --- int8 ONNX models ---
+
+def quantize_model(spec: EmbeddingSpec) -> pathlib.Path:
+    """
+    Dynamically quantize (int8 weights) the full-precision ONNX export of a model
+    (onnx/model.onnx of its Hugging Face repo). Done once; the result and the
+    tokenizer are cached under data/models/<key>.
+    """
+    target = models_dir() / spec.key
+    model_file = target / "model_int8.onnx"
+    if model_file.exists():
+        return target
+
+    from huggingface_hub import hf_hub_download
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    cache_dir = str(models_dir() / "hf")
+    source = hf_hub_download(spec.model_name, "onnx/model.onnx", cache_dir=cache_dir)
+    tokenizer = hf_hub_download(spec.model_name, "tokenizer.json", cache_dir=cache_dir)
+
+    target.mkdir(parents=True, exist_ok=True)
+    shutil.copy(tokenizer, target / "tokenizer.json")
+    tmp = target / "model_int8.tmp.onnx"
+    quantize_dynamic(source, str(tmp), weight_type=QuantType.QInt8)
+    os.replace(tmp, model_file)
+    print(f"Quantized {spec.model_name} -> {model_file}")
+    return target
+
+
+class OnnxInt8Embedding(BaseEmbedding):
+    """BGE-style (CLS pooling, L2-normalized) embeddings from a local int8 ONNX model."""
+
+    model_dir: str
+    max_length: int = 512
+    threads: int = 0
+
+    _session = PrivateAttr()
+    _tokenizer = PrivateAttr()
+    _input_names = PrivateAttr()
+
+    def __init__(self, model_dir: str, **kwargs):
+        super().__init__(model_dir=model_dir, **kwargs)
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        path = pathlib.Path(model_dir)
+        self._session = ort.InferenceSession(str(path / "model_int8.onnx"), options,
+                                             providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=self.max_length)
+        self._tokenizer.enable_padding()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxInt8Embedding"
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        encoded = self._tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encoded], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encoded], dtype=np.int64),
+        }
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.array([e.type_ids for e in encoded], dtype=np.int64)
+        hidden = self._session.run(None, inputs)[0]
+        cls = hidden[:, 0]
+        cls = cls / np.linalg.norm(cls, axis=1, keepdims=True).clip(min=1e-12)
+        return cls.tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([query])[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+
+# --- Model loading ---
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def build_embed_model(key: str = None):
+    spec = get_spec(key)
+    if spec.quantized:
+        return OnnxInt8Embedding(model_dir=str(quantize_model(spec)), model_name=spec.key)
+    from llama_index.embeddings.fastembed import FastEmbedEmbedding
+    return FastEmbedEmbedding(model_name=spec.model_name)
+
+
+def get_embed_model(key: str = None):
+    """The configured embedding model, loaded once per process."""
+    spec = get_spec(key)
+    with _models_lock:
+        if spec.key not in _models:
+            _models[spec.key] = build_embed_model(spec.key)
+        return _models[spec.key]
+
+
+# --- Collection <-> model binding ---
+
+def read_collection_model(client, collection_name: str):
+    """Model key recorded in the collection; LEGACY_MODEL if none; None if the collection does not exist."""
+    try:
+        client.get_collection(collection_name)
+    except Exception:
+        return None
+    records = client.retrieve(collection_name=collection_name, ids=[META_POINT_ID], with_payload=True)
+    if records:
+        return records[0].payload.get("embedding_model", LEGACY_MODEL)
+    return LEGACY_MODEL
+
+
+def record_collection_model(client, collection_name: str, spec: EmbeddingSpec):
+    from qdrant_client.http import models
+
+    vector = [0.0] * spec.dim
+    vector[0] = 1.0  # Cosine distance needs a non-zero vector
+    client.upsert(
+        collection_name=collection_name,
+        points=[models.PointStruct(
+            id=META_POINT_ID,
+            vector=vector,
+            payload={
+                "category": META_MARKER,
+                "session_id": META_MARKER,
+                "filename": META_MARKER,
+                "embedding_model": spec.key,
+                "model_name": spec.model_name,
+                "dim": spec.dim,
+                "quantized": spec.quantized,
+            },
+        )],
+        wait=True,
+    )
+
+
+def check_collection_model(client, collection_name: str, spec: EmbeddingSpec = None):
+    """Raise EmbeddingModelMismatch if the collection was built with another model."""
+    spec = spec or get_spec()
+    recorded = read_collection_model(client, collection_name)
+    if recorded is not None and recorded != spec.key:
+        raise EmbeddingModelMismatch(
+            f"Collection '{collection_name}' was built with embedding model '{recorded}', "
+            f"but EMBED_MODEL is '{spec.key}'. Re-ingest into a new collection or change EMBED_MODEL."
+        )
@@ -2,6 +2,7 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.core.config import settings
 import os
+import threading
 # New OpenInference Instrumentation
 from openinference.instrumentation.llama_index import LlamaIndexInstrumentor
 from phoenix.otel import register
@@ -18,7 +19,18 @@ async def lifespan(app: FastAPI):
             print("✅ Phoenix Tracing Initialized")
         except Exception as e:
             print(f"Failed to initialize Phoenix: {e}")
-            
+
+    # Fill the document catalog and storage ledger from disk (first start only)
+    from app.workers import catalog
+    from app.core import storage
+    threading.Thread(target=catalog.reconcile, kwargs={"only_if_empty": True}, daemon=True).start()
+    threading.Thread(target=storage.reconcile, kwargs={"only_if_empty": True}, daemon=True).start()
+
     yield
     # Shutdown
-    pass
+    from app.core.write_behind import shutdown_write_queue
+    shutdown_write_queue()
+    from app.workers.local_executor import shutdown_local_executor
+    shutdown_local_executor()
+    from app.core.page_render import shutdown_render_pool
+    shutdown_render_pool()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+
+from app.core.config import settings
+
+# Seconds between keep-alive comments on idle event streams
+HEARTBEAT_SECONDS = 15
+# Events buffered per local subscriber; a slow client drops the oldest
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def channel(session_id: str) -> str:
+    return f"ingest:events:{session_id}"
+
+
+class LocalEventBus:
+    """In-process broadcaster (local mode: jobs are tracked in the API process)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # session_id -> {(queue, loop)}
+
+    @property
+    def active(self) -> bool:
+        return bool(self._subscribers)
+
+    def publish(self, session_id: str, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(session_id, ()))
+        for queue, loop in subscribers:
+            # publish() runs on worker threads; queues belong to the event loop
+            loop.call_soon_threadsafe(self._offer, queue, event)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: dict):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    async def subscribe(self, session_id: str):
+        """Yield events of a session (None on heartbeat timeouts) until cancelled."""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        entry = (queue, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(session_id, set()).add(entry)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(session_id, set())
+                subscribers.discard(entry)
+                if not subscribers:
+                    self._subscribers.pop(session_id, None)
+
+
+class RedisEventBus:
+    """Redis pub/sub (Celery mode: workers publish, every API instance can subscribe)."""
+
+    active = True  # Subscribers may live in another process
+
+    def __init__(self, url: str):
+        import redis
+        self.url = url
+        self.r = redis.from_url(url)
+
+    def publish(self, session_id: str, event: dict):
+        self.r.publish(channel(session_id), json.dumps(event))
+
+    async def subscribe(self, session_id: str):
+        import redis.asyncio as aioredis
+        r = aioredis.from_url(self.url)
+        pubsub = r.pubsub()
+        await pubsub.subscribe(channel(session_id))
+        try:
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=HEARTBEAT_SECONDS)
+                yield json.loads(message["data"]) if message else None
+        finally:
+            await pubsub.unsubscribe(channel(session_id))
+            await pubsub.close()
+            await r.close()
+
+
+_bus = None
+
+
+def get_event_bus():
+    """Redis-backed in Celery mode, in-process in local mode (REDIS_URL=redis://mock)."""
+    global _bus
+    if _bus is None:
+        bus = None
+        if "mock" not in settings.REDIS_URL:
+            try:
+                bus = RedisEventBus(settings.REDIS_URL)
+            except Exception:
+                bus = None
+        _bus = bus or LocalEventBus()
+    return _bus
+
+
+def publish_job_event(job_id: str):
+    """Push a job's current state to its session's subscribers (never raises)."""
+    try:
+        bus = get_event_bus()
+        if not bus.active:
+            return
+        from app.db import get_job
+        job = get_job(job_id)
+        if job and job.get("session_id"):
+            bus.publish(job["session_id"], {"type": "job", "job": job})
+    except Exception as e:
+        print(f"Event publish failed for {job_id}: {e}")
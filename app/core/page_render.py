@@ -0,0 +1,263 @@
+"""
+Rendered PDF pages for the document viewer.
+
+Pages are rendered (with search-term highlights) in a small process pool, so a
+render never runs on the event loop, and kept in a disk-backed LRU cache
+(data/page_cache) keyed by file hash, page, zoom, format and highlight set.
+Repeat views are served from the cache; the cache key doubles as the ETag.
+"""
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import pathlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from app.core.config import settings
+from app.db import adjust_storage
+from app.workers.checkpoints import cached_file_sha256
+
+FORMATS = {"jpeg": "image/jpeg", "webp": "image/webp"}
+HIGHLIGHT_MIN_CHARS = 20     # Longer highlight texts are matched as runs of words
+
+
+class PageOutOfRange(ValueError):
+    pass
+
+
+# --- Rendering (runs in worker processes) ---
+
+def highlight_page(pg, query: str, words=None):
+    """
+    Highlight `query` on the page. Long texts (source chunks) are matched as
+    runs of 4 words through the page's word index: `words` as stored at
+    ingestion, or built from the page for files indexed before that. Short
+    texts, and long ones without a match, go through PyMuPDF's exact search.
+    """
+    import fitz
+    from app.workers.word_index import PageWords
+
+    rects = []
+    if len(query) > HIGHLIGHT_MIN_CHARS:
+        if words is None:
+            words = PageWords.from_words(pg.get_text("words", sort=True))
+        rects = [fitz.Rect(r) for r in words.match(query)]
+    if not rects:
+        rects = pg.search_for(query)
+    if rects:
+        pg.add_highlight_annot(rects)
+
+
+def render_page(file_path: str, page_idx: int, zoom: float, fmt: str, quality: int,
+                query: str = None, file_hash: str = None) -> bytes:
+    """Render one page (0-based) to JPEG or WebP bytes."""
+    import fitz
+
+    with fitz.open(file_path) as doc:
+        if not 0 <= page_idx < doc.page_count:
+            raise PageOutOfRange(f"Page {page_idx + 1} out of range")
+        pg = doc[page_idx]
+        if query:
+            words = None
+            if file_hash and len(query) > HIGHLIGHT_MIN_CHARS:
+                from app.workers.word_index import load_page
+                words = load_page(file_hash, page_idx)
+            highlight_page(pg, query, words)
+        pix = pg.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        if fmt == "jpeg":
+            return pix.tobytes("jpg", jpg_quality=quality)
+        # PyMuPDF has no WebP encoder
+        from PIL import Image
+        image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=quality, method=4)
+        return buffer.getvalue()
+
+
+def read_pages(file_path: str, indices) -> tuple:
+    """Page count and the text of the given (0-based) pages that exist."""
+    import fitz
+
+    with fitz.open(file_path) as doc:
+        total = doc.page_count
+        return total, {i: doc[i].get_text() for i in indices if 0 <= i < total}
+
+
+# --- Disk LRU cache ---
+
+class PageCache:
+    """
+    Rendered pages as files under `root`, evicted least-recently-used once the
+    total size exceeds `max_bytes`. Recency is the file mtime, so it survives restarts.
+    `on_change(delta_bytes, delta_files)` is called after writes and evictions.
+    """
+
+    def __init__(self, root: pathlib.Path, max_bytes: int, on_change=None):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._entries = None  # key -> size, oldest first
+        self._total = 0
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        files = sorted(
+            (p for p in self.root.iterdir() if p.is_file() and not p.name.endswith(".tmp")),
+            key=lambda p: p.stat().st_mtime,
+        )
+        self._entries = OrderedDict((p.name, p.stat().st_size) for p in files)
+        self._total = sum(self._entries.values())
+
+    def get(self, key: str):
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self.root / key
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                self._total -= self._entries.pop(key, 0)
+            return None
+
+    def put(self, key: str, data: bytes):
+        path = self.root / key
+        tmp = self.root / f"{key}.{threading.get_ident()}.tmp"
+        with self._lock:
+            self._load()
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            replaced = self._entries.pop(key, None)
+            delta_bytes, delta_files = len(data) - (replaced or 0), 0 if replaced is not None else 1
+            self._total += delta_bytes
+            self._entries[key] = len(data)
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old, size = self._entries.popitem(last=False)
+                self._total -= size
+                delta_bytes -= size
+                delta_files -= 1
+                try:
+                    (self.root / old).unlink()
+                except FileNotFoundError:
+                    pass
+        if self.on_change:
+            self.on_change(delta_bytes, delta_files)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            return {"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+def cache_key(file_hash: str, page: int, zoom: float, fmt: str, query: str = None) -> str:
+    highlight = " ".join((query or "").lower().split())
+    raw = f"{file_hash}|{page}|{zoom:g}|{fmt}|{highlight}"
+    return f"{hashlib.sha1(raw.encode('utf-8')).hexdigest()}.{fmt}"
+
+
+# --- API side ---
+
+_cache = None
+_pool = None
+_pool_lock = threading.Lock()
+_inflight = {}  # cache key -> asyncio.Future of a render in progress
+
+
+def get_page_cache() -> PageCache:
+    global _cache
+    if _cache is None:
+        root = pathlib.Path(os.getcwd()) / "data" / "page_cache"
+        _cache = PageCache(root, settings.PAGE_CACHE_MAX_MB * 1024 * 1024,
+                           on_change=lambda size, files: adjust_storage("page_cache", size, files))
+    return _cache
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, settings.PAGE_RENDER_WORKERS),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+_webp = None
+
+
+def webp_supported() -> bool:
+    global _webp
+    if _webp is None:
+        try:
+            from PIL import features
+            _webp = bool(features.check("webp"))
+        except ImportError:
+            _webp = False
+    return _webp
+
+
+def url_format(requested: str = None) -> str:
+    """Image format for viewer URLs: the requested/configured one, jpeg if WebP can't be encoded."""
+    fmt = requested or settings.PAGE_IMAGE_FORMAT
+    if fmt not in FORMATS or (fmt == "webp" and not webp_supported()):
+        return "jpeg"
+    return fmt
+
+
+def quality_for(fmt: str) -> int:
+    return settings.PAGE_JPEG_QUALITY if fmt == "jpeg" else settings.PAGE_WEBP_QUALITY
+
+
+async def page_etag(file_path, page: int, zoom: float, fmt: str, query: str = None) -> tuple:
+    """(file hash, cache key) of a page rendering; the key is the ETag."""
+    digest = await asyncio.get_running_loop().run_in_executor(None, cached_file_sha256, file_path)
+    return digest, cache_key(digest, page, zoom, fmt, query)
+
+
+async def get_page_image(file_path, page: int, zoom: float, fmt: str, query: str = None) -> bytes:
+    """Rendered page (1-based) from the cache, or rendered in the pool and cached."""
+    loop = asyncio.get_running_loop()
+    digest, key = await page_etag(file_path, page, zoom, fmt, query)
+    cache = get_page_cache()
+    data = await loop.run_in_executor(None, cache.get, key)
+    if data is not None:
+        return data
+
+    # Concurrent requests for the same rendering share one render
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    future = loop.run_in_executor(
+        get_render_pool(), render_page, str(file_path), page - 1, zoom, fmt, quality_for(fmt), query, digest
+    )
+    _inflight[key] = future
+    try:
+        data = await asyncio.shield(future)
+    finally:
+        _inflight.pop(key, None)
+    await loop.run_in_executor(None, cache.put, key, data)
+    return data
+
+
+async def get_page_texts(file_path, indices) -> tuple:
+    return await asyncio.get_running_loop().run_in_executor(get_render_pool(), read_pages, str(file_path), list(indices))
@@ -0,0 +1,235 @@
+"""
+Optional dimensionality reduction of stored vectors (VECTOR_PROJECTION).
+
+A projection (PCA or Gaussian random projection) is fitted on a sample of the
+collection's vectors and saved as a versioned artifact,
+data/projections/<name>.npz (e.g. pca256-v1). When VECTOR_PROJECTION names an
+artifact, ingestion also writes projected vectors, as the named vector <name>,
+to a companion collection "<collection>__<name>" that mirrors the points and
+payloads of the full-size collection, and queries search that collection with
+a projected query vector. The full-size vectors stay where they are, so a
+projection can be refitted or switched off at any time.
+
+Fit, compare and backfill with `python -m app.scripts.vector_projection`.
+"""
+import os
+import re
+import json
+import pathlib
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List
+
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+from pydantic import PrivateAttr
+
+from app.core.config import settings
+
+METHODS = ("pca", "random")
+
+
+@dataclass
+class Projection:
+    name: str
+    method: str
+    embed_model: str   # EMBED_MODEL the input vectors came from
+    input_dim: int
+    dim: int
+    mean: np.ndarray         # (input_dim,), zeros for random projections
+    components: np.ndarray   # (dim, input_dim)
+    sample_size: int = 0
+    explained_variance: float = None
+    fitted_at: str = ""
+
+    def apply(self, vectors) -> np.ndarray:
+        """Project (n, input_dim) vectors to (n, dim), L2-normalized for cosine search."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        reduced = (matrix - self.mean) @ self.components.T
+        return reduced / np.linalg.norm(reduced, axis=1, keepdims=True).clip(min=1e-12)
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "method": self.method,
+            "embed_model": self.embed_model,
+            "input_dim": self.input_dim,
+            "dim": self.dim,
+            "sample_size": self.sample_size,
+            "explained_variance": self.explained_variance,
+            "fitted_at": self.fitted_at,
+        }
+
+
+# --- Fitting ---
+
+def fit_pca(sample, dim: int, embed_model: str, name: str = "") -> Projection:
+    matrix = np.asarray(sample, dtype=np.float32)
+    if dim > min(matrix.shape):
+        raise ValueError(f"PCA to {dim} dims needs at least {dim} sample vectors (got {len(matrix)})")
+    mean = matrix.mean(axis=0)
+    _, singular, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+    variance = singular ** 2
+    return Projection(
+        name=name, method="pca", embed_model=embed_model,
+        input_dim=matrix.shape[1], dim=dim,
+        mean=mean, components=vt[:dim].astype(np.float32),
+        sample_size=len(matrix),
+        explained_variance=round(float(variance[:dim].sum() / variance.sum()), 4),
+        fitted_at=datetime.utcnow().isoformat(),
+    )
+
+
+def fit_random(input_dim: int, dim: int, embed_model: str, name: str = "", seed: int = 0) -> Projection:
+    rng = np.random.default_rng(seed)
+    components = rng.standard_normal((dim, input_dim)).astype(np.float32) / np.sqrt(dim)
+    return Projection(
+        name=name, method="random", embed_model=embed_model,
+        input_dim=input_dim, dim=dim,
+        mean=np.zeros(input_dim, dtype=np.float32), components=components,
+        fitted_at=datetime.utcnow().isoformat(),
+    )
+
+
+# --- Artifacts ---
+
+def projections_dir() -> pathlib.Path:
+    return pathlib.Path(os.getcwd()) / "data" / "projections"
+
+
+def next_name(method: str, dim: int) -> str:
+    """Next free version for a method/dimension, e.g. pca256-v3."""
+    prefix = f"{method}{dim}-v"
+    versions = [
+        int(m.group(1))
+        for path in projections_dir().glob(f"{prefix}*.npz")
+        if (m := re.fullmatch(re.escape(prefix) + r"(\d+)", path.stem))
+    ]
+    return f"{prefix}{max(versions, default=0) + 1}"
+
+
+def save_projection(projection: Projection) -> pathlib.Path:
+    path = projections_dir() / f"{projection.name}.npz"
+    if path.exists():
+        raise FileExistsError(f"Projection {projection.name} already exists; artifacts are immutable")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, mean=projection.mean, components=projection.components,
+             info=np.array(json.dumps(projection.info())))
+    os.replace(tmp, path)
+    return path
+
+
+def load_projection(name: str) -> Projection:
+    path = projections_dir() / f"{name}.npz"
+    if not path.exists():
+        raise FileNotFoundError(f"Projection artifact {path} not found")
+    with np.load(path) as data:
+        info = json.loads(str(data["info"]))
+        return Projection(mean=data["mean"], components=data["components"], **info)
+
+
+def list_projections() -> List[dict]:
+    return [load_projection(path.stem).info() for path in sorted(projections_dir().glob("*.npz"))]
+
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def get_projection():
+    """The projection named by VECTOR_PROJECTION (loaded once), or None when disabled."""
+    global _active
+    name = settings.VECTOR_PROJECTION
+    if not name:
+        return None
+    with _active_lock:
+        if _active is None or _active.name != name:
+            projection = load_projection(name)
+            if projection.embed_model != settings.EMBED_MODEL:
+                raise ValueError(
+                    f"Projection {name} was fitted on '{projection.embed_model}' vectors, "
+                    f"but EMBED_MODEL is '{settings.EMBED_MODEL}'"
+                )
+            _active = projection
+        return _active
+
+
+# --- Companion collection ---
+
+def reduced_collection(collection_name: str, projection: Projection) -> str:
+    return f"{collection_name}__{projection.name}"
+
+
+def vector_collections(collection_name: str) -> List[str]:
+    """
+    Collections holding copies of the points of `collection_name`. Deletes and
+    payload updates go to all of them so the reduced collection stays a mirror.
+    """
+    projection = get_projection()
+    if projection is None:
+        return [collection_name]
+    return [collection_name, reduced_collection(collection_name, projection)]
+
+
+def ensure_reduced_collection(client, collection_name: str, projection: Projection) -> bool:
+    """Create the companion collection if needed. Returns True if it was just created."""
+    from qdrant_client.http.models import Distance, VectorParams
+
+    name = reduced_collection(collection_name, projection)
+    try:
+        client.get_collection(name)
+        return False
+    except Exception:
+        client.create_collection(
+            collection_name=name,
+            vectors_config={projection.name: VectorParams(size=projection.dim, distance=Distance.COSINE)},
+        )
+        return True
+
+
+def reduced_points(points, projection: Projection):
+    """Copies of full-size points carrying the projected vector under the projection's name."""
+    from qdrant_client.http import models
+
+    if not points:
+        return []
+    reduced = projection.apply([p.vector for p in points])
+    return [
+        models.PointStruct(id=p.id, vector={projection.name: vector.tolist()}, payload=p.payload)
+        for p, vector in zip(points, reduced)
+    ]
+
+
+class ProjectedEmbedding(BaseEmbedding):
+    """Wraps the configured embedding model and projects its output (query side)."""
+
+    _base = PrivateAttr()
+    _projection = PrivateAttr()
+
+    def __init__(self, base: BaseEmbedding, projection: Projection, **kwargs):
+        super().__init__(model_name=f"{base.model_name}+{projection.name}", **kwargs)
+        self._base = base
+        self._projection = projection
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ProjectedEmbedding"
+
+    def _project(self, vectors) -> List[List[float]]:
+        return self._projection.apply(vectors).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._project(self._base.get_query_embedding(query))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._project(self._base.get_text_embedding(text))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._project(self._base.get_text_embedding_batch(texts))
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
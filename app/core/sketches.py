@@ -0,0 +1,192 @@
+"""
+Mergeable sketches for the analytics rollups (query_rollups in app.db).
+
+- HyperLogLog: distinct sessions per bucket (2^12 registers, ~1.6% standard
+  error); buckets merge by taking the register-wise maximum.
+- LatencyHistogram: log-spaced bins with 1% relative accuracy (the DDSketch
+  layout); ScoreHistogram: 0.01-wide bins for confidence scores in [0, 1].
+  Both merge by adding bin counts, so percentiles over any range of buckets
+  come from the merged histogram, never from the raw rows.
+
+A QueryRollup is the aggregate of one bucket: counts, sums, the three
+sketches and a latency histogram (with its sum) per query stage. Rollups of
+any buckets merge into the rollup of their union.
+"""
+import json
+import math
+import zlib
+import hashlib
+
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+_INVERSE_POWERS = [2.0 ** -r for r in range(65)]
+
+
+class HyperLogLog:
+    def __init__(self, registers: bytes = None):
+        self.registers = bytearray(registers or HLL_REGISTERS)
+
+    def add(self, value: str):
+        h = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+        index = h >> (64 - HLL_PRECISION)
+        rest = h & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        estimate = _HLL_ALPHA * HLL_REGISTERS ** 2 / sum(_INVERSE_POWERS[r] for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * HLL_REGISTERS and zeros:
+            estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)  # Linear counting for small sets
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registers), 1)  # Sparse hours compress to a few dozen bytes
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "HyperLogLog":
+        return cls(zlib.decompress(blob) if blob else None)
+
+
+class Histogram:
+    """Counts per bin; subclasses define the bins. Serialized as JSON {bin: count}."""
+
+    def __init__(self, counts: dict = None):
+        self.counts = counts or {}
+
+    @staticmethod
+    def bin_of(value: float) -> int:
+        raise NotImplementedError
+
+    @staticmethod
+    def value_of(bin_: int) -> float:
+        raise NotImplementedError
+
+    def add(self, value: float, count: int = 1):
+        b = self.bin_of(value)
+        self.counts[b] = self.counts.get(b, 0) + count
+
+    def merge(self, other: "Histogram"):
+        for b, count in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + count
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def quantile(self, q: float) -> float:
+        """Value at rank int(n * q) of the sorted values (0.0 when empty)."""
+        n = self.total()
+        if not n:
+            return 0.0
+        rank = min(int(n * q), n - 1)
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen > rank:
+                return self.value_of(b)
+        return 0.0
+
+    def to_json(self) -> str:
+        return json.dumps(self.counts)
+
+    @classmethod
+    def from_json(cls, text: str):
+        return cls({int(b): count for b, count in json.loads(text).items()} if text else None)
+
+
+LATENCY_ACCURACY = 0.01
+_GAMMA = (1 + LATENCY_ACCURACY) / (1 - LATENCY_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+MIN_LATENCY_MS = 0.01
+
+
+class LatencyHistogram(Histogram):
+    @staticmethod
+    def bin_of(value: float) -> int:
+        return math.ceil(math.log(max(value or 0.0, MIN_LATENCY_MS)) / _LOG_GAMMA)
+
+    @staticmethod
+    def value_of(bin_: int) -> float:
+        return 2 * _GAMMA ** bin_ / (_GAMMA + 1)
+
+
+class ScoreHistogram(Histogram):
+    @staticmethod
+    def bin_of(value: float) -> int:
+        return round((value or 0.0) * 100)
+
+    @staticmethod
+    def value_of(bin_: int) -> float:
+        return bin_ / 100
+
+
+class QueryRollup:
+    """Aggregate of the query logs of one bucket (or of several merged buckets)."""
+
+    def __init__(self, queries=0, latency_sum=0.0, confidence_sum=0.0, input_tokens=0, output_tokens=0,
+                 sessions=None, latency=None, confidence=None, stages=None, stage_sums=None):
+        self.queries = queries
+        self.latency_sum = latency_sum
+        self.confidence_sum = confidence_sum
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.sessions = sessions or HyperLogLog()
+        self.latency = latency or LatencyHistogram()
+        self.confidence = confidence or ScoreHistogram()
+        self.stages = stages or {}          # stage -> LatencyHistogram
+        self.stage_sums = stage_sums or {}  # stage -> total ms
+
+    def add_stage(self, stage: str, ms: float):
+        self.stages.setdefault(stage, LatencyHistogram()).add(ms)
+        self.stage_sums[stage] = self.stage_sums.get(stage, 0.0) + ms
+
+    def add(self, session_id, latency_ms, confidence_score, input_tokens=0, output_tokens=0, stages=None):
+        self.queries += 1
+        self.latency_sum += latency_ms or 0.0
+        self.confidence_sum += confidence_score or 0.0
+        self.input_tokens += input_tokens or 0
+        self.output_tokens += output_tokens or 0
+        if session_id:
+            self.sessions.add(session_id)
+        self.latency.add(latency_ms)
+        self.confidence.add(confidence_score)
+        for stage, ms in (stages or {}).items():
+            if ms is not None:  # Not recorded (queries logged before stage timings)
+                self.add_stage(stage, ms)
+
+    def merge(self, other: "QueryRollup"):
+        self.queries += other.queries
+        self.latency_sum += other.latency_sum
+        self.confidence_sum += other.confidence_sum
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.sessions.merge(other.sessions)
+        self.latency.merge(other.latency)
+        self.confidence.merge(other.confidence)
+        for stage, histogram in other.stages.items():
+            self.stages.setdefault(stage, LatencyHistogram()).merge(histogram)
+            self.stage_sums[stage] = self.stage_sums.get(stage, 0.0) + other.stage_sums.get(stage, 0.0)
+
+    # Column order of the query_rollups table after (granularity, bucket)
+    COLUMNS = ("queries", "latency_sum", "confidence_sum", "input_tokens", "output_tokens",
+               "sessions_hll", "latency_hist", "confidence_hist", "stages_json")
+
+    def to_row(self) -> tuple:
+        stages = {stage: {"sum": self.stage_sums.get(stage, 0.0), "hist": h.counts} for stage, h in self.stages.items()}
+        return (self.queries, self.latency_sum, self.confidence_sum, self.input_tokens, self.output_tokens,
+                self.sessions.to_bytes(), self.latency.to_json(), self.confidence.to_json(), json.dumps(stages))
+
+    @classmethod
+    def from_row(cls, row) -> "QueryRollup":
+        queries, latency_sum, confidence_sum, input_tokens, output_tokens, hll, latency, confidence, stages = row
+        stages = json.loads(stages) if stages else {}
+        return cls(queries, latency_sum, confidence_sum, input_tokens, output_tokens,
+                   HyperLogLog.from_bytes(hll), LatencyHistogram.from_json(latency),
+                   ScoreHistogram.from_json(confidence),
+                   {stage: LatencyHistogram({int(b): n for b, n in v["hist"].items()}) for stage, v in stages.items()},
+                   {stage: v["sum"] for stage, v in stages.items()})
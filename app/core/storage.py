@@ -0,0 +1,130 @@
+"""
+Storage accounting and upload quotas.
+
+The storage_usage table is a ledger of bytes and files per category of data/
+(uploads, static, page_cache, word_index, database, ...) and per upload
+session. Writers adjust it as they go: saved uploads, the word index, the
+rendered-page cache and the session cleanup. Reading usage is then a small
+query instead of a walk over the whole tree. reconcile() rescans data/ and
+rewrites the ledger, correcting drift from files written or removed outside
+those paths; the cleanup job runs it.
+
+Uploads are rejected up front when they would take the session past
+STORAGE_SESSION_QUOTA_MB (413) or data/ past STORAGE_QUOTA_GB (507).
+"""
+import os
+import pathlib
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.db import adjust_storage, get_storage_usage, get_storage_bytes, replace_storage_usage
+
+# Top-level entries of data/ with their own category; other directories are
+# accounted under their name, loose files under "database" (SQLite files) or "other"
+FILE_CATEGORIES = {"word_index.db": "word_index"}
+SQLITE_SUFFIXES = (".db", ".db-wal", ".db-shm", ".db-journal")
+
+
+def data_dir() -> pathlib.Path:
+    return pathlib.Path(os.getcwd()) / "data"
+
+
+def upload_category(category: str) -> str:
+    return "static" if category == "static" else "uploads"
+
+
+def record_upload(category: str, session_id: str, delta_bytes: int, delta_files: int = 0):
+    adjust_storage(upload_category(category), delta_bytes, delta_files,
+                   session_id=None if category == "static" else session_id)
+
+
+def classify(relative: pathlib.PurePath) -> tuple:
+    """(category, session or None) of a file, from its path relative to data/."""
+    parts = relative.parts
+    if len(parts) == 1:
+        name = parts[0]
+        for base, category in FILE_CATEGORIES.items():
+            if name.startswith(base):
+                return category, None
+        return ("database" if name.endswith(SQLITE_SUFFIXES) else "other"), None
+    if parts[0] == "uploads":
+        return "uploads", parts[1] if len(parts) > 2 else None
+    return parts[0], None
+
+
+def scan(root: pathlib.Path = None) -> dict:
+    """Actual usage on disk: {(kind, name): (bytes, files)}."""
+    root = pathlib.Path(root or data_dir())
+    totals = {}
+
+    def add(key, size):
+        size_total, files = totals.get(key, (0, 0))
+        totals[key] = (size_total + size, files + 1)
+
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = pathlib.Path(dirpath) / filename
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                continue  # Removed while scanning
+            category, session_id = classify(path.relative_to(root))
+            add(("category", category), size)
+            if session_id:
+                add(("session", session_id), size)
+    return totals
+
+
+def reconcile(root: pathlib.Path = None, only_if_empty: bool = False) -> dict:
+    """Rescan data/ and rewrite the ledger. Returns the drift that was corrected (bytes, files)."""
+    ledger = get_storage_usage()
+    if only_if_empty and ledger:
+        return {"bytes": 0, "files": 0}
+    actual = scan(root)
+    recorded = [r for r in ledger if r["kind"] == "category"]
+    drift = {
+        "bytes": sum(v[0] for k, v in actual.items() if k[0] == "category") - sum(r["bytes"] for r in recorded),
+        "files": sum(v[1] for k, v in actual.items() if k[0] == "category") - sum(r["files"] for r in recorded),
+    }
+    replace_storage_usage(actual)
+    return drift
+
+
+def quota_bytes() -> int:
+    return int(settings.STORAGE_QUOTA_GB * 1024 ** 3)
+
+
+def usage() -> dict:
+    rows = get_storage_usage()
+    categories = {r["name"]: {"bytes": r["bytes"], "files": r["files"]} for r in rows if r["kind"] == "category"}
+    sessions = [
+        {"session_id": r["name"], "bytes": r["bytes"], "files": r["files"]}
+        for r in rows if r["kind"] == "session"
+    ]
+    return {
+        "used_bytes": sum(c["bytes"] for c in categories.values()),
+        "total_bytes": quota_bytes(),
+        "session_quota_bytes": settings.STORAGE_SESSION_QUOTA_MB * 1024 * 1024,
+        "categories": categories,
+        "sessions": sessions[:20],  # Largest first
+    }
+
+
+def check_quota(session_id: str, size_bytes: int):
+    """Raise 413 (session quota) or 507 (global quota) if storing `size_bytes` more would exceed it."""
+    session_quota = settings.STORAGE_SESSION_QUOTA_MB * 1024 * 1024
+    if session_quota and session_id:
+        used = get_storage_bytes("session", session_id)
+        if used + size_bytes > session_quota:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Session storage quota exceeded ({used + size_bytes} of {session_quota} bytes). "
+                       f"Delete documents or start a new session.",
+            )
+    used = get_storage_bytes("category")
+    if used + size_bytes > quota_bytes():
+        raise HTTPException(
+            status_code=507,
+            detail=f"Storage quota exceeded ({used + size_bytes} of {quota_bytes()} bytes).",
+        )
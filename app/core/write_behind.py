@@ -0,0 +1,213 @@
+"""
+Write-behind persistence of query logs and chat messages.
+
+log_query() and add_message() build their row (timestamped at call time) and
+append it to a bounded in-memory buffer; a writer thread commits the buffer
+in batches, one transaction per batch, as soon as WRITE_BEHIND_BATCH_ROWS rows
+are waiting or WRITE_BEHIND_INTERVAL_MS after the first one. Requests no
+longer wait for an insert and commit of their own.
+
+Backpressure: when WRITE_BEHIND_QUEUE_SIZE rows are buffered, "block" waits up
+to WRITE_BEHIND_BLOCK_MS for room and then writes the row in the caller's
+thread (nothing is lost, the caller pays the disk write); "drop" discards the
+row and counts it.
+
+Crash semantics:
+- A row is durable once its batch is committed, normally within
+  WRITE_BEHIND_INTERVAL_MS of the call. Until then it only exists in memory.
+- A clean shutdown (lifespan shutdown, or interpreter exit via atexit)
+  flushes the buffer. A hard crash (SIGKILL, OOM kill, power loss) loses the
+  buffered rows and the batch being written: at most WRITE_BEHIND_QUEUE_SIZE
+  rows plus one batch. Committed batches are never lost by a process crash;
+  with synchronous=NORMAL (app.db) an OS crash can lose the last commits.
+- A batch is one transaction, so it is committed entirely or not at all;
+  a batch that fails is retried row by row and only bad rows are discarded.
+- Rows are committed in call order, except rows written in the caller's
+  thread on overflow, which can overtake buffered ones.
+- Readers that need their own writes (chat history, session deletion) call
+  flush() first.
+
+WRITE_BEHIND=false writes synchronously, as before.
+"""
+import atexit
+import collections
+import threading
+import time
+
+from app.core.config import settings
+from app.db import query_log_row, message_row, write_rows
+
+
+class WriteBehindQueue:
+    def __init__(self, write, batch_rows: int, interval_ms: float, queue_size: int,
+                 overflow: str = "block", block_ms: float = 100):
+        if overflow not in ("block", "drop"):
+            raise ValueError(f"Unknown write-behind overflow policy: {overflow}")
+        self._write = write
+        self.batch_rows = max(1, batch_rows)
+        self.interval = interval_ms / 1000
+        self.queue_size = max(1, queue_size)
+        self.overflow = overflow
+        self.block = block_ms / 1000
+        self._rows = collections.deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._flushing = 0
+        self._stopped = False
+        self.written = 0
+        self.inline = 0     # Written in the caller's thread (buffer full or stopped)
+        self.dropped = 0
+        self.failed = 0
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, row) -> bool:
+        """Queue a (sql, params) insert. Returns False if it was dropped."""
+        with self._cond:
+            full = len(self._rows) >= self.queue_size
+            if full and not self._stopped:
+                if self.overflow == "drop":
+                    self.dropped += 1
+                    if self.dropped == 1 or self.dropped % 1000 == 0:
+                        print(f"Write-behind buffer full: {self.dropped} rows dropped so far")
+                    return False
+                full = not self._cond.wait_for(
+                    lambda: len(self._rows) < self.queue_size or self._stopped, timeout=self.block)
+            if not full and not self._stopped:
+                self._rows.append(row)
+                if len(self._rows) == 1 or len(self._rows) >= self.batch_rows:
+                    self._cond.notify_all()
+                return True
+            self.inline += 1
+        self._write_batch([row])
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """Commit everything queued so far. Returns False on timeout."""
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: not self._rows and not self._in_flight, timeout=timeout)
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout: float = None):
+        """Flush and stop the writer thread; later rows are written synchronously."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued": len(self._rows) + self._in_flight,
+                "written": self.written,
+                "inline": self.inline,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._rows or self._stopped)
+                if not self._rows:
+                    return  # Stopped and drained
+                # Let the batch fill up until it is full or the interval since its first row is over
+                deadline = time.monotonic() + self.interval
+                while len(self._rows) < self.batch_rows and not (self._stopped or self._flushing):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._rows.popleft() for _ in range(min(self.batch_rows, len(self._rows)))]
+                self._in_flight = len(batch)
+                self._cond.notify_all()  # Room for blocked callers
+            self._write_batch(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _write_batch(self, batch):
+        written = failed = 0
+        try:
+            self._write(batch)
+            written = len(batch)
+        except Exception as e:
+            print(f"Write-behind batch of {len(batch)} rows failed ({e}); retrying row by row")
+            for row in batch:
+                try:
+                    self._write([row])
+                    written += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"Write-behind row discarded: {e}")
+        with self._cond:
+            self.written += written
+            self.failed += failed
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    """Lazily start the writer thread (None when WRITE_BEHIND is off)."""
+    global _queue
+    if not settings.WRITE_BEHIND:
+        return None
+    with _queue_lock:
+        if _queue is None:
+            _queue = WriteBehindQueue(
+                write_rows,
+                batch_rows=settings.WRITE_BEHIND_BATCH_ROWS,
+                interval_ms=settings.WRITE_BEHIND_INTERVAL_MS,
+                queue_size=settings.WRITE_BEHIND_QUEUE_SIZE,
+                overflow=settings.WRITE_BEHIND_OVERFLOW,
+                block_ms=settings.WRITE_BEHIND_BLOCK_MS,
+            )
+            atexit.register(shutdown_write_queue)
+    return _queue
+
+
+def _submit(row):
+    queue = get_write_queue()
+    if queue is not None:
+        queue.submit(row)
+    else:
+        write_rows([row])
+
+
+def log_query(session_id, query_text, answer_text, sources, confidence_score, latency_ms, input_tokens=0, output_tokens=0,
+              timings=None):
+    """app.db.log_query without waiting for the write."""
+    try:
+        _submit(query_log_row(session_id, query_text, answer_text, sources, confidence_score, latency_ms,
+                              input_tokens, output_tokens, timings))
+    except Exception as e:
+        print(f"Error logging query: {e}")
+
+
+def add_message(session_id, role, content, sources=None):
+    """app.db.add_message without waiting for the write."""
+    try:
+        _submit(message_row(session_id, role, content, sources))
+    except Exception as e:
+        print(f"Error adding message: {e}")
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Commit the buffered rows (read-your-writes). Returns False on timeout."""
+    queue = _queue
+    return queue.flush(timeout) if queue is not None else True
+
+
+def shutdown_write_queue(timeout: float = 10.0):
+    global _queue
+    with _queue_lock:
+        if _queue is not None:
+            _queue.close(timeout)
+            _queue = None
@@ -1,16 +1,269 @@
+import os
 import sqlite3
 import json
+import threading
 from datetime import datetime, timedelta
 import pathlib
 
+from app.core.sketches import QueryRollup, LatencyHistogram, ScoreHistogram, HyperLogLog
+
 DB_PATH = pathlib.Path("data/analytics.db")
 
+# Applied to every pooled connection
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # Readers and the writer don't block each other
+    "PRAGMA synchronous=NORMAL",      # fsync at checkpoints only; safe with WAL
+    "PRAGMA busy_timeout=10000",
+    "PRAGMA cache_size=-65536",       # 64 MB page cache
+    "PRAGMA mmap_size=268435456",     # 256 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
+
+# --- Connection Pool ---
+
+_pool = threading.local()
+
+class PooledConnection:
+    """
+    A checkout of the calling thread's connection to one database file. Same
+    interface as the sqlite3 connection the helpers use (cursor, execute,
+    commit, row_factory); close() hands the connection back instead of closing
+    it. row_factory only applies to cursors of this checkout.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.row_factory = None
+
+    def cursor(self):
+        c = self._conn.cursor()
+        c.row_factory = self.row_factory
+        return c
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        # Never leave a write transaction open on a shared connection
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+def connect(path=None):
+    """
+    This thread's connection to `path` (default DB_PATH), opened once with
+    SQLITE_PRAGMAS. Connections are never shared between threads, and a forked
+    process opens its own.
+    """
+    path = str(path or DB_PATH)
+    if getattr(_pool, "pid", None) != os.getpid():
+        _pool.pid = os.getpid()
+        _pool.connections = {}
+    conn = _pool.connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=10)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        _pool.connections[path] = conn
+    elif conn.in_transaction:
+        conn.rollback()  # Left open by a helper that failed before committing
+    return PooledConnection(conn)
+
+def close_connections():
+    """Close this thread's pooled connections."""
+    for conn in getattr(_pool, "connections", {}).values():
+        conn.close()
+    _pool.connections = {}
+
+# --- Schema ---
+
+def _columns(c, table):
+    c.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in c.fetchall()}
+
+def _add_column(c, table, column, definition):
+    if column not in _columns(c, table):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _migrate_legacy_columns(c):
+    """Columns added to existing databases before migrations were versioned."""
+    _add_column(c, "query_logs", "input_tokens", "INTEGER DEFAULT 0")
+    _add_column(c, "query_logs", "output_tokens", "INTEGER DEFAULT 0")
+    _add_column(c, "chat_sessions", "summary", "TEXT")
+    for column in ("pages_skipped", "boilerplate_lines", "chunks_avoided", "duplicates_skipped"):
+        _add_column(c, "ingestion_jobs", column, "INTEGER DEFAULT 0")
+    _add_column(c, "ingestion_jobs", "lane", "TEXT")
+    _add_column(c, "ingestion_jobs", "latency_ms", "REAL")
+
+def _migrate_history_indexes(c):
+    """Chat history by session, analytics by time window and session."""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages(session_id, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_timestamp ON query_logs(timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_session ON query_logs(session_id)")
+
+def _migrate_message_source_refs(c):
+    """Source references next to the full sources, so history pages don't parse chunk texts."""
+    _add_column(c, "chat_messages", "source_refs_json", "TEXT")
+    # Same fields as source_refs(): QueryResponse sources, or LlamaIndex node dicts
+    c.execute('''
+        UPDATE chat_messages SET source_refs_json = (
+            SELECT json_group_array(json_object(
+                'filename', COALESCE(json_extract(value, '$.filename'), json_extract(value, '$.metadata.filename'),
+                                     json_extract(value, '$.node.metadata.filename')),
+                'page_label', COALESCE(json_extract(value, '$.page_label'), json_extract(value, '$.metadata.page_label'),
+                                       json_extract(value, '$.node.metadata.page_label')),
+                'score', json_extract(value, '$.score')
+            )) FROM json_each(chat_messages.sources_json)
+        )
+        WHERE source_refs_json IS NULL AND sources_json IS NOT NULL AND json_valid(sources_json)
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id, id)")
+
+def _migrate_query_stage_timings(c):
+    """Per-stage timings of each query (QUERY_STAGES), and their rollups."""
+    for stage in QUERY_STAGES:
+        _add_column(c, "query_logs", f"{stage}_ms", "REAL")
+    _add_column(c, "query_rollups", "stages_json", "TEXT")
+
+# Rollup buckets: key = prefix of the ISO timestamp ("2024-05-01T13" / "2024-05-01")
+ROLLUP_KEY_LENGTH = {"hour": 13, "day": 10}
+ROLLUP_SELECT = f"SELECT bucket, {', '.join(QueryRollup.COLUMNS)} FROM query_rollups"
+ROLLUP_UPSERT = (
+    f"INSERT OR REPLACE INTO query_rollups (granularity, bucket, {', '.join(QueryRollup.COLUMNS)}) "
+    f"VALUES (?, ?, {', '.join('?' * len(QueryRollup.COLUMNS))})"
+)
+
+def _migrate_query_rollups(c):
+    """Hourly/daily rollups of query_logs, built from the existing rows."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS query_rollups (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            queries INTEGER DEFAULT 0,
+            latency_sum REAL DEFAULT 0,
+            confidence_sum REAL DEFAULT 0,
+            input_tokens INTEGER DEFAULT 0,
+            output_tokens INTEGER DEFAULT 0,
+            sessions_hll BLOB,
+            latency_hist TEXT,
+            confidence_hist TEXT,
+            PRIMARY KEY (granularity, bucket)
+        )
+    ''')
+    rebuild_query_rollups(c)
+
+def rebuild_query_rollups(c):
+    """
+    Recompute query_rollups from query_logs. The hours are aggregated in SQL
+    (sums, distinct sessions, histogram bins); days are merged from their hours.
+    """
+    conn = c.connection
+    conn.create_function("latency_bin", 1, LatencyHistogram.bin_of, deterministic=True)
+    conn.create_function("score_bin", 1, ScoreHistogram.bin_of, deterministic=True)
+    hour = "substr(timestamp, 1, 13)"
+    hours = {}
+    c.execute(f'''
+        SELECT {hour}, COUNT(*), COALESCE(SUM(latency_ms), 0), COALESCE(SUM(confidence_score), 0),
+               COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0)
+        FROM query_logs GROUP BY 1
+    ''')
+    for bucket, *sums in c.fetchall():
+        hours[bucket] = QueryRollup(*sums)
+    c.execute(f"SELECT DISTINCT {hour}, session_id FROM query_logs WHERE session_id IS NOT NULL")
+    for bucket, session_id in c.fetchall():
+        hours[bucket].sessions.add(session_id)
+    for column, function, attribute in (("latency_ms", "latency_bin", "latency"),
+                                        ("confidence_score", "score_bin", "confidence")):
+        c.execute(f"SELECT {hour}, {function}({column}), COUNT(*) FROM query_logs GROUP BY 1, 2")
+        for bucket, bin_, count in c.fetchall():
+            getattr(hours[bucket], attribute).counts[bin_] = count
+    # Stage timings (absent before migration 5)
+    columns = _columns(c, "query_logs")
+    for stage in QUERY_STAGES:
+        if f"{stage}_ms" not in columns:
+            continue
+        c.execute(f'''
+            SELECT {hour}, latency_bin({stage}_ms), COUNT(*), SUM({stage}_ms) FROM query_logs
+            WHERE {stage}_ms IS NOT NULL GROUP BY 1, 2
+        ''')
+        for bucket, bin_, count, total in c.fetchall():
+            rollup = hours[bucket]
+            rollup.stages.setdefault(stage, LatencyHistogram()).counts[bin_] = count
+            rollup.stage_sums[stage] = rollup.stage_sums.get(stage, 0.0) + total
+
+    days = {}
+    for bucket, rollup in hours.items():
+        days.setdefault(bucket[:ROLLUP_KEY_LENGTH["day"]], QueryRollup()).merge(rollup)
+    # Write the columns the table has so far (stages_json arrives with migration 5)
+    existing = _columns(c, "query_rollups")
+    keep = [i for i, column in enumerate(QueryRollup.COLUMNS) if column in existing]
+    upsert = ROLLUP_UPSERT
+    if len(keep) < len(QueryRollup.COLUMNS):
+        columns = [QueryRollup.COLUMNS[i] for i in keep]
+        upsert = (f"INSERT OR REPLACE INTO query_rollups (granularity, bucket, {', '.join(columns)}) "
+                  f"VALUES (?, ?, {', '.join('?' * len(columns))})")
+    c.execute("DELETE FROM query_rollups")
+    for granularity, rollups in (("hour", hours), ("day", days)):
+        rows = ((bucket, r.to_row()) for bucket, r in rollups.items())
+        c.executemany(upsert, ((granularity, bucket, *(row[i] for i in keep)) for bucket, row in rows))
+
+def _add_to_rollups(c, query_logs):
+    """Merge query log rows (QUERY_LOG_INSERT params) into their hour and day rollups."""
+    deltas = {}
+    for params in query_logs:
+        timestamp, session_id, _, _, _, confidence_score, latency_ms, input_tokens, output_tokens, _ = params[:10]
+        stages = dict(zip(QUERY_STAGES, params[10:]))
+        for granularity, length in ROLLUP_KEY_LENGTH.items():
+            rollup = deltas.setdefault((granularity, timestamp[:length]), QueryRollup())
+            rollup.add(session_id, latency_ms, confidence_score, input_tokens, output_tokens, stages)
+    for (granularity, bucket), rollup in deltas.items():
+        c.execute(f"{ROLLUP_SELECT} WHERE granularity = ? AND bucket = ?", (granularity, bucket))
+        row = c.fetchone()
+        if row:
+            rollup.merge(QueryRollup.from_row(row[1:]))
+        c.execute(ROLLUP_UPSERT, (granularity, bucket, *rollup.to_row()))
+
+# (version, migration) in order; the applied version is stored in PRAGMA user_version.
+# Migrations must be idempotent: a database may have been partly migrated by hand.
+MIGRATIONS = (
+    (1, _migrate_legacy_columns),
+    (2, _migrate_history_indexes),
+    (3, _migrate_message_source_refs),
+    (4, _migrate_query_rollups),
+    (5, _migrate_query_stage_timings),
+)
+
+def migrate(conn):
+    """Apply the migrations newer than the database's user_version. Returns the version."""
+    c = conn.cursor()
+    c.execute("PRAGMA user_version")
+    version = c.fetchone()[0]
+    for target, migration in MIGRATIONS:
+        if target > version:
+            migration(c)
+            c.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+            version = target
+    return version
+
+_initialized = set()
+
 def init_db():
-    """Initialize the SQLite database."""
+    """Create the tables and apply pending migrations (once per process and database file)."""
+    if str(DB_PATH) in _initialized and DB_PATH.exists():
+        return
     # Ensure data directory exists
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     c = conn.cursor()
     
     # Create query_logs table
@@ -26,23 +279,16 @@ def init_db():
             latency_ms REAL,
             input_tokens INTEGER DEFAULT 0,
             output_tokens INTEGER DEFAULT 0,
-            token_count INTEGER DEFAULT 0
+            token_count INTEGER DEFAULT 0,
+            embed_ms REAL,
+            search_ms REAL,
+            postprocess_ms REAL,
+            llm_ttft_ms REAL,
+            llm_ms REAL,
+            persist_ms REAL
         )
     ''')
     
-    # Migration: Add columns if they don't exist
-    try:
-        c.execute("ALTER TABLE query_logs ADD COLUMN input_tokens INTEGER DEFAULT 0")
-    except sqlite3.OperationalError: pass
-    try:
-        c.execute("ALTER TABLE query_logs ADD COLUMN output_tokens INTEGER DEFAULT 0")
-    except sqlite3.OperationalError: pass
-    
-    # Session Migrations
-    try:
-        c.execute("ALTER TABLE chat_sessions ADD COLUMN summary TEXT")
-    except sqlite3.OperationalError: pass
-
     # Create chat_sessions table
     c.execute('''
         CREATE TABLE IF NOT EXISTS chat_sessions (
@@ -61,41 +307,765 @@ def init_db():
             role TEXT,
             content TEXT,
             sources_json TEXT,
+            source_refs_json TEXT,
             timestamp TEXT,
             FOREIGN KEY(session_id) REFERENCES chat_sessions(session_id)
         )
     ''')
+
+    # Create ingestion_jobs table (job registry / progress tracking)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            job_id TEXT PRIMARY KEY,
+            session_id TEXT,
+            filename TEXT,
+            category TEXT,
+            status TEXT,
+            stage TEXT,
+            size_bytes INTEGER DEFAULT 0,
+            pages_extracted INTEGER DEFAULT 0,
+            chunks_embedded INTEGER DEFAULT 0,
+            vectors_written INTEGER DEFAULT 0,
+            pages_skipped INTEGER DEFAULT 0,
+            boilerplate_lines INTEGER DEFAULT 0,
+            chunks_avoided INTEGER DEFAULT 0,
+            duplicates_skipped INTEGER DEFAULT 0,
+            lane TEXT,
+            latency_ms REAL,
+            throughput REAL DEFAULT 0,
+            error TEXT,
+            created_at TEXT,
+            started_at TEXT,
+            updated_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_session ON ingestion_jobs(session_id, created_at)")
+
+    # Near-duplicate index (MinHash signatures + LSH band buckets)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS dedup_chunks (
+            point_id TEXT PRIMARY KEY,
+            corpus TEXT,
+            session_id TEXT,
+            filename TEXT,
+            page_label TEXT,
+            signature BLOB,
+            canonical_id TEXT,
+            version TEXT,
+            created_at TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dedup_chunks_doc ON dedup_chunks(session_id, filename)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dedup_chunks_canonical ON dedup_chunks(canonical_id)")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS dedup_buckets (
+            corpus TEXT,
+            band INTEGER,
+            bucket TEXT,
+            point_id TEXT,
+            PRIMARY KEY (corpus, band, bucket, point_id)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dedup_buckets_point ON dedup_buckets(point_id)")
+
+    # Shared uploads (identical files across sessions share one point set)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS shared_files (
+            file_hash TEXT PRIMARY KEY,
+            filename TEXT,
+            owner TEXT,
+            point_count INTEGER DEFAULT 0,
+            refcount INTEGER DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS shared_file_refs (
+            file_hash TEXT,
+            session_id TEXT,
+            filename TEXT,
+            created_at TEXT,
+            PRIMARY KEY (file_hash, session_id)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_shared_file_refs_session ON shared_file_refs(session_id)")
+
+    # Document catalog (one row per stored file; static files under session "static")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            category TEXT,
+            path TEXT,
+            size_bytes INTEGER DEFAULT 0,
+            file_hash TEXT,
+            page_count INTEGER,
+            chunk_count INTEGER,
+            status TEXT,
+            error TEXT,
+            job_id TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            ingested_at TEXT,
+            UNIQUE (session_id, filename)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_documents_session ON documents(session_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_documents_category ON documents(category, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_documents_created ON documents(created_at)")
+
+    # Storage ledger: bytes/files per data/ category ("category") and per upload session ("session")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS storage_usage (
+            kind TEXT,
+            name TEXT,
+            bytes INTEGER DEFAULT 0,
+            files INTEGER DEFAULT 0,
+            updated_at TEXT,
+            PRIMARY KEY (kind, name)
+        )
+    ''')
+
     conn.commit()
+    migrate(conn)
     conn.close()
+    _initialized.add(str(DB_PATH))
+
+# Query pipeline stages timed per query (query_logs.<stage>_ms): query embedding,
+# Qdrant search, node post-processing, LLM time to first token and total, and
+# persistence (from the log call until the row is written, see write_rows)
+QUERY_STAGES = ("embed", "search", "postprocess", "llm_ttft", "llm", "persist")
+
+QUERY_LOG_INSERT = (
+    "INSERT INTO query_logs (timestamp, session_id, query_text, answer_text, sources_json, confidence_score, "
+    "latency_ms, input_tokens, output_tokens, token_count, "
+    + ", ".join(f"{stage}_ms" for stage in QUERY_STAGES)
+    + ") VALUES (" + ", ".join("?" * (10 + len(QUERY_STAGES))) + ")"
+)
 
-def log_query(session_id, query_text, answer_text, sources, confidence_score, latency_ms, input_tokens=0, output_tokens=0):
+def query_log_row(session_id, query_text, answer_text, sources, confidence_score, latency_ms, input_tokens=0, output_tokens=0,
+                  timings=None):
+    """(sql, params) of a query log insert, timestamped now. `timings`: {stage: ms} of QUERY_STAGES."""
+    timestamp = datetime.utcnow().isoformat()
+    sources_json = json.dumps(sources)
+    # Calculate total for backward compatibility if needed, though we use split
+    total_tokens = input_tokens + output_tokens
+    timings = timings or {}
+    return QUERY_LOG_INSERT, (timestamp, session_id, query_text, answer_text, sources_json, confidence_score,
+                              latency_ms, input_tokens, output_tokens, total_tokens,
+                              *(timings.get(stage) for stage in QUERY_STAGES))
+
+def log_query(session_id, query_text, answer_text, sources, confidence_score, latency_ms, input_tokens=0, output_tokens=0,
+              timings=None):
     """Log a query event to the database (Analytics)."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        write_rows([query_log_row(session_id, query_text, answer_text, sources, confidence_score, latency_ms,
+                                  input_tokens, output_tokens, timings)])
+    except Exception as e:
+        print(f"Error logging query: {e}")
+
+def _with_persist_ms(params):
+    """Query log params with persist_ms: time since the row was built (its timestamp)."""
+    if params[-1] is not None:
+        return params
+    waited = (datetime.utcnow() - datetime.fromisoformat(params[0])).total_seconds() * 1000
+    return (*params[:-1], round(max(waited, 0.0), 3))
+
+def write_rows(rows):
+    """
+    Execute (sql, params) inserts in one transaction: all of them are committed
+    or none. Query logs are added to the analytics rollups in the same transaction.
+    """
+    conn = connect()
+    c = conn.cursor()
+    try:
+        query_logs = []
+        for sql, params in rows:
+            if sql == QUERY_LOG_INSERT:
+                params = _with_persist_ms(params)
+                query_logs.append(params)
+            c.execute(sql, params)
+        if query_logs:
+            _add_to_rollups(c, query_logs)
+        conn.commit()
+    finally:
+        conn.close()
+
+# --- Ingestion Job Helpers ---
+
+JOB_FIELDS = (
+    "session_id", "filename", "category", "status", "stage", "size_bytes",
+    "pages_extracted", "chunks_embedded", "vectors_written", "pages_skipped",
+    "boilerplate_lines", "chunks_avoided", "duplicates_skipped", "lane", "latency_ms",
+    "throughput", "error",
+    "created_at", "started_at", "updated_at", "finished_at",
+)
+
+def save_job(job_id, **fields):
+    """Insert or update an ingestion job record. Only the given fields are written."""
+    try:
+        fields = {k: v for k, v in fields.items() if k in JOB_FIELDS}
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        conn = connect()
         c = conn.cursor()
-        
-        timestamp = datetime.utcnow().isoformat()
-        sources_json = json.dumps(sources)
-        
-        # Calculate total for backward compatibility if needed, though we use split
-        total_tokens = input_tokens + output_tokens
-        
+        c.execute('INSERT OR IGNORE INTO ingestion_jobs (job_id, created_at) VALUES (?, ?)',
+                  (job_id, fields["updated_at"]))
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        c.execute(f'UPDATE ingestion_jobs SET {assignments} WHERE job_id = ?',
+                  (*fields.values(), job_id))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error saving job {job_id}: {e}")
+
+JOB_COUNTERS = (
+    "pages_extracted", "chunks_embedded", "vectors_written",
+    "pages_skipped", "boilerplate_lines", "chunks_avoided", "duplicates_skipped",
+)
+
+def increment_job(job_id, **deltas):
+    """
+    Atomically add to a job's progress counters (safe when several workers report
+    on the same job, e.g. page-range subtasks) and refresh its throughput.
+    """
+    try:
+        deltas = {k: v for k, v in deltas.items() if k in JOB_COUNTERS and v}
+        if not deltas:
+            return
+        conn = connect()
+        c = conn.cursor()
+        assignments = ", ".join(f"{k} = COALESCE({k}, 0) + ?" for k in deltas)
+        c.execute(f'''
+            UPDATE ingestion_jobs SET {assignments}, updated_at = ? WHERE job_id = ?
+        ''', (*deltas.values(), datetime.utcnow().isoformat(), job_id))
         c.execute('''
-            INSERT INTO query_logs (timestamp, session_id, query_text, answer_text, sources_json, confidence_score, latency_ms, input_tokens, output_tokens, token_count)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (timestamp, session_id, query_text, answer_text, sources_json, confidence_score, latency_ms, input_tokens, output_tokens, total_tokens))
-        
+            UPDATE ingestion_jobs
+            SET throughput = ROUND(chunks_embedded / MAX((julianday(updated_at) - julianday(started_at)) * 86400.0, 0.001), 2)
+            WHERE job_id = ? AND started_at IS NOT NULL
+        ''', (job_id,))
         conn.commit()
         conn.close()
     except Exception as e:
-        print(f"Error logging query: {e}")
+        print(f"Error updating job {job_id}: {e}")
+
+def get_job(job_id):
+    """Get a single ingestion job record (or None)."""
+    try:
+        conn = connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute('SELECT * FROM ingestion_jobs WHERE job_id = ?', (job_id,))
+        row = c.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    except Exception as e:
+        print(f"Error fetching job {job_id}: {e}")
+        return None
+
+def list_jobs(session_id, limit=50):
+    """List the most recent ingestion jobs of a session."""
+    try:
+        conn = connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute('SELECT * FROM ingestion_jobs WHERE session_id = ? ORDER BY created_at DESC LIMIT ?',
+                  (session_id, limit))
+        rows = [dict(r) for r in c.fetchall()]
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Error listing jobs for {session_id}: {e}")
+        return []
+
+# --- Near-Duplicate Index Helpers ---
+
+DEDUP_QUERY_CHUNK = 500  # Keep IN (...) lists below SQLite's variable limit
+
+def find_dedup_candidates(corpus, band_keys):
+    """
+    Canonical chunks of a corpus sharing at least one LSH bucket with the given
+    (band, bucket) keys. Returns {point_id: {session_id, filename, page_label, signature}}.
+    """
+    try:
+        conn = connect()
+        c = conn.cursor()
+        candidates = {}
+        keys = list(set(band_keys))
+        for i in range(0, len(keys), DEDUP_QUERY_CHUNK):
+            batch = keys[i:i + DEDUP_QUERY_CHUNK]
+            clauses = " OR ".join("(b.band = ? AND b.bucket = ?)" for _ in batch)
+            c.execute(f'''
+                SELECT DISTINCT d.point_id, d.session_id, d.filename, d.page_label, d.signature
+                FROM dedup_buckets b JOIN dedup_chunks d ON d.point_id = b.point_id
+                WHERE b.corpus = ? AND ({clauses}) AND d.canonical_id IS NULL
+            ''', (corpus, *[v for key in batch for v in key]))
+            for point_id, session_id, filename, page_label, signature in c.fetchall():
+                candidates[point_id] = {
+                    "session_id": session_id, "filename": filename,
+                    "page_label": page_label, "signature": signature,
+                }
+        conn.close()
+        return candidates
+    except Exception as e:
+        print(f"Error querying dedup index: {e}")
+        return {}
+
+def save_dedup_chunks(corpus, version, chunks):
+    """
+    Record chunks of one document version in the near-duplicate index. Each chunk
+    is a dict with point_id, session_id, filename, page_label, signature,
+    canonical_id (None for canonical chunks) and band_keys.
+    Only canonical chunks are added to the LSH buckets.
+    """
+    try:
+        now = datetime.utcnow().isoformat()
+        conn = connect()
+        c = conn.cursor()
+        c.executemany('''
+            INSERT OR REPLACE INTO dedup_chunks
+            (point_id, corpus, session_id, filename, page_label, signature, canonical_id, version, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(ch["point_id"], corpus, ch["session_id"], ch["filename"], ch["page_label"],
+               ch["signature"], ch["canonical_id"], version, now) for ch in chunks])
+        c.executemany('''
+            INSERT OR IGNORE INTO dedup_buckets (corpus, band, bucket, point_id) VALUES (?, ?, ?, ?)
+        ''', [(corpus, band, bucket, ch["point_id"]) for ch in chunks if ch["canonical_id"] is None
+               for band, bucket in ch["band_keys"]])
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error saving dedup chunks: {e}")
+
+def get_document_alternates(session_id, filename):
+    """
+    Alternates of every canonical chunk this document is involved in (as the
+    canonical copy or as a duplicate). Returns {canonical_id: [{filename, page_label}]}.
+    """
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('''
+            SELECT canonical_id, filename, page_label FROM dedup_chunks
+            WHERE canonical_id IN (
+                SELECT point_id FROM dedup_chunks
+                WHERE session_id = ? AND filename = ? AND canonical_id IS NULL
+                UNION
+                SELECT canonical_id FROM dedup_chunks
+                WHERE session_id = ? AND filename = ? AND canonical_id IS NOT NULL
+            )
+            ORDER BY canonical_id, filename, CAST(page_label AS INTEGER)
+        ''', (session_id or "", filename, session_id or "", filename))
+        alternates = {}
+        for canonical_id, alt_filename, page_label in c.fetchall():
+            alternates.setdefault(canonical_id, []).append({"filename": alt_filename, "page_label": page_label})
+        conn.close()
+        return alternates
+    except Exception as e:
+        print(f"Error fetching alternates for {filename}: {e}")
+        return {}
+
+def prune_dedup_document(session_id, filename, version):
+    """Drop index entries of earlier versions of a document (chunks it no longer contains)."""
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('''
+            DELETE FROM dedup_buckets WHERE point_id IN
+            (SELECT point_id FROM dedup_chunks WHERE session_id = ? AND filename = ? AND version != ?)
+        ''', (session_id or "", filename, version))
+        c.execute('DELETE FROM dedup_chunks WHERE session_id = ? AND filename = ? AND version != ?',
+                  (session_id or "", filename, version))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error pruning dedup index for {filename}: {e}")
+
+def find_orphaned_duplicates():
+    """
+    Duplicates whose canonical chunk is gone (its document was re-ingested
+    without it). Removes them from the index so their documents ingest those
+    chunks again next time; returns the affected filenames.
+    """
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('''
+            SELECT DISTINCT filename FROM dedup_chunks d
+            WHERE canonical_id IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM dedup_chunks k WHERE k.point_id = d.canonical_id)
+        ''')
+        filenames = [r[0] for r in c.fetchall()]
+        if filenames:
+            c.execute('''
+                DELETE FROM dedup_chunks WHERE canonical_id IS NOT NULL
+                AND canonical_id NOT IN (SELECT point_id FROM dedup_chunks)
+            ''')
+        conn.commit()
+        conn.close()
+        return filenames
+    except Exception as e:
+        print(f"Error checking orphaned duplicates: {e}")
+        return []
+
+def get_dedup_report():
+    """Duplication ratio per corpus (only the static library is deduplicated)."""
+    try:
+        conn = connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute('''
+            SELECT corpus,
+                   COUNT(*) AS chunks,
+                   SUM(CASE WHEN canonical_id IS NULL THEN 1 ELSE 0 END) AS canonical,
+                   SUM(CASE WHEN canonical_id IS NOT NULL THEN 1 ELSE 0 END) AS duplicates,
+                   COUNT(DISTINCT filename) AS documents
+            FROM dedup_chunks GROUP BY corpus ORDER BY duplicates DESC
+        ''')
+        rows = []
+        for r in c.fetchall():
+            row = dict(r)
+            row["duplication_ratio"] = round(row["duplicates"] / row["chunks"], 4) if row["chunks"] else 0.0
+            rows.append(row)
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Error building dedup report: {e}")
+        return []
+
+# --- Shared Upload Helpers ---
+
+def _shared_refs(c, file_hash):
+    c.execute('SELECT session_id FROM shared_file_refs WHERE file_hash = ? ORDER BY created_at', (file_hash,))
+    return [r[0] for r in c.fetchall()]
+
+def get_shared_file(file_hash):
+    """Shared file record (with its referencing sessions under "sessions"), or None."""
+    try:
+        conn = connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute('SELECT * FROM shared_files WHERE file_hash = ?', (file_hash,))
+        row = c.fetchone()
+        result = None
+        if row:
+            result = dict(row)
+            result["sessions"] = _shared_refs(c, file_hash)
+        conn.close()
+        return result
+    except Exception as e:
+        print(f"Error fetching shared file {file_hash}: {e}")
+        return None
+
+def register_shared_file(file_hash, session_id, filename, owner, point_count):
+    """
+    Record a freshly ingested upload as shareable (refcount 1). Returns False if
+    the hash is already registered (e.g. another session finished ingesting the
+    same file first); the new copy then simply stays private to its session.
+    """
+    try:
+        now = datetime.utcnow().isoformat()
+        conn = connect()
+        c = conn.cursor()
+        c.execute('''
+            INSERT OR IGNORE INTO shared_files (file_hash, filename, owner, point_count, refcount, created_at, updated_at)
+            VALUES (?, ?, ?, ?, 1, ?, ?)
+        ''', (file_hash, filename, owner, point_count, now, now))
+        registered = c.rowcount == 1
+        if registered:
+            c.execute('''
+                INSERT OR REPLACE INTO shared_file_refs (file_hash, session_id, filename, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', (file_hash, session_id, filename, now))
+        conn.commit()
+        conn.close()
+        return registered
+    except Exception as e:
+        print(f"Error registering shared file {filename}: {e}")
+        return False
+
+def add_shared_ref(file_hash, session_id, filename):
+    """Add a session reference to a shared file. Returns the referencing sessions."""
+    try:
+        now = datetime.utcnow().isoformat()
+        conn = connect()
+        c = conn.cursor()
+        c.execute('''
+            INSERT OR IGNORE INTO shared_file_refs (file_hash, session_id, filename, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (file_hash, session_id, filename, now))
+        c.execute('''
+            UPDATE shared_files SET refcount = (SELECT COUNT(*) FROM shared_file_refs WHERE file_hash = ?),
+            updated_at = ? WHERE file_hash = ?
+        ''', (file_hash, now, file_hash))
+        sessions = _shared_refs(c, file_hash)
+        conn.commit()
+        conn.close()
+        return sessions
+    except Exception as e:
+        print(f"Error adding shared ref for {session_id}: {e}")
+        return []
+
+def remove_shared_ref(file_hash, session_id):
+    """Drop a session reference. Returns the sessions still referencing the file."""
+    try:
+        now = datetime.utcnow().isoformat()
+        conn = connect()
+        c = conn.cursor()
+        c.execute('DELETE FROM shared_file_refs WHERE file_hash = ? AND session_id = ?', (file_hash, session_id))
+        sessions = _shared_refs(c, file_hash)
+        if sessions:
+            c.execute('UPDATE shared_files SET refcount = ?, updated_at = ? WHERE file_hash = ?',
+                      (len(sessions), now, file_hash))
+        else:
+            c.execute('DELETE FROM shared_files WHERE file_hash = ?', (file_hash,))
+        conn.commit()
+        conn.close()
+        return sessions
+    except Exception as e:
+        print(f"Error removing shared ref for {session_id}: {e}")
+        return []
+
+def set_shared_owner(file_hash, owner):
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('UPDATE shared_files SET owner = ?, updated_at = ? WHERE file_hash = ?',
+                  (owner, datetime.utcnow().isoformat(), file_hash))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error updating shared file {file_hash}: {e}")
+
+def get_session_shared_files(session_id, filename=None):
+    """Shared files a session references (optionally only those uploaded under `filename`)."""
+    try:
+        conn = connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        query = '''
+            SELECT f.*, r.filename AS ref_filename FROM shared_file_refs r
+            JOIN shared_files f ON f.file_hash = r.file_hash WHERE r.session_id = ?
+        '''
+        params = [session_id]
+        if filename is not None:
+            query += ' AND r.filename = ?'
+            params.append(filename)
+        c.execute(query, params)
+        rows = [dict(r) for r in c.fetchall()]
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Error listing shared files for {session_id}: {e}")
+        return []
+
+def get_shared_filenames(session_id):
+    """
+    {filename stored on the shared points: filename this session uploaded} for
+    the shared files the session references under another name.
+    """
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('''
+            SELECT f.filename, r.filename FROM shared_file_refs r
+            JOIN shared_files f ON f.file_hash = r.file_hash
+            WHERE r.session_id = ? AND r.filename != f.filename
+            ORDER BY r.created_at
+        ''', (session_id,))
+        filenames = dict(c.fetchall())
+        conn.close()
+        return filenames
+    except Exception as e:
+        print(f"Error listing shared filenames for {session_id}: {e}")
+        return {}
+
+# --- Document Catalog Helpers ---
+
+DOCUMENT_FIELDS = (
+    "category", "path", "size_bytes", "file_hash", "page_count", "chunk_count",
+    "status", "error", "job_id", "created_at", "ingested_at",
+)
+
+def save_document(session_id, filename, **fields):
+    """Insert or update a catalog entry. Only the given fields are written."""
+    try:
+        fields = {k: v for k, v in fields.items() if k in DOCUMENT_FIELDS}
+        now = datetime.utcnow().isoformat()
+        conn = connect()
+        c = conn.cursor()
+        c.execute('INSERT OR IGNORE INTO documents (session_id, filename, created_at) VALUES (?, ?, ?)',
+                  (session_id, filename, now))
+        fields["updated_at"] = now
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        c.execute(f'UPDATE documents SET {assignments} WHERE session_id = ? AND filename = ?',
+                  (*fields.values(), session_id, filename))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error saving document {session_id}/{filename}: {e}")
+
+def list_documents_page(session_id=None, category=None, status=None, cursor=None, limit=100):
+    """
+    Catalog entries, newest first, filtered by session/category/status.
+    Keyset pagination: pass the returned cursor to get the next page (None when done).
+    """
+    try:
+        conn = connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        clauses, params = [], []
+        for column, value in (("session_id", session_id), ("category", category), ("status", status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if cursor is not None:
+            clauses.append("id < ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        c.execute(f'SELECT * FROM documents {where} ORDER BY id DESC LIMIT ?', (*params, limit + 1))
+        rows = [dict(r) for r in c.fetchall()]
+        conn.close()
+        next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+    except Exception as e:
+        print(f"Error listing documents: {e}")
+        return [], None
+
+def get_document_paths():
+    """{path: (session_id, filename)} of every catalog entry (for reconciliation with the disk)."""
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('SELECT path, session_id, filename FROM documents')
+        paths = {r[0]: (r[1], r[2]) for r in c.fetchall()}
+        conn.close()
+        return paths
+    except Exception as e:
+        print(f"Error reading document catalog: {e}")
+        return {}
+
+def set_session_documents_status(session_id, status):
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute('UPDATE documents SET status = ?, updated_at = ? WHERE session_id = ?',
+                  (status, datetime.utcnow().isoformat(), session_id))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error updating documents of {session_id}: {e}")
+
+def delete_documents(session_id, filename=None):
+    """Remove the catalog entries of a session (or one of its files)."""
+    try:
+        conn = connect()
+        c = conn.cursor()
+        if filename is None:
+            c.execute('DELETE FROM documents WHERE session_id = ?', (session_id,))
+        else:
+            c.execute('DELETE FROM documents WHERE session_id = ? AND filename = ?', (session_id, filename))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error deleting documents of {session_id}: {e}")
+
+# --- Storage Ledger Helpers ---
+
+def _adjust_usage(c, kind, name, delta_bytes, delta_files, now):
+    c.execute('INSERT OR IGNORE INTO storage_usage (kind, name, updated_at) VALUES (?, ?, ?)', (kind, name, now))
+    c.execute('''
+        UPDATE storage_usage SET bytes = MAX(bytes + ?, 0), files = MAX(files + ?, 0), updated_at = ?
+        WHERE kind = ? AND name = ?
+    ''', (delta_bytes, delta_files, now, kind, name))
+
+def adjust_storage(category, delta_bytes, delta_files=0, session_id=None):
+    """Add (or subtract) bytes and files to a data category and, for uploads, to the session."""
+    if not delta_bytes and not delta_files:
+        return
+    try:
+        now = datetime.utcnow().isoformat()
+        conn = connect()
+        c = conn.cursor()
+        _adjust_usage(c, "category", category, delta_bytes, delta_files, now)
+        if session_id:
+            _adjust_usage(c, "session", session_id, delta_bytes, delta_files, now)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error updating storage ledger: {e}")
+
+def get_storage_usage():
+    """Ledger rows: [{"kind", "name", "bytes", "files", "updated_at"}]."""
+    try:
+        conn = connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute('SELECT * FROM storage_usage ORDER BY kind, bytes DESC')
+        rows = [dict(r) for r in c.fetchall()]
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Error reading storage ledger: {e}")
+        return []
+
+def get_storage_bytes(kind, name=None):
+    """Bytes of one ledger entry, or of all entries of a kind (kind="category": everything stored)."""
+    try:
+        conn = connect()
+        c = conn.cursor()
+        if name is None:
+            c.execute('SELECT COALESCE(SUM(bytes), 0) FROM storage_usage WHERE kind = ?', (kind,))
+        else:
+            c.execute('SELECT COALESCE(SUM(bytes), 0) FROM storage_usage WHERE kind = ? AND name = ?', (kind, name))
+        total = c.fetchone()[0]
+        conn.close()
+        return total
+    except Exception as e:
+        print(f"Error reading storage ledger: {e}")
+        return 0
+
+def replace_storage_usage(entries):
+    """Overwrite the ledger with scanned totals: {(kind, name): (bytes, files)}."""
+    try:
+        now = datetime.utcnow().isoformat()
+        conn = connect()
+        c = conn.cursor()
+        c.execute('DELETE FROM storage_usage')
+        c.executemany(
+            'INSERT INTO storage_usage (kind, name, bytes, files, updated_at) VALUES (?, ?, ?, ?, ?)',
+            [(kind, name, size, files, now) for (kind, name), (size, files) in entries.items()],
+        )
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error rewriting storage ledger: {e}")
+
+def forget_session_storage(session_id, category="uploads"):
+    """Drop a deleted session's ledger entry and take its bytes off the category."""
+    try:
+        now = datetime.utcnow().isoformat()
+        conn = connect()
+        c = conn.cursor()
+        c.execute("SELECT bytes, files FROM storage_usage WHERE kind = 'session' AND name = ?", (session_id,))
+        row = c.fetchone()
+        if row:
+            _adjust_usage(c, "category", category, -row[0], -row[1], now)
+            c.execute("DELETE FROM storage_usage WHERE kind = 'session' AND name = ?", (session_id,))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Error updating storage ledger for {session_id}: {e}")
 
 # --- Chat History Helpers ---
 
 def create_session(session_id, title="New Chat"):
     """Create a new chat session."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         c = conn.cursor()
         created_at = datetime.utcnow().isoformat()
         c.execute('INSERT OR IGNORE INTO chat_sessions (session_id, title, created_at) VALUES (?, ?, ?)', 
@@ -108,7 +1078,7 @@ def create_session(session_id, title="New Chat"):
 def get_recent_sessions(limit=10):
     """Get recent chat sessions ordered by last message time."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
         
@@ -132,7 +1102,7 @@ def get_recent_sessions(limit=10):
 def update_session_title(session_id, title):
     """Update session title."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         c = conn.cursor()
         c.execute('UPDATE chat_sessions SET title = ? WHERE session_id = ?', (title, session_id))
         conn.commit()
@@ -143,7 +1113,7 @@ def update_session_title(session_id, title):
 def update_session_summary(session_id, summary):
     """Update session executive summary."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         c = conn.cursor()
         c.execute('UPDATE chat_sessions SET summary = ? WHERE session_id = ?', (summary, session_id))
         conn.commit()
@@ -151,30 +1121,41 @@ def update_session_summary(session_id, summary):
     except Exception as e:
         print(f"Error updating summary: {e}")
 
+MESSAGE_INSERT = (
+    "INSERT INTO chat_messages (session_id, role, content, sources_json, source_refs_json, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+def source_refs(sources):
+    """Filename, page and score of each source, without the chunk text."""
+    refs = []
+    for s in sources or []:
+        meta = s.get("metadata") or (s.get("node") or {}).get("metadata") or {}
+        refs.append({
+            "filename": s.get("filename") or meta.get("filename"),
+            "page_label": s.get("page_label") or meta.get("page_label"),
+            "score": s.get("score"),
+        })
+    return refs
+
+def message_row(session_id, role, content, sources=None):
+    """(sql, params) of a chat message insert, timestamped now."""
+    timestamp = datetime.utcnow().isoformat()
+    sources_json = json.dumps(sources) if sources else None
+    refs_json = json.dumps(source_refs(sources)) if sources else None
+    return MESSAGE_INSERT, (session_id, role, content, sources_json, refs_json, timestamp)
+
 def add_message(session_id, role, content, sources=None):
     """Add a message to a session."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        timestamp = datetime.utcnow().isoformat()
-        sources_json = json.dumps(sources) if sources else None
-        
-        c.execute('''
-            INSERT INTO chat_messages (session_id, role, content, sources_json, timestamp)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (session_id, role, content, sources_json, timestamp))
-        
-        # Naive titling removed. Handled by LLM via background task now.
-        
-        conn.commit()
-        conn.close()
+        write_rows([message_row(session_id, role, content, sources)])
     except Exception as e:
         print(f"Error adding message: {e}")
 
 def get_session_messages(session_id):
     """Get all messages for a session."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
         c.execute('SELECT * FROM chat_messages WHERE session_id = ? ORDER BY id ASC', (session_id,))
@@ -195,10 +1176,66 @@ def get_session_messages(session_id):
         print(f"Error fetching messages: {e}")
         return []
 
+def get_messages_page(session_id, before=None, after=None, limit=50, full_sources=False):
+    """
+    A page of a session's messages in chronological order: the latest `limit`,
+    those before message id `before` or those after `after`. Sources are
+    references (filename, page_label, score) unless full_sources.
+    Keyset pagination: returns (rows, next_cursor), next_cursor being the id to
+    pass as `before` (or `after`) for the following page, None when done.
+    """
+    try:
+        conn = connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        sources_column = "sources_json" if full_sources else "source_refs_json"
+        clauses, params = ["session_id = ?"], [session_id]
+        if before is not None:
+            clauses.append("id < ?")
+            params.append(before)
+        if after is not None:
+            clauses.append("id > ?")
+            params.append(after)
+        order = "ASC" if after is not None and before is None else "DESC"
+        c.execute(f'''
+            SELECT id, session_id, role, content, {sources_column} AS sources_json, timestamp
+            FROM chat_messages WHERE {' AND '.join(clauses)} ORDER BY id {order} LIMIT ?
+        ''', (*params, limit + 1))
+        rows = [dict(r) for r in c.fetchall()]
+        conn.close()
+        next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+        rows = rows[:limit]
+        if order == "DESC":
+            rows.reverse()
+        for d in rows:
+            try:
+                d["sources"] = json.loads(d.pop("sources_json") or "[]")
+            except ValueError:
+                d["sources"] = []
+        return rows, next_cursor
+    except Exception as e:
+        print(f"Error fetching messages: {e}")
+        return [], None
+
+def get_message_sources(session_id, message_id):
+    """Full sources (with chunk text) of one message; None if the message does not exist."""
+    try:
+        conn = connect()
+        c = conn.cursor()
+        c.execute("SELECT sources_json FROM chat_messages WHERE id = ? AND session_id = ?", (message_id, session_id))
+        row = c.fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return json.loads(row[0]) if row[0] else []
+    except Exception as e:
+        print(f"Error fetching sources of message {message_id}: {e}")
+        return None
+
 def get_session_last_active(session_id):
     """Get timestamp of the last message in a session (or creation time). Returns unix epoch."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         c = conn.cursor()
         
         # 1. Check last message
@@ -231,7 +1268,7 @@ def get_session_last_active(session_id):
 def clear_all_history():
     """Clear all chat history and sessions."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         c = conn.cursor()
         c.execute("DELETE FROM chat_messages")
         c.execute("DELETE FROM chat_sessions")
@@ -246,7 +1283,7 @@ def clear_all_history():
 def delete_session(session_id):
     """Delete a specific session and its messages."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         c = conn.cursor()
         c.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
         c.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
@@ -259,7 +1296,7 @@ def delete_session(session_id):
 def get_stats():
     """Retrieve partial analytics stats."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
         
@@ -290,15 +1327,9 @@ def get_stats():
         c.execute("SELECT timestamp, query_text, confidence_score, latency_ms FROM query_logs ORDER BY id DESC LIMIT 50")
         recent_logs = [dict(row) for row in c.fetchall()]
         
-        # 7. Storage Volume
-        total_size = 0
-        try:
-            root_dir = DB_PATH.parent
-            for entry in root_dir.rglob('*'):
-                if entry.is_file():
-                    total_size += entry.stat().st_size
-        except:
-            pass
+        # 7. Storage Volume (ledger)
+        c.execute("SELECT COALESCE(SUM(bytes), 0) FROM storage_usage WHERE kind = 'category'")
+        total_size = c.fetchone()[0]
         
         conn.close()
         
@@ -322,7 +1353,7 @@ def get_timeseries_stats(range_type='7d', custom_start=None, custom_end=None):
     range_type: 'today', '7d', '30d', 'custom'
     """
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
         
@@ -356,26 +1387,27 @@ def get_timeseries_stats(range_type='7d', custom_start=None, custom_end=None):
         # 2. Determine Grouping (Hour vs Day)
         # If window <= 24h -> Hourly
         # If window > 24h -> Daily
+        # Buckets are whole hours/days (the rollup buckets) covering the window
         duration_hours = (end_dt - start_dt).total_seconds() / 3600
         group_by = 'hour' if duration_hours <= 25 else 'day'
-        
-        # Generate buckets
+        step = timedelta(hours=1) if group_by == 'hour' else timedelta(days=1)
+        key_length = ROLLUP_KEY_LENGTH[group_by]
+
+        def floor(dt):
+            return dt.replace(minute=0, second=0, microsecond=0) if group_by == 'hour' else \
+                dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        def key(dt):
+            return dt.isoformat()[:key_length]
+
         buckets = []
-        if group_by == 'hour':
-            # Hourly buckets from start to end
-            current = start_dt
-            while current <= end_dt:
-                buckets.append(current)
-                current += timedelta(hours=1)
-        else:
-            # Daily buckets
-            current = start_dt
-            while current <= end_dt:
-                buckets.append(current)
-                current += timedelta(days=1)
-                
+        current = floor(start_dt)
+        while current <= end_dt:
+            buckets.append(current)
+            current += step
+        keys = [key(dt) for dt in buckets]
         num_buckets = len(buckets)
-        
+
         stats = {
             "queries": [0] * num_buckets,
             "sessions": [0] * num_buckets,
@@ -388,197 +1420,110 @@ def get_timeseries_stats(range_type='7d', custom_start=None, custom_end=None):
             "confidence_avg": 0.0,
             "p50_score": 0.0,
             "p90_score": 0.0,
+            "p50_latency": 0.0,
+            "p90_latency": 0.0,
+            "p99_latency": 0.0,
+            "stages": {},  # Per-stage latency: count, avg, p50, p90, p99 (ms)
+            "stage_latency": {stage: [0.0] * num_buckets for stage in QUERY_STAGES},  # Avg per bucket
             "trend_queries": 0.0,
             "trend_volume": 0.0,
-            "labels": [] # For X-axis
+            "labels": [dt.strftime('%H:%M' if group_by == 'hour' else '%d %b') for dt in buckets]  # For X-axis
         }
-        
-        # Populate Labels
-        for dt in buckets:
-            if group_by == 'hour':
-                stats["labels"].append(dt.strftime('%H:%M'))
-            else:
-                stats["labels"].append(dt.strftime('%d %b'))
+        if not buckets:
+            conn.close()
+            return stats
 
-        # 3. Query Data
-        c.execute('''
-            SELECT timestamp, session_id, latency_ms, confidence_score, input_tokens, output_tokens
-            FROM query_logs 
-            WHERE timestamp >= ? AND timestamp <= ?
-        ''', (start_dt.isoformat(), end_dt.isoformat()))
-        rows = [dict(row) for row in c.fetchall()]
-        
-        bucket_data = {i: {"q": 0, "s": set(), "l_sum": 0, "l_cnt": 0} for i in range(num_buckets)}
-        
-        all_scores = []
-        total_lat = 0
-        total_conf = 0
-        
-        for r in rows:
-            try:
-                ts = datetime.fromisoformat(r['timestamp'])
-                # Find bucket index
-                # Simple approximation: index = (ts - start) / step
-                if group_by == 'hour':
-                    idx = int((ts - start_dt).total_seconds() / 3600)
-                else:
-                    idx = int((ts - start_dt).total_seconds() / 86400)
-                
-                if 0 <= idx < num_buckets:
-                    bucket_data[idx]["q"] += 1
-                    bucket_data[idx]["s"].add(r['session_id'])
-                    lat = r['latency_ms'] or 0
-                    bucket_data[idx]["l_sum"] += lat
-                    bucket_data[idx]["l_cnt"] += 1
-                
-                total_lat += (r['latency_ms'] or 0)
-                conf = r['confidence_score'] or 0
-                total_conf += conf
-                all_scores.append(conf)
-            except:
+        # 3. Query Data (rollups: one row per bucket, whatever the number of queries)
+        c.execute(f"{ROLLUP_SELECT} WHERE granularity = ? AND bucket >= ? AND bucket <= ?",
+                  (group_by, keys[0], keys[-1]))
+        rollups = {row[0]: QueryRollup.from_row(tuple(row)[1:]) for row in c.fetchall()}
+
+        total = QueryRollup()
+        for i, k in enumerate(keys):
+            rollup = rollups.get(k)
+            if rollup is None:
                 continue
+            stats["queries"][i] = rollup.queries
+            stats["sessions"][i] = rollup.sessions.count()
+            if rollup.queries:
+                stats["latency"][i] = round(rollup.latency_sum / rollup.queries, 1)
+            for stage, histogram in rollup.stages.items():
+                if stage in stats["stage_latency"] and histogram.total():
+                    stats["stage_latency"][stage][i] = round(rollup.stage_sums[stage] / histogram.total(), 1)
+            total.merge(rollup)
 
-        # Fill Series
-        for i in range(num_buckets):
-            stats["queries"][i] = bucket_data[i]["q"]
-            stats["sessions"][i] = len(bucket_data[i]["s"])
-            if bucket_data[i]["l_cnt"] > 0:
-                stats["latency"][i] = round(bucket_data[i]["l_sum"] / bucket_data[i]["l_cnt"], 1)
-        
-        stats["queries_total"] = len(rows)
-        stats["sessions_total"] = len(set(r['session_id'] for r in rows))
-        stats["latency_avg"] = round(total_lat / len(rows), 2) if rows else 0.0
-        stats["confidence_avg"] = round(total_conf / len(rows), 2) if rows else 0.0
-        
-        # 4. P50 / P90
-        if all_scores:
-            all_scores.sort()
-            n = len(all_scores)
-            stats["p50_score"] = round(all_scores[int(n * 0.50)], 2)
-            stats["p90_score"] = round(all_scores[int(n * 0.90)], 2) if int(n * 0.90) < n else all_scores[-1]
-
-        # 5. Ingestion (File System) & Trends
-        # Window duration
-        delta = end_dt - start_dt
-        days_duration = max(delta.days, 1)
-        
-        trend_label_q = ""
-        trend_label_v = ""
-        
-        # Trend Logic
+        stats["queries_total"] = total.queries
+        stats["sessions_total"] = total.sessions.count()
+        if total.queries:
+            stats["latency_avg"] = round(total.latency_sum / total.queries, 2)
+            stats["confidence_avg"] = round(total.confidence_sum / total.queries, 2)
+
+        # 4. Percentiles (merged histograms)
+        stats["p50_score"] = round(total.confidence.quantile(0.50), 2)
+        stats["p90_score"] = round(total.confidence.quantile(0.90), 2)
+        stats["p50_latency"] = round(total.latency.quantile(0.50), 1)
+        stats["p90_latency"] = round(total.latency.quantile(0.90), 1)
+        stats["p99_latency"] = round(total.latency.quantile(0.99), 1)
+        for stage in QUERY_STAGES:
+            histogram = total.stages.get(stage) or LatencyHistogram()
+            count = histogram.total()
+            stats["stages"][stage] = {
+                "count": count,
+                "avg": round(total.stage_sums.get(stage, 0.0) / count, 1) if count else 0.0,
+                "p50": round(histogram.quantile(0.50), 1),
+                "p90": round(histogram.quantile(0.90), 1),
+                "p99": round(histogram.quantile(0.99), 1),
+            }
+
+        # Token Sums
+        stats["input_tokens"] = total.input_tokens
+        stats["output_tokens"] = total.output_tokens
+
+        # 5. Trends
         # A) Short Duration (< 7 days) -> Compare vs Previous same duration
         # B) Long Duration (>= 7 days) -> Compare Rate vs Previous 7 days (Last Week)
-        
+        delta = end_dt - start_dt
+        days_duration = max(delta.days, 1)
         if days_duration < 7:
-            # Prev Window = [start - duration, start]
-            prev_start = start_dt - delta
-            prev_end = start_dt
-            
-            # Label
+            prev_start, prev_end = start_dt - delta, start_dt
             if range_type == 'today':
-                trend_label_q = "vs yesterday"
+                trend_label = "vs yesterday"
             elif range_type == 'custom':
-                 trend_label_q = f"vs prev {int(delta.total_seconds()/86400) or 1}d"
-            else:
-                 trend_label_q = "vs prev period" # Generic fallback
-                 
-            # Queries Trend
-            c.execute('''SELECT COUNT(*) FROM query_logs WHERE timestamp >= ? AND timestamp < ?''', (prev_start.isoformat(), prev_end.isoformat()))
-            prev_q = c.fetchone()[0] or 0
-            
-            if prev_q > 0:
-                stats["trend_queries"] = round(((stats["queries_total"] - prev_q) / prev_q) * 100, 1)
+                trend_label = f"vs prev {int(delta.total_seconds()/86400) or 1}d"
             else:
-                stats["trend_queries"] = 100.0 if stats["queries_total"] > 0 else 0.0
-                
-            # Volume Trend Logic (later) - uses same window
-            pass 
-
+                trend_label = "vs prev period" # Generic fallback
+            prev_days = curr_days = 1  # Compare totals
         else:
-            # Long Duration -> Compare Daily Rate vs Prev 7 Days
-            # Prev 7 Days Window = [start - 7d, start]
-            prev_start = start_dt - timedelta(days=7)
-            prev_end = start_dt
-            trend_label_q = "vs last week"
-            
-            # Queries Rate
-            c.execute('''SELECT COUNT(*) FROM query_logs WHERE timestamp >= ? AND timestamp < ?''', (prev_start.isoformat(), prev_end.isoformat()))
-            prev_week_total = c.fetchone()[0] or 0
-            prev_daily_rate = prev_week_total / 7
-            
-            curr_daily_rate = stats["queries_total"] / days_duration
-            
-            if prev_daily_rate > 0:
-                stats["trend_queries"] = round(((curr_daily_rate - prev_daily_rate) / prev_daily_rate) * 100, 1)
-            else:
-                stats["trend_queries"] = 100.0 if curr_daily_rate > 0 else 0.0
+            prev_start, prev_end = start_dt - timedelta(days=7), start_dt
+            trend_label = "vs last week"
+            prev_days, curr_days = 7, days_duration  # Compare daily rates
 
-        stats["trend_label_queries"] = trend_label_q
-        stats["trend_label_volume"] = trend_label_q # Same logic for volume
+        def trend(current, previous):
+            curr_rate, prev_rate = current / curr_days, previous / prev_days
+            if prev_rate > 0:
+                return round(((curr_rate - prev_rate) / prev_rate) * 100, 1)
+            return 100.0 if curr_rate > 0 else 0.0
 
-        # Token Sums
-        c.execute('''SELECT SUM(input_tokens), SUM(output_tokens) FROM query_logs WHERE timestamp >= ? AND timestamp <= ?''', (start_dt.isoformat(), end_dt.isoformat()))
-        toks = c.fetchone()
-        stats["input_tokens"] = toks[0] or 0
-        stats["output_tokens"] = toks[1] or 0
+        c.execute("SELECT COALESCE(SUM(queries), 0) FROM query_rollups WHERE granularity = ? AND bucket >= ? AND bucket < ?",
+                  (group_by, key(floor(prev_start)), key(floor(prev_end))))
+        stats["trend_queries"] = trend(stats["queries_total"], c.fetchone()[0])
+        stats["trend_label_queries"] = trend_label
+        stats["trend_label_volume"] = trend_label # Same logic for volume
 
-        # Ingestion Volume (Approximation)
+        # Ingestion Volume (uploaded bytes from the document catalog, bucketed in SQL)
         try:
-            root_dir = DB_PATH.parent
-            vol_buckets = {i: 0 for i in range(num_buckets)}
-            total_vol = 0
-            
-            # For trends
-            vol_prev_period = 0 # For short duration
-            vol_prev_week = 0   # For long duration
-            
-            for entry in root_dir.rglob('*'):
-                if entry.is_file():
-                    try:
-                        mtime = datetime.utcfromtimestamp(entry.stat().st_mtime)
-                        size = entry.stat().st_size
-                        
-                        # Main Window
-                        if start_dt <= mtime <= end_dt:
-                            total_vol += size
-                            if group_by == 'hour':
-                                idx = int((mtime - start_dt).total_seconds() / 3600)
-                            else:
-                                idx = int((mtime - start_dt).total_seconds() / 86400)
-                            if 0 <= idx < num_buckets:
-                                vol_buckets[idx] += size
-                        
-                        # Trend Window
-                        if days_duration < 7:
-                            if prev_start <= mtime < prev_end:
-                                vol_prev_period += size
-                        else:
-                            if prev_start <= mtime < prev_end:
-                                vol_prev_week += size
-                                
-                    except:
-                        pass
-            
-            for i in range(num_buckets):
-                stats["ingestion"][i] = vol_buckets[i]
-            
-            stats["volume_total"] = total_vol
-            
-            # Calculate Volume Trend
-            if days_duration < 7:
-                if vol_prev_period > 0:
-                    stats["trend_volume"] = round(((total_vol - vol_prev_period) / vol_prev_period) * 100, 1)
-                else:
-                    stats["trend_volume"] = 100.0 if total_vol > 0 else 0.0
-            else:
-                # Rate comparison
-                vol_rate_prev = vol_prev_week / 7
-                vol_rate_curr = total_vol / days_duration
-                if vol_rate_prev > 0:
-                    stats["trend_volume"] = round(((vol_rate_curr - vol_rate_prev) / vol_rate_prev) * 100, 1)
-                else:
-                    stats["trend_volume"] = 100.0 if vol_rate_curr > 0 else 0.0
-                 
+            window_end = key(buckets[-1] + step)
+            c.execute('''
+                SELECT substr(created_at, 1, ?), COALESCE(SUM(size_bytes), 0) FROM documents
+                WHERE created_at >= ? AND created_at < ? GROUP BY 1
+            ''', (key_length, keys[0], window_end))
+            volume = dict(c.fetchall())
+            stats["ingestion"] = [volume.get(k, 0) for k in keys]
+            stats["volume_total"] = sum(stats["ingestion"])
+
+            c.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM documents WHERE created_at >= ? AND created_at < ?",
+                      (key(floor(prev_start)), key(floor(prev_end))))
+            stats["trend_volume"] = trend(stats["volume_total"], c.fetchone()[0])
         except Exception as e:
             print(f"Error scanning ingestion: {e}")
 
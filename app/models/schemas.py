@@ -5,16 +5,43 @@ from typing import Optional, List
 class TaskStatusEnum(str, Enum):
     PENDING = "PENDING"
     STARTED = "STARTED"
+    RETRY = "RETRY"
     SUCCESS = "SUCCESS"
     FAILURE = "FAILURE"
+    REVOKED = "REVOKED"
 
 class IngestResponse(BaseModel):
     task_id: str
     filename: str
     message: str
+    status: TaskStatusEnum = TaskStatusEnum.PENDING
+    queryable: bool = False            # True once vectors are committed (fast lane)
+    latency_ms: Optional[float] = None
 
 class TaskStatus(BaseModel):
     task_id: str
     status: TaskStatusEnum
     result: Optional[str] = None
     error: Optional[str] = None
+    filename: Optional[str] = None
+    session_id: Optional[str] = None
+    stage: Optional[str] = None
+    size_bytes: int = 0
+    pages_extracted: int = 0
+    chunks_embedded: int = 0
+    vectors_written: int = 0
+    pages_skipped: int = 0
+    boilerplate_lines: int = 0
+    chunks_avoided: int = 0
+    duplicates_skipped: int = 0
+    lane: Optional[str] = None
+    latency_ms: Optional[float] = None
+    throughput: float = 0.0
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+    @classmethod
+    def from_job(cls, job: dict) -> "TaskStatus":
+        return cls(task_id=job["job_id"], **{k: v for k, v in job.items() if k != "job_id" and v is not None})
@@ -1,10 +1,19 @@
 import os
+import time
+import contextvars
+from contextlib import contextmanager
 from llama_index.core import VectorStoreIndex, Settings, get_response_synthesizer
+from llama_index.core.schema import QueryBundle
+from llama_index.core.base.response.schema import Response
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMCompletionEndEvent
 from llama_index.core.retrievers import VectorIndexRetriever
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.vector_stores.qdrant import QdrantVectorStore
 from llama_index.core.query_engine import TransformQueryEngine
-from llama_index.embeddings.fastembed import FastEmbedEmbedding
+from app.core.embeddings import get_embed_model, check_collection_model
+from app.core.projection import get_projection, reduced_collection, ProjectedEmbedding
 from llama_index.llms.google_genai import GoogleGenAI
 import qdrant_client
 
@@ -21,19 +30,40 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 from llama_index.core.vector_stores import MetadataFilters, MetadataFilter, FilterOperator, FilterCondition
 
-def get_rag_engine(session_id: str = None):
+_model_checked = False
+
+def _check_model(client):
+    global _model_checked
+    if not _model_checked:
+        check_collection_model(client, QDRANT_COLLECTION)
+        _model_checked = True
+
+def _build_components(session_id: str = None, streaming: bool = False):
+    """(query embedding model, retriever, node postprocessors, response synthesizer) for a session."""
     # 1. Setup Client & Store
     if os.getenv("QDRANT_LOCATION"):
         client = qdrant_client.QdrantClient(path=os.getenv("QDRANT_LOCATION"))
     else:
         client = qdrant_client.QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
         
-    vector_store = QdrantVectorStore(client=client, collection_name=QDRANT_COLLECTION)
-    
     # 2. Setup Embeddings & LLM
-    # Always use FastEmbed to avoid Torch dependency fallback
-    embed_model = FastEmbedEmbedding(model_name="BAAI/bge-base-en-v1.5")
+    # Same model as ingestion (EMBED_MODEL, loaded once); refuse a collection built with another one
+    _check_model(client)
+    embed_model = get_embed_model()
     Settings.embed_model = embed_model
+
+    projection = get_projection()
+    if projection:
+        # Reduced vectors: search the companion collection with a projected query vector
+        vector_store = QdrantVectorStore(
+            client=client,
+            collection_name=reduced_collection(QDRANT_COLLECTION, projection),
+            dense_vector_name=projection.name,
+        )
+        # Passed to the index only; the global model (ingestion) stays full-size
+        embed_model = ProjectedEmbedding(embed_model, projection)
+    else:
+        vector_store = QdrantVectorStore(client=client, collection_name=QDRANT_COLLECTION)
     
     # Setup LLM
     try:
@@ -61,6 +91,8 @@ def get_rag_engine(session_id: str = None):
             filters=[
                 MetadataFilter(key="category", value="static", operator=FilterOperator.EQ),
                 MetadataFilter(key="session_id", value=session_id, operator=FilterOperator.EQ),
+                # Uploads shared with this session (identical file uploaded by several sessions)
+                MetadataFilter(key="allowed_sessions", value=session_id, operator=FilterOperator.EQ),
                 # IS_EMPTY requires a dummy value validation
                 MetadataFilter(key="session_id", value="None", operator=FilterOperator.IS_EMPTY),
             ],
@@ -91,17 +123,126 @@ def get_rag_engine(session_id: str = None):
     )
 
     # 6. Response Synthesizer
-    response_synthesizer = get_response_synthesizer()
+    response_synthesizer = get_response_synthesizer(streaming=streaming)
+
+    node_postprocessors = [] # No heavy reranker for Turbo mode
+    return embed_model, vector_retriever, node_postprocessors, response_synthesizer
+
+def get_rag_engine(session_id: str = None):
+    _, vector_retriever, node_postprocessors, response_synthesizer = _build_components(session_id)
 
     # 7. Base Query Engine
     query_engine = RetrieverQueryEngine(
         retriever=vector_retriever,
         response_synthesizer=response_synthesizer,
-        node_postprocessors=[], # No heavy reranker for Turbo mode
+        node_postprocessors=node_postprocessors,
     )
 
     return query_engine
 
+# --- Instrumented Query ---
+
+class StageTimer:
+    """Wall-clock milliseconds per query stage (see app.db.QUERY_STAGES)."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name: str, ms: float):
+        self.stages[name] = round(self.stages.get(name, 0.0) + ms, 3)
+
+# Token usage reported by Gemini for the LLM calls of the current query
+_token_usage = contextvars.ContextVar("token_usage", default=None)
+
+def gemini_token_usage(response):
+    """(input, output) tokens from a GoogleGenAI response's usage_metadata, or None."""
+    raw = getattr(response, "raw", None) or {}
+    usage = raw.get("usage_metadata") if isinstance(raw, dict) else getattr(raw, "usage_metadata", None)
+    if not usage:
+        return None
+    if not isinstance(usage, dict):
+        usage = usage.model_dump()
+    prompt = usage.get("prompt_token_count") or 0
+    total = usage.get("total_token_count")
+    # Output includes thinking tokens (billed as output) when the total is reported
+    output = total - prompt if total else (usage.get("candidates_token_count") or 0)
+    return prompt, output
+
+class TokenUsageHandler(BaseEventHandler):
+    """Adds the usage of finished LLM calls to the current query's counters."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TokenUsageHandler"
+
+    def handle(self, event, **kwargs):
+        counters = _token_usage.get()
+        if counters is None or not isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)):
+            return
+        usage = gemini_token_usage(event.response)
+        if usage:
+            counters["input_tokens"] += usage[0]
+            counters["output_tokens"] += usage[1]
+            counters["calls"] += 1
+
+_usage_handler = None
+
+def _track_token_usage():
+    global _usage_handler
+    if _usage_handler is None:
+        _usage_handler = TokenUsageHandler()
+        get_dispatcher().add_event_handler(_usage_handler)
+
+def answer_query(query_text: str, session_id: str = None, timer: StageTimer = None):
+    """
+    Same pipeline as get_rag_engine(), run stage by stage so each one is timed:
+    embed the query, search Qdrant, post-process the nodes, then stream the
+    answer from the LLM (llm_ttft: until the first token, llm: until the last).
+    Returns (response, usage); usage is {"input_tokens", "output_tokens"} as
+    reported by Gemini, or None if the LLM reported nothing.
+    """
+    timer = timer or StageTimer()
+    embed_model, retriever, node_postprocessors, synthesizer = _build_components(session_id, streaming=True)
+    _track_token_usage()
+    counters = {"input_tokens": 0, "output_tokens": 0, "calls": 0}
+    token = _token_usage.set(counters)
+    try:
+        with timer.stage("embed"):
+            query_bundle = QueryBundle(query_text, embedding=embed_model.get_query_embedding(query_text))
+        with timer.stage("search"):
+            nodes = retriever.retrieve(query_bundle)
+        with timer.stage("postprocess"):
+            for postprocessor in node_postprocessors:
+                nodes = postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+
+        started = time.perf_counter()
+        streamed = synthesizer.synthesize(query_bundle, nodes)
+        if hasattr(streamed, "response_gen"):
+            chunks = []
+            for chunk in streamed.response_gen:
+                if not chunks:
+                    timer.add("llm_ttft", (time.perf_counter() - started) * 1000)
+                chunks.append(chunk)
+            text = "".join(chunks)
+        else:
+            text = str(streamed)  # No nodes: empty response, no LLM call
+        timer.add("llm", (time.perf_counter() - started) * 1000)
+    finally:
+        _token_usage.reset(token)
+
+    usage = None
+    if counters["calls"]:
+        usage = {"input_tokens": counters["input_tokens"], "output_tokens": counters["output_tokens"]}
+    return Response(response=text, source_nodes=nodes), usage
+
 def generate_chat_title(text: str) -> str:
     """Generate a short title for the chat based on the first internal message."""
     try:
@@ -0,0 +1,204 @@
+"""
+Benchmark the chat-history and analytics queries of app/db.py on a synthetic
+database (query_logs and chat_messages rows spread over --days days).
+
+Each query runs --repeat times against the migrated schema and again with the
+history/analytics indexes (migration 2) dropped; the table shows the median
+latency of both. A mixed read/write run from --threads threads then checks the
+pooled connections under concurrency (operations/s, "database is locked" errors).
+
+    python -m app.scripts.benchmark_db --rows 10000000
+"""
+import os
+import sys
+import json
+import builtins
+import time
+import random
+import argparse
+import tempfile
+import pathlib
+import statistics
+import threading
+from datetime import datetime, timedelta
+
+# Ensure we can import from app
+sys.path.append(os.getcwd())
+
+from app import db
+
+INSERT_BATCH = 50_000
+INDEXES = ("idx_chat_messages_session", "idx_query_logs_timestamp", "idx_query_logs_session")
+
+
+def fill(rows: int, messages: int, sessions: int, days: int, seed: int):
+    """Bulk-load synthetic rows (loading pragmas favour speed; the file is throwaway)."""
+    rng = random.Random(seed)
+    end = datetime.utcnow()
+    span = days * 86400
+    conn = db.connect()
+    conn.execute("PRAGMA synchronous=OFF")
+
+    started = end - timedelta(seconds=span)
+    conn.executemany(
+        "INSERT INTO chat_sessions (session_id, title, created_at) VALUES (?, ?, ?)",
+        ((f"s{i}", f"Session {i}", (started + timedelta(seconds=rng.random() * span)).isoformat())
+         for i in range(sessions)),
+    )
+
+    def timestamp():
+        return (end - timedelta(seconds=rng.random() * span)).isoformat()
+
+    for done in range(0, rows, INSERT_BATCH):
+        conn.executemany(
+            "INSERT INTO query_logs (timestamp, session_id, query_text, answer_text, sources_json, confidence_score, "
+            "latency_ms, input_tokens, output_tokens, token_count) VALUES (?, ?, ?, ?, '[]', ?, ?, ?, ?, ?)",
+            ((timestamp(), f"s{rng.randrange(sessions)}", "What does the policy say?", "It says...",
+              rng.random(), rng.uniform(200, 4000), 40, 300, 340)
+             for _ in range(min(INSERT_BATCH, rows - done))),
+        )
+        conn.commit()
+        print(f"  query_logs: {min(done + INSERT_BATCH, rows)}/{rows}", end="\r")
+    print()
+    for done in range(0, messages, INSERT_BATCH):
+        conn.executemany(
+            "INSERT INTO chat_messages (session_id, role, content, sources_json, timestamp) VALUES (?, ?, ?, NULL, ?)",
+            ((f"s{rng.randrange(sessions)}", rng.choice(("user", "assistant")), "Message text", timestamp())
+             for _ in range(min(INSERT_BATCH, messages - done))),
+        )
+        conn.commit()
+        print(f"  chat_messages: {min(done + INSERT_BATCH, messages)}/{messages}", end="\r")
+    print()
+    db.rebuild_query_rollups(conn.cursor())  # Bulk rows bypass write_rows
+    conn.commit()
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def workload(sessions: int, seed: int):
+    rng = random.Random(seed)
+    return {
+        "history: get_session_messages": lambda: db.get_session_messages(f"s{rng.randrange(sessions)}"),
+        "history: get_messages_page": lambda: db.get_messages_page(f"s{rng.randrange(sessions)}"),
+        "history: get_session_last_active": lambda: db.get_session_last_active(f"s{rng.randrange(sessions)}"),
+        "history: get_recent_sessions": lambda: db.get_recent_sessions(10),
+        "analytics: get_stats": db.get_stats,
+        "analytics: timeseries today": lambda: db.get_timeseries_stats("today"),
+        "analytics: timeseries 7d": lambda: db.get_timeseries_stats("7d"),
+    }
+
+
+def time_queries(queries: dict, repeat: int) -> dict:
+    results = {}
+    for name, query in queries.items():
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = round(statistics.median(samples), 2)
+    return results
+
+
+def concurrency(threads: int, seconds: float, sessions: int) -> dict:
+    """Mixed writers (log_query, add_message) and readers (history) on the pooled connections."""
+    deadline = time.time() + seconds
+    ops = [0] * threads
+
+    def run(worker):
+        rng = random.Random(worker)
+        while time.time() < deadline:
+            session = f"s{rng.randrange(sessions)}"
+            if worker % 2:
+                db.log_query(session, "q", "a", [], 0.5, 100.0)
+                db.add_message(session, "user", "hello")
+            else:
+                db.get_session_messages(session)
+            ops[worker] += 1
+
+    # The helpers report failures (e.g. "database is locked") by printing; collect those lines
+    errors = []
+    original = builtins.print
+    builtins.print = lambda *args, **kwargs: errors.append(" ".join(map(str, args)))
+    try:
+        workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    finally:
+        builtins.print = original
+    return {
+        "ops_per_s": round(sum(ops) / seconds, 1),
+        "locked": sum("locked" in line for line in errors),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark history/analytics queries on a synthetic database")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="query_logs rows")
+    parser.add_argument("--messages", type=int, default=None, help="chat_messages rows (default: --rows)")
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=90, help="Time span of the rows")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of the concurrency run")
+    parser.add_argument("--db", default=None, help="Database file (default: a temporary file, removed afterwards)")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    messages = args.rows if args.messages is None else args.messages
+
+    tmp_dir = None
+    if args.db:
+        path = pathlib.Path(args.db)
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        path = pathlib.Path(tmp_dir.name) / "benchmark.db"
+    db.DB_PATH = path
+    try:
+        db.init_db()
+        fresh = not db.connect().execute("SELECT 1 FROM query_logs LIMIT 1").fetchone()
+        if fresh:
+            print(f"Loading {args.rows} query logs and {messages} messages into {path}...")
+            started = time.perf_counter()
+            fill(args.rows, messages, args.sessions, args.days, args.seed)
+            print(f"Loaded in {time.perf_counter() - started:.0f}s ({path.stat().st_size / 2**20:.0f} MB)")
+
+        queries = workload(args.sessions, args.seed)
+        indexed = time_queries(queries, args.repeat)
+        conn = db.connect()
+        for index in INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        unindexed = time_queries(queries, args.repeat)
+        db.migrate(conn)  # Restore the indexes
+
+        rows = [
+            {"query": name, "indexed_ms": indexed[name], "unindexed_ms": unindexed[name],
+             "speedup": round(unindexed[name] / indexed[name], 1) if indexed[name] else None}
+            for name in queries
+        ]
+        mixed = concurrency(args.threads, args.seconds, args.sessions)
+
+        if args.json:
+            print(json.dumps({"queries": rows, "concurrency": mixed}, indent=2))
+            return
+        columns = list(rows[0].keys())
+        widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+        print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+        for row in rows:
+            print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+        print(f"Concurrency ({args.threads} threads, {args.seconds:g}s): {mixed['ops_per_s']} ops/s, "
+              f"{mixed['locked']} 'database is locked', {mixed['errors']} errors")
+    finally:
+        db.close_connections()
+        if tmp_dir:
+            tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Compare the EMBED_MODEL options on our own corpus.
+
+For each model: embedding throughput (chunks/s), query latency (embed + search,
+p50/p95) and retrieval recall@k. Queries are sentences sampled from the chunks;
+a hit is the chunk the sentence came from appearing in the top k. Results are
+also compared with the first model's top k (overlap@k), which shows how far a
+quantized/smaller model drifts from the reference.
+
+Search is brute force in memory, so numbers do not depend on Qdrant.
+
+    python -m app.scripts.benchmark_embeddings --models bge-base,bge-base-int8,bge-small,bge-small-int8
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import pathlib
+import argparse
+
+import numpy as np
+
+# Ensure we can import from app
+sys.path.append(os.getcwd())
+
+from app.core.embeddings import EMBEDDING_MODELS, build_embed_model, get_spec
+from app.workers import extraction
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".md")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+MIN_QUERY_WORDS = 6
+
+
+def load_chunks(corpus: pathlib.Path, max_chunks: int, chunk_chars: int):
+    """Layout-cleaned paragraphs of the corpus, packed into chunks of about chunk_chars."""
+    import fitz  # PyMuPDF
+
+    chunks = []
+    for path in sorted(corpus.rglob("*")):
+        if path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        if path.suffix.lower() == ".pdf":
+            with fitz.open(path) as doc:
+                boilerplate = extraction.get_boilerplate(doc, path)
+                pages = [extraction.clean_page(page, boilerplate)[0] for page in doc]
+        else:
+            pages = [extraction.split_paragraphs(path.read_text(errors="ignore"))]
+        for blocks in pages:
+            chunks.extend(extraction.pack_blocks(
+                blocks, chunk_chars, lambda text: [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+            ))
+            if len(chunks) >= max_chunks:
+                return chunks[:max_chunks]
+    return chunks
+
+
+def sample_queries(chunks, count: int, seed: int):
+    """(sentence, index of its chunk) pairs."""
+    rng = random.Random(seed)
+    candidates = [
+        (sentence, i)
+        for i, chunk in enumerate(chunks)
+        for sentence in SENTENCE_RE.split(chunk)
+        if len(sentence.split()) >= MIN_QUERY_WORDS
+    ]
+    return rng.sample(candidates, min(count, len(candidates)))
+
+
+def normalize(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+
+
+def run_model(key: str, chunks, queries, top_k: int, batch_size: int):
+    load_started = time.perf_counter()
+    model = build_embed_model(key)
+    load_seconds = time.perf_counter() - load_started
+
+    started = time.perf_counter()
+    vectors = []
+    for i in range(0, len(chunks), batch_size):
+        vectors.extend(model.get_text_embedding_batch(chunks[i:i + batch_size]))
+    embed_seconds = time.perf_counter() - started
+    matrix = normalize(vectors)
+
+    latencies, results = [], []
+    for text, _ in queries:
+        started = time.perf_counter()
+        query = normalize([model.get_query_embedding(text)])[0]
+        scores = matrix @ query
+        top = np.argpartition(-scores, min(top_k, len(scores) - 1))[:top_k]
+        top = top[np.argsort(-scores[top])]
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([int(i) for i in top])
+
+    hits = sum(1 for (_, source), top in zip(queries, results) if source in top)
+    return {
+        "model": key,
+        "model_name": get_spec(key).model_name,
+        "dim": get_spec(key).dim,
+        "load_s": round(load_seconds, 2),
+        "chunks_per_s": round(len(chunks) / embed_seconds, 1) if embed_seconds else None,
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2) if latencies else None,
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2) if latencies else None,
+        f"recall@{top_k}": round(hits / len(queries), 3) if queries else None,
+        "_results": results,
+    }
+
+
+def overlap(results, reference, top_k: int):
+    if not results:
+        return None
+    shared = sum(len(set(a) & set(b)) for a, b in zip(results, reference))
+    return round(shared / (top_k * len(results)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding model options on the corpus")
+    parser.add_argument("--models", default=",".join(EMBEDDING_MODELS),
+                        help="Comma-separated EMBED_MODEL keys; the first is the reference")
+    parser.add_argument("--corpus", default="data/static", help="Directory of .pdf/.txt/.md files")
+    parser.add_argument("--max-chunks", type=int, default=2000)
+    parser.add_argument("--chunk-chars", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    keys = [k.strip() for k in args.models.split(",") if k.strip()]
+    for key in keys:
+        get_spec(key)  # Fail on unknown keys before any model is loaded
+
+    chunks = load_chunks(pathlib.Path(args.corpus), args.max_chunks, args.chunk_chars)
+    queries = sample_queries(chunks, args.queries, args.seed)
+    if not chunks or not queries:
+        print(f"No usable text found in {args.corpus}")
+        sys.exit(1)
+    print(f"Corpus: {len(chunks)} chunks, {len(queries)} queries, top_k={args.top_k}")
+
+    reports = []
+    for key in keys:
+        print(f"Running {key}...")
+        reports.append(run_model(key, chunks, queries, args.top_k, args.batch_size))
+
+    reference = reports[0]["_results"]
+    for report in reports:
+        report[f"overlap@{args.top_k}"] = overlap(report.pop("_results"), reference, args.top_k)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    columns = list(reports[0].keys())
+    widths = [max(len(c), *(len(str(r[c])) for r in reports)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for report in reports:
+        print("  ".join(str(report[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+if __name__ == "__main__":
+    main()
@@ -23,12 +23,15 @@ DEFAULT_MAX_AGE_SECONDS = 21 * 24 * 3600
 
 # Ensure app module is in path for imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-try:
-    from app.db import get_session_last_active, delete_session
-except ImportError:
-    print("Warning: Could not import app.db, falling back to file mtime only.")
-    get_session_last_active = None
-    delete_session = None
+from app.db import (
+    get_session_last_active, delete_session, delete_documents, forget_session_storage,
+    clear_all_history,
+)
+from app.core import storage
+from app.core.projection import vector_collections
+from app.workers import catalog
+from app.workers.file_sharing import release_session
+from app.workers.word_index import prune_missing as prune_word_index
 
 def cleanup_expired_sessions(max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
     """
@@ -55,9 +58,7 @@ def cleanup_expired_sessions(max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
             session_id = session_dir.name
             
             # Determine Age
-            last_active = None
-            if get_session_last_active:
-                last_active = get_session_last_active(session_id)
+            last_active = get_session_last_active(session_id)
             
             if last_active:
                 age = now - last_active
@@ -72,20 +73,22 @@ def cleanup_expired_sessions(max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
                 print(f"Session {session_id} is expired ({source_type}, Age: {age/86400:.1f} days). Cleaning up...")
                 
                 try:
-                    # 1. Delete from Qdrant
-                    client.delete(
-                        collection_name=QDRANT_COLLECTION,
-                        points_selector=models.FilterSelector(
-                            filter=models.Filter(
-                                must=[
-                                    models.FieldCondition(
-                                        key="session_id",
-                                        match=models.MatchValue(value=session_id)
-                                    )
-                                ]
+                    # 1. Delete from Qdrant (shared uploads: only this session's reference)
+                    release_session(client, QDRANT_COLLECTION, session_id)
+                    for name in vector_collections(QDRANT_COLLECTION):
+                        client.delete(
+                            collection_name=name,
+                            points_selector=models.FilterSelector(
+                                filter=models.Filter(
+                                    must=[
+                                        models.FieldCondition(
+                                            key="session_id",
+                                            match=models.MatchValue(value=session_id)
+                                        )
+                                    ]
+                                )
                             )
                         )
-                    )
                     print(f"  - Deleted vectors for {session_id}")
                     
                     # 2. Delete from Disk
@@ -93,15 +96,25 @@ def cleanup_expired_sessions(max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
                     print(f"  - Deleted files for {session_id}")
                     
                     # 3. Delete from DB (The critical new step)
-                    if delete_session:
-                        delete_session(session_id)
-                        print(f"  - Deleted DB session for {session_id}")
+                    delete_session(session_id)
+                    print(f"  - Deleted DB session for {session_id}")
+                    delete_documents(session_id)
+                    forget_session_storage(session_id)
                     
                     deleted_count += 1
                     
                 except Exception as e:
                     print(f"  - ERROR cleaning {session_id}: {e}")
 
+    added, removed = catalog.reconcile()
+    if added or removed:
+        print(f"  - Document catalog: added {added} untracked files, removed {removed} missing")
+    pruned = prune_word_index()
+    if pruned:
+        print(f"  - Dropped word index of {pruned} deleted/changed files")
+    drift = storage.reconcile()
+    if drift["bytes"] or drift["files"]:
+        print(f"  - Storage ledger corrected by {drift['bytes']} bytes, {drift['files']} files")
     print(f"Cleanup complete. Removed {deleted_count} sessions.")
 
 if __name__ == "__main__":
@@ -114,9 +127,6 @@ if __name__ == "__main__":
     # If force, also clear SQL DB history
     if args.force:
         try:
-            # Add parent dir to path to find app module
-            sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-            from app.db import clear_all_history
             clear_all_history()
         except Exception as e:
             print(f"Error clearing DB history: {e}")
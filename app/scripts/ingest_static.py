@@ -1,47 +1,328 @@
 import os
-import pathlib
 import sys
+import time
 import base64
-from app.workers.tasks import process_document
-from app.core.config import settings
+import sqlite3
+import pathlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Ensure we can import from app
 sys.path.append(os.getcwd())
 
-def ingest_static_files():
+from app.workers.tasks import process_document, ingest_file_logic
+from app.workers.jobs import new_job_id, register_job
+from app.workers.checkpoints import file_sha256
+from app.db import get_job
+
+STATIC_DIR = pathlib.Path("data/static")
+DATA_DIR = pathlib.Path("data")
+MANIFEST_PATH = pathlib.Path("data/ingest_manifest.db")
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".md")
+
+
+class Manifest:
     """
-    Ingest all files from data/static directory with category="static".
-    These files are Permanent and Shared across all sessions.
+    SQLite manifest of every corpus file: hash, size, mtime and ingestion state.
+    States: queued -> done | failed. Survives restarts; unchanged files are skipped.
+    `runner` records who dispatched a queued file ("celery" or "local"): only
+    Celery jobs outlive the run that queued them.
     """
-    static_dir = pathlib.Path("data/static")
-    static_dir.mkdir(parents=True, exist_ok=True)
-    
-    files = list(static_dir.glob("*.[tT][xX][tT]")) + \
-            list(static_dir.glob("*.[pP][dD][fF]")) + \
-            list(static_dir.glob("*.[mM][dD]"))
-            
-    print(f"Found {len(files)} static files in {static_dir}")
-    
-    for file_path in files:
-        print(f"Ingesting {file_path.name}...")
-        
-        with open(file_path, "rb") as f:
-            content = f.read()
-            
-        file_content_b64 = base64.b64encode(content).decode('utf-8')
-        
-        # Call task synchronously or async?
-        # For script, sync is easier to debug, but we use the worker logic.
-        # We can call process_document.apply() to run locally if worker is not desired,
-        # or .delay() to offload to worker.
-        # Since this is a script, .delay() is better if worker is running.
-        
+
+    def __init__(self, path: pathlib.Path = MANIFEST_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                sha256 TEXT,
+                size INTEGER,
+                mtime REAL,
+                status TEXT,
+                job_id TEXT,
+                chunks INTEGER DEFAULT 0,
+                error TEXT,
+                updated_at TEXT,
+                runner TEXT
+            )
+        ''')
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        if "runner" not in columns:  # Manifests written before runners were recorded
+            self.conn.execute("ALTER TABLE files ADD COLUMN runner TEXT")
+        self.conn.commit()
+
+    def get(self, rel_path):
+        row = self.conn.execute("SELECT * FROM files WHERE path = ?", (rel_path,)).fetchone()
+        return dict(row) if row else None
+
+    def mark(self, rel_path, **fields):
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        self.conn.execute("INSERT OR IGNORE INTO files (path) VALUES (?)", (rel_path,))
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        self.conn.execute(f"UPDATE files SET {assignments} WHERE path = ?", (*fields.values(), rel_path))
+        self.conn.commit()
+
+    def in_flight(self, runner: str):
+        """Files queued by `runner` in an earlier run (rows of unknown runner are dispatched again)."""
+        rows = self.conn.execute(
+            "SELECT * FROM files WHERE status = 'queued' AND job_id IS NOT NULL AND runner = ?", (runner,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+class Progress:
+    """Overall throughput / ETA reporter (by bytes, since file sizes vary wildly)."""
+
+    def __init__(self, total_files: int, total_bytes: int, interval: float = 5.0):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.done_files = 0
+        self.failed_files = 0
+        self.done_bytes = 0
+        self.interval = interval
+        self.started = time.time()
+        self._last_report = 0.0
+
+    def skip(self, size: int):
+        """A counted file turned out to be unchanged (same hash, new mtime)."""
+        self.total_files -= 1
+        self.total_bytes -= size
+
+    def record(self, size: int, ok: bool = True):
+        self.done_files += 1
+        self.done_bytes += size
+        if not ok:
+            self.failed_files += 1
+        self.report()
+
+    def report(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-6)
+        files_rate = self.done_files / elapsed
+        bytes_rate = self.done_bytes / elapsed
+        remaining = self.total_bytes - self.done_bytes
+        eta = remaining / bytes_rate if bytes_rate > 0 else float("inf")
+        eta_str = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "--:--:--"
+        print(
+            f"[{self.done_files}/{self.total_files}] "
+            f"{files_rate:.2f} files/s, {bytes_rate / 1024 / 1024:.2f} MB/s, "
+            f"failed={self.failed_files}, ETA {eta_str}"
+        )
+
+
+def _walk(root: pathlib.Path, manifest: Manifest, force: bool = False):
+    """
+    Yield (rel_path, path, stat, manifest row) of supported files that may need
+    ingesting. Files whose size+mtime match a 'done' manifest entry are left out
+    (stat only, no hashing).
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.startswith(".") or not name.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            path = pathlib.Path(dirpath) / name
+            rel_path = path.relative_to(root).as_posix()
+            stat = path.stat()
+            row = manifest.get(rel_path)
+            if (not force and row and row["status"] == "done"
+                    and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime):
+                continue
+            yield rel_path, path, stat, row
+
+
+def count_pending(root: pathlib.Path, manifest: Manifest, force: bool = False):
+    """(files, bytes) that scan() may yield, from stat only."""
+    files = total_bytes = 0
+    for _, _, stat, _ in _walk(root, manifest, force):
+        files += 1
+        total_bytes += stat.st_size
+    return files, total_bytes
+
+
+def scan(root: pathlib.Path, manifest: Manifest, force: bool = False, on_unchanged=None):
+    """
+    Walk the directory tree and lazily yield (rel_path, path, size, sha256) for
+    new or changed files: each file is hashed only when it is about to be
+    dispatched. A 'done' file with a new mtime but the same hash is skipped
+    (on_unchanged(size) is called for it).
+    """
+    for rel_path, path, stat, row in _walk(root, manifest, force):
+        sha = file_sha256(path)
+        if not force and row and row["status"] == "done" and sha == row["sha256"]:
+            manifest.mark(rel_path, mtime=stat.st_mtime)
+            if on_unchanged:
+                on_unchanged(stat.st_size)
+            continue
+        yield rel_path, path, stat.st_size, sha
+
+
+def _on_shared_volume(path: pathlib.Path) -> bool:
+    try:
+        path.resolve().relative_to(DATA_DIR.resolve())
+        return True
+    except ValueError:
+        return False
+
+
+def _finish(manifest: Manifest, progress: Progress, rel_path: str, size: int, job: dict):
+    if job and job["status"] == "SUCCESS":
+        manifest.mark(rel_path, status="done", chunks=job.get("vectors_written") or 0, error=None)
+        progress.record(size)
+    else:
+        error = (job or {}).get("error") or "unknown error"
+        manifest.mark(rel_path, status="failed", error=error)
+        progress.record(size, ok=False)
+        print(f"Failed: {rel_path}: {error}")
+
+
+def _is_stale(job: dict, stale_after: float) -> bool:
+    """A non-terminal job that has not reported progress for `stale_after` seconds."""
+    if not job or not job.get("updated_at"):
+        return True
+    updated = datetime.fromisoformat(job["updated_at"])
+    return (datetime.utcnow() - updated).total_seconds() > stale_after
+
+
+def run_celery(root, manifest, candidates, progress, concurrency, poll_interval=1.0, stale_after=3600):
+    """Dispatch to Celery with at most `concurrency` jobs in flight."""
+    in_flight = {}  # job_id -> (rel_path, size)
+
+    # Resume: keep waiting on jobs a previous (interrupted) Celery run queued
+    # instead of dispatching them a second time. Files left queued by a --local
+    # run never reached Celery: scan() yields them again and they are dispatched.
+    for row in manifest.in_flight("celery"):
+        in_flight[row["job_id"]] = (row["path"], row["size"] or 0)
+    resumed_paths = {rel_path for rel_path, _ in in_flight.values()}
+
+    def poll():
+        for job_id, (rel_path, size) in list(in_flight.items()):
+            job = get_job(job_id)
+            if job and job["status"] in ("SUCCESS", "FAILURE"):
+                _finish(manifest, progress, rel_path, size, job)
+                del in_flight[job_id]
+            elif _is_stale(job, stale_after):
+                # Lost (e.g. broker flushed); marked failed so the next run retries it
+                _finish(manifest, progress, rel_path, size, {"status": "FAILURE", "error": "stale job"})
+                del in_flight[job_id]
+
+    for rel_path, path, size, sha in candidates:
+        if rel_path in resumed_paths:
+            continue
+        while len(in_flight) >= concurrency:
+            poll()
+            if len(in_flight) >= concurrency:
+                time.sleep(poll_interval)
+
+        job_id = new_job_id()
+        register_job(job_id, rel_path, "static", None, size_bytes=size)
+        manifest.mark(rel_path, sha256=sha, size=size, mtime=path.stat().st_mtime,
+                      status="queued", job_id=job_id, error=None, runner="celery")
+
+        if _on_shared_volume(path):
+            # Worker reads the file in place: no base64 through the broker
+            args = (None, rel_path, "static", None)
+            kwargs = {"source_path": str(path.resolve())}
+        else:
+            args = (base64.b64encode(path.read_bytes()).decode("utf-8"), rel_path, "static", None)
+            kwargs = {}
         try:
-             # category="static", session_id=None
-            process_document.delay(file_content_b64, file_path.name, "static", None)
-            print(f"Example: Queued {file_path.name}")
+            process_document.apply_async(args=args, kwargs=kwargs, task_id=job_id)
+            in_flight[job_id] = (rel_path, size)
         except Exception as e:
-            print(f"Failed to queue {file_path.name}: {e}")
+            manifest.mark(rel_path, status="failed", error=f"dispatch: {e}")
+            progress.record(size, ok=False)
+
+    while in_flight:
+        poll()
+        if in_flight:
+            time.sleep(poll_interval)
+
+
+def run_local(root, manifest, candidates, progress, workers):
+    """Run ingestion in-process on a bounded worker pool (no Celery needed)."""
+
+    # Resume: anything left 'queued' by a previous run is not 'done', so scan()
+    # yields it again and it is simply re-ingested (idempotent upserts make that
+    # cheap and duplicate-free).
+
+    def ingest(rel_path, path, size, job_id):
+        ingest_file_logic(None, rel_path, "static", None, job_id=job_id, source_path=str(path))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for rel_path, path, size, sha in candidates:
+            while len(futures) >= workers * 2:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for f in done:
+                    _collect(manifest, progress, futures.pop(f))
+
+            job_id = new_job_id()
+            register_job(job_id, rel_path, "static", None, size_bytes=size)
+            manifest.mark(rel_path, sha256=sha, size=size, mtime=path.stat().st_mtime,
+                          status="queued", job_id=job_id, error=None, runner="local")
+            futures[pool.submit(ingest, rel_path, path, size, job_id)] = (rel_path, size, job_id)
+
+        for f in list(futures):
+            f.exception()
+            _collect(manifest, progress, futures.pop(f))
+
+
+def _collect(manifest, progress, item):
+    rel_path, size, job_id = item
+    _finish(manifest, progress, rel_path, size, get_job(job_id))
+
+
+def celery_available() -> bool:
+    url = os.getenv("REDIS_URL", "")
+    return bool(url) and "mock" not in url and not url.startswith("memory://")
+
+
+def ingest_static_files(root=STATIC_DIR, concurrency=8, local=False, workers=4, force=False):
+    """
+    Ingest all files under `root` (recursively) with category="static".
+    These files are Permanent and Shared across all sessions.
+    """
+    root = pathlib.Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest()
+
+    print(f"Scanning {root} ...")
+    # Totals from stat only; files are hashed as they are dispatched
+    total_files, total_bytes = count_pending(root, manifest, force=force)
+    print(f"Up to {total_files} new/changed files ({total_bytes / 1024 / 1024:.1f} MB) to ingest")
+
+    progress = Progress(total_files, total_bytes)
+    candidates = scan(root, manifest, force=force, on_unchanged=progress.skip)
+    if local or not celery_available():
+        print(f"Running in-process with {workers} workers")
+        run_local(root, manifest, candidates, progress, workers)
+    else:
+        print(f"Dispatching to Celery with concurrency {concurrency}")
+        run_celery(root, manifest, candidates, progress, concurrency)
+
+    progress.report(force=True)
+    print("Static ingestion complete.")
+
 
 if __name__ == "__main__":
-    ingest_static_files()
+    parser = argparse.ArgumentParser(description="Resumable bulk ingestion of the static corpus")
+    parser.add_argument("--root", default=str(STATIC_DIR), help="Directory tree to ingest")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max Celery jobs in flight")
+    parser.add_argument("--local", action="store_true", help="Run in-process instead of via Celery")
+    parser.add_argument("--workers", type=int, default=4, help="In-process worker pool size")
+    parser.add_argument("--force", action="store_true", help="Re-ingest files even if unchanged")
+    args = parser.parse_args()
+
+    ingest_static_files(
+        root=args.root,
+        concurrency=args.concurrency,
+        local=args.local,
+        workers=args.workers,
+        force=args.force,
+    )
@@ -0,0 +1,233 @@
+"""
+Reduced-vector projections (see app/core/projection.py).
+
+    # Recall loss vs. search speed and RAM saved, for candidate dimensions
+    python -m app.scripts.vector_projection report --dims 64,128,256,384
+
+    # Fit and save an artifact (prints its name, e.g. pca256-v1)
+    python -m app.scripts.vector_projection fit --method pca --dim 256
+
+    # Write projected copies of all existing points, then set VECTOR_PROJECTION
+    python -m app.scripts.vector_projection backfill pca256-v1
+
+    python -m app.scripts.vector_projection list
+
+Vectors are sampled from the full-size collection, so a corpus has to be
+ingested first. In local mode (QDRANT_LOCATION) stop the API while this runs;
+local Qdrant storage can only be opened by one process.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+# Ensure we can import from app
+sys.path.append(os.getcwd())
+
+import qdrant_client
+from qdrant_client.http import models
+
+from app.core.config import settings
+from app.core.embeddings import META_MARKER
+from app.core.projection import (
+    METHODS, fit_pca, fit_random, next_name, save_projection, load_projection, list_projections,
+    ensure_reduced_collection, reduced_collection, reduced_points,
+)
+from app.workers.vector_writer import upsert_points
+
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION_NAME", "knowledge_base")
+SCROLL_PAGE = 1000
+FLOAT_BYTES = 4
+
+# Every stored point except the embedding-model sentinel
+POINTS_FILTER = models.Filter(
+    must_not=[models.FieldCondition(key="category", match=models.MatchValue(value=META_MARKER))]
+)
+
+
+def get_client():
+    if os.getenv("QDRANT_LOCATION"):
+        return qdrant_client.QdrantClient(path=os.getenv("QDRANT_LOCATION"))
+    return qdrant_client.QdrantClient(
+        host=os.getenv("QDRANT_HOST", "localhost"), port=int(os.getenv("QDRANT_PORT", 6333))
+    )
+
+
+def scroll_points(client, limit: int = None, with_payload: bool = False):
+    """Stored points with their full-size vectors, in pages (IDs are UUIDs, so the order is effectively random)."""
+    offset, seen = None, 0
+    while True:
+        page = SCROLL_PAGE if limit is None else min(SCROLL_PAGE, limit - seen)
+        records, offset = client.scroll(
+            collection_name=QDRANT_COLLECTION,
+            scroll_filter=POINTS_FILTER,
+            limit=page,
+            offset=offset,
+            with_payload=with_payload,
+            with_vectors=True,
+        )
+        if records:
+            yield records
+        seen += len(records)
+        if offset is None or (limit is not None and seen >= limit):
+            return
+
+
+def sample_vectors(client, size: int) -> np.ndarray:
+    vectors = [r.vector for records in scroll_points(client, size) for r in records]
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def collection_size(client) -> int:
+    return client.count(collection_name=QDRANT_COLLECTION, count_filter=POINTS_FILTER, exact=False).count
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+
+
+def top_k(corpus: np.ndarray, queries: np.ndarray, k: int):
+    """Exact cosine top k (brute force) and seconds per query."""
+    started = time.perf_counter()
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    elapsed = time.perf_counter() - started
+    return top, elapsed / len(queries)
+
+
+def evaluate(sample: np.ndarray, dims, methods, query_count: int, k: int, points: int):
+    """
+    Hold out `query_count` sampled vectors as queries, fit on the rest, and
+    compare each projection's top k with the exact full-size top k.
+    """
+    queries, corpus = normalize(sample[:query_count]), normalize(sample[query_count:])
+    exact, full_seconds = top_k(corpus, queries, k)
+    full_dim = sample.shape[1]
+    rows = [{
+        "projection": f"full{full_dim}", "dim": full_dim, "recall": 1.0, "explained_variance": 1.0,
+        "search_ms": round(full_seconds * 1000, 3), "speedup": 1.0,
+        "vector_mb": round(points * full_dim * FLOAT_BYTES / 2**20, 1), "ram_saved": 0.0,
+    }]
+
+    for method in methods:
+        for dim in dims:
+            if method == "pca":
+                projection = fit_pca(corpus, dim, settings.EMBED_MODEL)
+            else:
+                projection = fit_random(full_dim, dim, settings.EMBED_MODEL)
+            reduced, seconds = top_k(projection.apply(corpus), projection.apply(queries), k)
+            hits = sum(len(set(a) & set(b)) for a, b in zip(exact, reduced))
+            rows.append({
+                "projection": f"{method}{dim}", "dim": dim,
+                "recall": round(hits / (k * len(queries)), 3),
+                "explained_variance": projection.explained_variance,
+                "search_ms": round(seconds * 1000, 3),
+                "speedup": round(full_seconds / seconds, 1) if seconds else None,
+                "vector_mb": round(points * dim * FLOAT_BYTES / 2**20, 1),
+                "ram_saved": round(1 - dim / full_dim, 3),
+            })
+    return rows
+
+
+def print_table(rows):
+    columns = list(rows[0].keys())
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def cmd_report(args):
+    client = get_client()
+    dims = sorted(int(d) for d in args.dims.split(","))
+    methods = [m.strip() for m in args.methods.split(",")]
+    sample = sample_vectors(client, args.sample + args.queries)
+    if len(sample) <= args.queries + max(dims):
+        print(f"Need more than {args.queries + max(dims)} stored vectors for this report (found {len(sample)})")
+        sys.exit(1)
+    points = collection_size(client)
+    print(f"{QDRANT_COLLECTION}: ~{points} points; fitted on {len(sample) - args.queries}, "
+          f"{args.queries} held-out queries, recall@{args.top_k} against exact full-size search")
+    print("(search_ms: brute-force scan of the sample; vector_mb: raw float32 vectors of the whole collection)")
+    rows = evaluate(sample, dims, methods, args.queries, args.top_k, points)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+
+
+def cmd_fit(args):
+    client = get_client()
+    name = next_name(args.method, args.dim)
+    if args.method == "pca":
+        sample = sample_vectors(client, args.sample)
+        if not len(sample):
+            print(f"No vectors in {QDRANT_COLLECTION}")
+            sys.exit(1)
+        projection = fit_pca(sample, args.dim, settings.EMBED_MODEL, name=name)
+    else:
+        input_dim = len(next(scroll_points(client, 1))[0].vector)
+        projection = fit_random(input_dim, args.dim, settings.EMBED_MODEL, name=name, seed=args.seed)
+    path = save_projection(projection)
+    print(json.dumps(projection.info(), indent=2))
+    print(f"Saved {path}. Next: backfill {name}, then set VECTOR_PROJECTION={name}")
+
+
+def cmd_backfill(args):
+    client = get_client()
+    projection = load_projection(args.name)
+    if projection.embed_model != settings.EMBED_MODEL:
+        print(f"{args.name} was fitted on '{projection.embed_model}' vectors, EMBED_MODEL is '{settings.EMBED_MODEL}'")
+        sys.exit(1)
+    ensure_reduced_collection(client, QDRANT_COLLECTION, projection)
+    target = reduced_collection(QDRANT_COLLECTION, projection)
+    written = 0
+    for records in scroll_points(client, with_payload=True):
+        points = [models.PointStruct(id=r.id, vector=r.vector, payload=r.payload) for r in records]
+        upsert_points(client, target, reduced_points(points, projection),
+                      batch_size=settings.UPSERT_BATCH_SIZE, parallel=settings.UPSERT_PARALLEL)
+        written += len(points)
+        print(f"  {written} points")
+    print(f"Backfilled {written} points into {target}")
+
+
+def cmd_list(args):
+    print(json.dumps(list_projections(), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit, evaluate and backfill reduced-vector projections")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="Recall loss vs. speed and RAM saved per target dimension")
+    report.add_argument("--dims", default="64,128,256,384")
+    report.add_argument("--methods", default="pca,random", help=f"Comma-separated: {', '.join(METHODS)}")
+    report.add_argument("--sample", type=int, default=20000, help="Vectors to fit on")
+    report.add_argument("--queries", type=int, default=500, help="Held-out vectors used as queries")
+    report.add_argument("--top-k", type=int, default=10)
+    report.add_argument("--json", action="store_true")
+    report.set_defaults(func=cmd_report)
+
+    fit = commands.add_parser("fit", help="Fit and save a versioned projection artifact")
+    fit.add_argument("--method", choices=METHODS, default="pca")
+    fit.add_argument("--dim", type=int, default=256)
+    fit.add_argument("--sample", type=int, default=20000)
+    fit.add_argument("--seed", type=int, default=0, help="Random projections only")
+    fit.set_defaults(func=cmd_fit)
+
+    backfill = commands.add_parser("backfill", help="Project existing points into the companion collection")
+    backfill.add_argument("name", help="Projection artifact, e.g. pca256-v1")
+    backfill.set_defaults(func=cmd_backfill)
+
+    listing = commands.add_parser("list", help="Saved projection artifacts")
+    listing.set_defaults(func=cmd_list)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
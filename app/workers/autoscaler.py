@@ -0,0 +1,321 @@
+"""
+Queue-depth driven autoscaler for the Celery ingestion workers.
+
+Every AUTOSCALE_INTERVAL_SECONDS it reads the broker queue depth, the bytes
+queued for ingestion (admission tickets) and the measured per-worker
+throughput (admission EWMA), works out how many worker processes drain the
+backlog within AUTOSCALE_TARGET_DRAIN_SECONDS, and grows or shrinks the
+workers' prefork pools (Celery pool_grow / pool_shrink) within
+[AUTOSCALE_MIN_WORKERS, AUTOSCALE_MAX_WORKERS].
+
+New processes need AUTOSCALE_WARMUP_SECONDS to load the embedding model, so:
+processes still warming up count as capacity already on its way, no worker is
+added for a backlog that drains before it would be warm, and nothing is
+removed while processes are warming or until the backlog has been low for
+AUTOSCALE_SCALE_DOWN_DELAY seconds.
+
+Bulk static ingestion and fan-out subtasks are queued without an admission
+ticket: every queued task beyond the admitted jobs counts as one mean job
+(an EWMA of the admitted jobs' sizes, AUTOSCALE_DEFAULT_JOB_BYTES until one
+has been seen).
+
+Every decision is recorded (latest, recent history, counters) and served by
+GET /api/v1/admin/autoscaler.
+
+    python -m app.workers.autoscaler
+"""
+import json
+import math
+import time
+import logging
+from collections import deque
+
+from app.core.config import settings
+
+HISTORY_SIZE = 100
+# Celery's Redis transport keeps one list per priority step: "celery", "celery\x06\x163", ...
+PRIORITY_STEPS = (0, 3, 6, 9)
+PRIORITY_SEP = "\x06\x16"
+
+
+def queue_keys(queue: str):
+    return [queue if step == 0 else f"{queue}{PRIORITY_SEP}{step}" for step in PRIORITY_STEPS]
+
+
+# --- Inputs ---
+
+class LocalQueueProbe:
+    """In-memory broker stand-in (tests, dry runs): depth and bytes are set by the caller."""
+
+    def __init__(self, depth: int = 0, queued_bytes: int = 0, throughput: float = None, queued_jobs: int = None):
+        self.depth = depth
+        self.queued_bytes = queued_bytes
+        self.throughput = throughput or settings.ADMISSION_DEFAULT_THROUGHPUT
+        self.queued_jobs = queued_jobs  # Admitted jobs; None = every queued task has a ticket if bytes are set
+
+    def read(self) -> dict:
+        jobs = self.queued_jobs if self.queued_jobs is not None else (self.depth if self.queued_bytes else 0)
+        return {
+            "queue_depth": self.depth,
+            "queued_bytes": self.queued_bytes,
+            "queued_jobs": jobs,
+            "throughput": self.throughput,
+        }
+
+
+class RedisQueueProbe:
+    """Reads the Celery queue in Redis and the admission tickets/throughput."""
+
+    def __init__(self, redis_client, queue: str):
+        from app.core.admission import AdmissionController, RedisAdmissionStore
+
+        self.r = redis_client
+        self.queue = queue
+        self.admission = AdmissionController(RedisAdmissionStore(redis_client))
+
+    def read(self) -> dict:
+        depth = sum(self.r.llen(key) for key in queue_keys(self.queue))
+        snap = self.admission.snapshot()
+        return {
+            "queue_depth": depth,
+            "queued_bytes": snap["global"]["bytes"],
+            "queued_jobs": snap["global"]["jobs"],
+            "throughput": snap["throughput_bytes_per_s"],
+        }
+
+
+# --- Actuators ---
+
+class LocalPool:
+    """Pool stand-in for tests: a process counter."""
+
+    def __init__(self, processes: int = 1):
+        self.processes = processes
+
+    def size(self) -> int:
+        return self.processes
+
+    def grow(self, n: int) -> int:
+        self.processes += n
+        return n
+
+    def shrink(self, n: int) -> int:
+        self.processes -= n
+        return n
+
+
+class CeleryPool:
+    """Prefork pools of the running Celery workers, resized through remote control."""
+
+    def __init__(self, app, timeout: float = 2.0):
+        self.app = app
+        self.timeout = timeout
+
+    def _pools(self) -> dict:
+        stats = self.app.control.inspect(timeout=self.timeout).stats() or {}
+        return {name: len(s.get("pool", {}).get("processes", [])) for name, s in stats.items()}
+
+    def size(self) -> int:
+        return sum(self._pools().values())
+
+    def grow(self, n: int) -> int:
+        # One process at a time on the smallest pool, so several worker containers stay balanced
+        pools = self._pools()
+        if not pools:
+            return 0
+        for _ in range(n):
+            name = min(pools, key=pools.get)
+            self.app.control.pool_grow(1, destination=[name])
+            pools[name] += 1
+        return n
+
+    def shrink(self, n: int) -> int:
+        pools = self._pools()
+        removed = 0
+        for _ in range(n):
+            name = max(pools, key=pools.get, default=None)
+            if name is None or pools[name] <= 1:
+                break  # A worker keeps at least one process
+            self.app.control.pool_shrink(1, destination=[name])
+            pools[name] -= 1
+            removed += 1
+        return removed
+
+
+# --- Decision metrics ---
+
+class LocalMetricsStore:
+    def __init__(self):
+        self.latest = None
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.counters = {}
+
+    def record(self, decision: dict):
+        self.latest = decision
+        self.history.appendleft(decision)
+        self.counters[decision["action"]] = self.counters.get(decision["action"], 0) + 1
+
+    def report(self) -> dict:
+        return {"latest": self.latest, "history": list(self.history), "counters": dict(self.counters)}
+
+
+class RedisMetricsStore:
+    LATEST_KEY = "autoscaler:latest"
+    HISTORY_KEY = "autoscaler:history"
+    COUNTERS_KEY = "autoscaler:counters"
+
+    def __init__(self, redis_client):
+        self.r = redis_client
+
+    def record(self, decision: dict):
+        raw = json.dumps(decision)
+        pipe = self.r.pipeline()
+        pipe.set(self.LATEST_KEY, raw)
+        pipe.lpush(self.HISTORY_KEY, raw)
+        pipe.ltrim(self.HISTORY_KEY, 0, HISTORY_SIZE - 1)
+        pipe.hincrby(self.COUNTERS_KEY, decision["action"], 1)
+        pipe.execute()
+
+    def report(self) -> dict:
+        latest = self.r.get(self.LATEST_KEY)
+        counters = self.r.hgetall(self.COUNTERS_KEY)
+        return {
+            "latest": json.loads(latest) if latest else None,
+            "history": [json.loads(x) for x in self.r.lrange(self.HISTORY_KEY, 0, HISTORY_SIZE - 1)],
+            "counters": {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in counters.items()},
+        }
+
+
+# --- Controller ---
+
+class Autoscaler:
+    def __init__(self, probe, pool, metrics, clock=time.time, smoothing: float = 0.3):
+        self.probe = probe
+        self.pool = pool
+        self.metrics = metrics
+        self.clock = clock
+        self.smoothing = smoothing
+        self.job_bytes = None    # Mean size of an admitted job (EWMA)
+        self._started = []       # Start times of processes this controller added
+        self._low_since = None   # When the backlog first needed fewer workers than we have
+
+    def warming(self, now: float) -> int:
+        self._started = [t for t in self._started if now - t < settings.AUTOSCALE_WARMUP_SECONDS]
+        return len(self._started)
+
+    def backlog_bytes(self, depth: int, queued_bytes: float, queued_jobs: int) -> float:
+        """Admitted bytes plus one mean job for every queued task without an admission ticket."""
+        if queued_jobs and queued_bytes:
+            sample = queued_bytes / queued_jobs
+            self.job_bytes = sample if self.job_bytes is None else (
+                self.smoothing * sample + (1 - self.smoothing) * self.job_bytes)
+        unticketed = max(depth - (queued_jobs or 0), 0)
+        return queued_bytes + unticketed * (self.job_bytes or settings.AUTOSCALE_DEFAULT_JOB_BYTES)
+
+    def desired(self, depth: int, backlog_bytes: float, throughput: float, workers: int) -> int:
+        """Processes that drain the backlog within the target time, within the bounds."""
+        if depth == 0 and backlog_bytes == 0:
+            wanted = 0
+        else:
+            wanted = math.ceil(backlog_bytes / (throughput * settings.AUTOSCALE_TARGET_DRAIN_SECONDS))
+            # At least one process while tasks wait; no more than tasks can keep busy
+            wanted = min(max(wanted, 1 if depth else 0), depth + workers)
+        return max(settings.AUTOSCALE_MIN_WORKERS, min(settings.AUTOSCALE_MAX_WORKERS, wanted))
+
+    def step(self) -> dict:
+        now = self.clock()
+        reading = self.probe.read()
+        depth, queued_bytes = reading["queue_depth"], reading["queued_bytes"]
+        throughput = max(reading["throughput"] or settings.ADMISSION_DEFAULT_THROUGHPUT, 1.0)
+        backlog = self.backlog_bytes(depth, queued_bytes, reading.get("queued_jobs", 0))
+        workers = self.pool.size()
+        warming = min(self.warming(now), workers)
+        desired = self.desired(depth, backlog, throughput, workers)
+
+        action, reason = "hold", "at target"
+        if desired > workers:
+            self._low_since = None
+            ready = max(workers - warming, 1)
+            drain_seconds = backlog / (ready * throughput)
+            if drain_seconds <= settings.AUTOSCALE_WARMUP_SECONDS and workers >= 1:
+                reason = f"backlog drains in {drain_seconds:.0f}s, before a new process is warm"
+            else:
+                added = self.pool.grow(desired - workers)
+                self._started.extend([now] * added)
+                action, reason = "scale_up", f"drain {drain_seconds:.0f}s with {ready} ready"
+        elif desired < workers:
+            if warming:
+                self._low_since = None
+                reason = f"{warming} process(es) still warming up"
+            else:
+                self._low_since = self._low_since or now
+                low_for = now - self._low_since
+                if low_for >= settings.AUTOSCALE_SCALE_DOWN_DELAY:
+                    self.pool.shrink(workers - desired)
+                    self._low_since = None
+                    action, reason = "scale_down", f"backlog low for {low_for:.0f}s"
+                else:
+                    reason = f"backlog low for {low_for:.0f}s of {settings.AUTOSCALE_SCALE_DOWN_DELAY}s"
+        else:
+            self._low_since = None
+
+        decision = {
+            "timestamp": now,
+            "queue_depth": depth,
+            "queued_bytes": queued_bytes,
+            "backlog_bytes": round(backlog),
+            "throughput_bytes_per_s": round(throughput, 1),
+            "workers": workers,
+            "warming": warming,
+            "desired": desired,
+            "action": action,
+            "reason": reason,
+        }
+        try:
+            self.metrics.record(decision)
+        except Exception as e:
+            logging.warning(f"Autoscaler: could not record decision: {e}")
+        if action != "hold":
+            logging.info(f"Autoscaler: {action} {workers} -> {desired} ({reason})")
+        return decision
+
+    def run(self):
+        while True:
+            try:
+                self.step()
+            except Exception as e:
+                logging.error(f"Autoscaler step failed: {e}", exc_info=True)
+            time.sleep(settings.AUTOSCALE_INTERVAL_SECONDS)
+
+
+def get_metrics_store():
+    """Redis-backed in Celery mode, in-process otherwise (nothing to scale in local mode)."""
+    if "mock" not in settings.REDIS_URL:
+        try:
+            import redis
+            return RedisMetricsStore(redis.from_url(settings.REDIS_URL))
+        except Exception:
+            pass
+    return LocalMetricsStore()
+
+
+def main():
+    import redis
+    from app.workers.celery_app import celery_app
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    r = redis.from_url(settings.REDIS_URL)
+    scaler = Autoscaler(
+        RedisQueueProbe(r, settings.AUTOSCALE_QUEUE),
+        CeleryPool(celery_app),
+        RedisMetricsStore(r),
+    )
+    logging.info(
+        f"Autoscaler: {settings.AUTOSCALE_MIN_WORKERS}-{settings.AUTOSCALE_MAX_WORKERS} processes, "
+        f"target drain {settings.AUTOSCALE_TARGET_DRAIN_SECONDS}s, warm-up {settings.AUTOSCALE_WARMUP_SECONDS}s"
+    )
+    scaler.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Document catalog: one row per stored file in the documents table (size, hash,
+page and chunk counts, ingestion status, timestamps), so listing documents is
+an indexed query instead of a walk over data/static and every upload directory.
+
+Ingestion writes the entries (queued -> processing -> ready | failed |
+cancelled); deleting a session marks its files "unindexed"; the session
+cleanup removes entries of deleted files and, through reconcile(), adds
+files stored before the catalog existed.
+"""
+import os
+import pathlib
+from datetime import datetime
+
+from app.db import save_document, get_document_paths, delete_documents
+
+STATIC_SESSION = "static"
+
+
+def data_dir() -> pathlib.Path:
+    return pathlib.Path(os.getcwd()) / "data"
+
+
+def catalog_session(session_id: str = None) -> str:
+    """Catalog key of a file: its session, or "static" for the permanent library."""
+    return session_id or STATIC_SESSION
+
+
+def record(session_id: str, filename: str, **fields):
+    save_document(catalog_session(session_id), filename, **fields)
+
+
+def stored_files(root: pathlib.Path = None):
+    """(session_id, path) of every file under data/static and data/uploads/<session>."""
+    root = root or data_dir()
+    static_dir = root / "static"
+    if static_dir.exists():
+        for path in static_dir.iterdir():
+            if path.is_file():
+                yield STATIC_SESSION, path
+    uploads_dir = root / "uploads"
+    if uploads_dir.exists():
+        for session_dir in uploads_dir.iterdir():
+            if session_dir.is_dir():
+                for path in session_dir.iterdir():
+                    if path.is_file():
+                        yield session_dir.name, path
+
+
+def reconcile(root: pathlib.Path = None, only_if_empty: bool = False) -> tuple:
+    """
+    Bring the catalog in line with the disk: add files it does not know (stored
+    before the catalog existed; status "ready") and drop entries whose file is
+    gone. Returns (added, removed).
+    """
+    known = get_document_paths()
+    if only_if_empty and known:
+        return 0, 0
+    added = 0
+    seen = set()
+    for session_id, path in stored_files(root):
+        resolved = str(path.resolve())
+        seen.add(resolved)
+        if resolved in known:
+            continue
+        stat = path.stat()
+        save_document(
+            session_id, path.name,
+            category=STATIC_SESSION if session_id == STATIC_SESSION else "user",
+            path=resolved,
+            size_bytes=stat.st_size,
+            status="ready",
+            created_at=datetime.utcfromtimestamp(stat.st_mtime).isoformat(),
+        )
+        added += 1
+
+    removed = 0
+    for path, (session_id, filename) in known.items():
+        if path and path not in seen and not os.path.exists(path):
+            delete_documents(session_id, filename)
+            removed += 1
+    return added, removed
@@ -8,7 +8,8 @@ REDIS_URL = os.getenv("REDIS_URL", DEFAULT_BROKER)
 celery_app = Celery(
     "worker",
     broker=REDIS_URL,
-    backend="rpc://",
+    # Fan-out of large documents (chords) needs a Redis result backend
+    backend=os.getenv("CELERY_RESULT_BACKEND", "rpc://"),
     include=["app.workers.tasks"]
 )
 
@@ -18,6 +19,9 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    # Ingestion tasks are long: don't hoard queued tasks in idle processes, so the
+    # queue depth seen by the autoscaler is the real backlog
+    worker_prefetch_multiplier=1,
 )
 
 from celery.schedules import crontab
@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+import pathlib
+import threading
+from datetime import datetime
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def checkpoint_dir() -> pathlib.Path:
+    return pathlib.Path(os.getcwd()) / "data" / "checkpoints"
+
+
+def file_sha256(path) -> str:
+    """Hash a file in fixed-size blocks (never loads the whole file)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+_hash_memo = {}
+_hash_memo_lock = threading.Lock()
+HASH_MEMO_SIZE = 1024
+
+
+def cached_file_sha256(path) -> str:
+    """file_sha256 memoized on (path, size, mtime): computed once per file version and process."""
+    stat = os.stat(path)
+    ident = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _hash_memo_lock:
+        if ident in _hash_memo:
+            return _hash_memo[ident]
+    digest = file_sha256(path)
+    with _hash_memo_lock:
+        if len(_hash_memo) >= HASH_MEMO_SIZE:
+            _hash_memo.pop(next(iter(_hash_memo)))
+        _hash_memo[ident] = digest
+    return digest
+
+
+class IngestionCheckpoint:
+    """
+    Progress marker for windowed ingestion of one document (or one page range of it).
+
+    After every completed page window (extract -> chunk -> embed -> upsert) the
+    window and the IDs it wrote are appended as one line to a JSONL log headed by
+    the file hash and window size, so a commit costs one window, not the whole
+    document. A torn last line (crash mid-write) is ignored on load and the next
+    commit rewrites the log. A retry skips completed windows; windows may
+    complete out of order (parallel workers). The checkpoint is discarded if the
+    file contents or window size changed in between.
+    `scope` separates page-range subtasks that run concurrently on different workers.
+    """
+
+    def __init__(self, session_id, filename: str, file_path, window_pages: int, scope: str = ""):
+        key = hashlib.sha1(f"{session_id or ''}|{filename}|{scope}".encode("utf-8")).hexdigest()
+        self.path = checkpoint_dir() / f"{key}.jsonl"
+        self.window_pages = window_pages
+        self.file_hash = file_sha256(file_path)
+        self.done = {}  # "start-end" -> point IDs
+        self._lock = threading.Lock()
+
+        header, windows, torn = self._load()
+        if header and header.get("file_hash") == self.file_hash and header.get("window_pages") == window_pages:
+            self.done = windows
+        self._intact = bool(self.done) and not torn  # Whether the next commit can append to the log
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.done)
+
+    @property
+    def pages_done(self) -> int:
+        return sum(int(e) - int(s) for s, e in (k.split("-") for k in self.done))
+
+    @property
+    def point_ids(self):
+        return [i for ids in self.done.values() for i in ids]
+
+    def windows(self, start_page: int, end_page: int):
+        """Yield the (start, end) page windows of [start_page, end_page) still to be processed."""
+        for start in range(start_page, end_page, self.window_pages):
+            end = min(start + self.window_pages, end_page)
+            if f"{start}-{end}" not in self.done:
+                yield start, end
+
+    def commit(self, start_page: int, end_page: int, point_ids):
+        window, ids = f"{start_page}-{end_page}", [str(i) for i in point_ids]
+        with self._lock:
+            self.done[window] = ids
+            if self._intact:
+                self._append(window, ids)
+            else:
+                self._rewrite()
+
+    def clear(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _load(self):
+        """(header, {window: point IDs}, torn) of the log; (None, {}, False) if there is none."""
+        header, windows, torn = None, {}, False
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        torn = True  # Everything before the torn write is intact
+                        break
+                    if header is None:
+                        header = entry
+                    else:
+                        windows[entry["window"]] = entry["ids"]
+        except FileNotFoundError:
+            pass
+        return header, windows, torn
+
+    def _append(self, window: str, ids):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"window": window, "ids": ids}) + "\n")
+
+    def _rewrite(self):
+        """Start the log over (new, changed or torn) with every completed window, atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            f.write(json.dumps({
+                "file_hash": self.file_hash,
+                "window_pages": self.window_pages,
+                "started_at": datetime.utcnow().isoformat(),
+            }) + "\n")
+            for window, ids in self.done.items():
+                f.write(json.dumps({"window": window, "ids": ids}) + "\n")
+        os.replace(tmp, self.path)
+        self._intact = True
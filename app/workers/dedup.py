@@ -0,0 +1,137 @@
+"""
+Corpus-wide near-duplicate chunk detection (MinHash + LSH).
+
+Every chunk gets a MinHash signature over its word shingles. Signatures are
+split into bands; chunks sharing a band bucket are candidates, and a candidate
+whose estimated Jaccard similarity reaches DEDUP_THRESHOLD is a duplicate.
+The index lives in SQLite (see the dedup helpers in app.db) so it persists
+across runs and is shared by all workers. Only chunks of other documents in
+the static library count as duplicates: session uploads can be shared with
+other sessions as a whole (app.workers.file_sharing), so they keep every chunk.
+"""
+import os
+import re
+import random
+import hashlib
+from array import array
+
+from app.core.config import settings
+from app.db import init_db, find_dedup_candidates, save_dedup_chunks
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # 16 x 4: candidates from ~0.5 similarity, verified against the threshold
+SHINGLE_WORDS = 5
+MIN_WORDS = 8             # Shorter chunks (titles, captions) are never treated as duplicates
+STATIC_CORPUS = "static"  # The only deduplicated corpus
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_WORD_RE = re.compile(r"\w+")
+
+_db_ready = False
+
+
+def _hash64(data: str) -> int:
+    return int.from_bytes(hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingles(text: str):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return set()
+    return {_hash64(" ".join(words[i:i + SHINGLE_WORDS])) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(text: str):
+    """MinHash signature (NUM_PERM ints) of a text, or None if it is too short."""
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(signature):
+    """(band, bucket) LSH keys of a signature."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        keys.append((band, hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()))
+    return keys
+
+
+def similarity(sig_a, sig_b) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+def pack(signature) -> bytes:
+    return array("Q", signature).tobytes()
+
+
+def unpack(blob: bytes):
+    return array("Q", blob).tolist()
+
+
+def document_version(file_path) -> str:
+    """Identifies the ingested copy of a file; index entries of older copies are pruned."""
+    stat = os.stat(file_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def filter_duplicates(nodes, category: str, session_id, filename: str, file_path):
+    """
+    Drop nodes that near-duplicate a canonical chunk of another document in the
+    static library, and record all nodes in the index. Nodes must already carry
+    their point IDs. Returns (kept_nodes, duplicate_count).
+    Session uploads are returned unchanged: a session attaching an identical
+    file gets only that file's points, not the canonical chunks of the
+    uploader's other documents.
+    """
+    global _db_ready
+    if category != "static":
+        return nodes, 0
+    if not _db_ready:
+        init_db()
+        _db_ready = True
+
+    signatures = [minhash(node.get_content()) for node in nodes]
+    keys = [band_keys(sig) if sig else [] for sig in signatures]
+    candidates = find_dedup_candidates(STATIC_CORPUS, [k for node_keys in keys for k in node_keys])
+    candidates = {
+        point_id: {**c, "signature": unpack(c["signature"])}
+        for point_id, c in candidates.items()
+        if not (c["filename"] == filename and c["session_id"] == (session_id or ""))
+    }
+    buckets = {}
+    for point_id, c in candidates.items():
+        for key in band_keys(c["signature"]):
+            buckets.setdefault(key, []).append(point_id)
+
+    kept, records = [], []
+    for node, sig, node_keys in zip(nodes, signatures, keys):
+        canonical_id = None
+        if sig:
+            best = 0.0
+            for key in node_keys:
+                for point_id in buckets.get(key, ()):
+                    score = similarity(sig, candidates[point_id]["signature"])
+                    if score >= settings.DEDUP_THRESHOLD and score > best:
+                        best, canonical_id = score, point_id
+        if canonical_id is None:
+            kept.append(node)
+        if sig:
+            records.append({
+                "point_id": node.id_,
+                "session_id": session_id or "",
+                "filename": filename,
+                "page_label": node.metadata.get("page_label", "1"),
+                "signature": pack(sig),
+                "canonical_id": canonical_id,
+                "band_keys": node_keys,
+            })
+
+    if records:
+        save_dedup_chunks(STATIC_CORPUS, document_version(file_path), records)
+    return kept, len(nodes) - len(kept)
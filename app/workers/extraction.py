@@ -0,0 +1,155 @@
+import os
+import re
+import json
+import math
+import hashlib
+import pathlib
+
+# Blocks whose box lies entirely inside the top/bottom band are header/footer candidates
+MARGIN_RATIO = 0.08
+# Pages sampled (evenly spread) to learn a document's repeated header/footer lines
+SAMPLE_PAGES = 60
+# A margin line is boilerplate if it recurs on at least this share of sampled pages
+REPEAT_RATIO = 0.5
+
+PAGE_NUMBER_RE = re.compile(
+    r"^(page|pg\.?|p\.)?\s*[-–—(\[]*\s*\d+\s*[)\]]*\s*((/|of)\s*\d+)?\s*[-–—]*$",
+    re.IGNORECASE,
+)
+DIGITS_RE = re.compile(r"\d+")
+SPACES_RE = re.compile(r"\s+")
+HYPHEN_BREAK_RE = re.compile(r"(\w)-\n(\w)")
+
+_boilerplate_cache = {}
+
+
+def normalize_line(text: str) -> str:
+    """Normalize for repeat detection: case, whitespace and numbers (page/date counters) ignored."""
+    return SPACES_RE.sub(" ", DIGITS_RE.sub("#", text.lower())).strip()
+
+
+def _text_blocks(page):
+    """(x0, y0, x1, y1, text) of the page's text blocks, in reading order."""
+    return [b[:5] for b in page.get_text("blocks", sort=True) if b[6] == 0 and b[4].strip()]
+
+
+def _in_margin(block, height: float) -> bool:
+    _, y0, _, y1, _ = block
+    return y1 <= height * MARGIN_RATIO or y0 >= height * (1 - MARGIN_RATIO)
+
+
+def detect_boilerplate(doc) -> set:
+    """Normalized header/footer lines that repeat across the document's pages."""
+    total = doc.page_count
+    if total < 3:
+        return set()
+
+    step = max(1, total // SAMPLE_PAGES)
+    sampled = range(0, total, step)
+    counts = {}
+    for page_no in sampled:
+        page = doc[page_no]
+        height = page.rect.height
+        seen = set()
+        for block in _text_blocks(page):
+            if not _in_margin(block, height):
+                continue
+            for line in block[4].splitlines():
+                norm = normalize_line(line)
+                if norm:
+                    seen.add(norm)
+        for norm in seen:
+            counts[norm] = counts.get(norm, 0) + 1
+
+    threshold = max(3, math.ceil(len(sampled) * REPEAT_RATIO))
+    return {line for line, n in counts.items() if n >= threshold}
+
+
+def get_boilerplate(doc, file_path) -> set:
+    """
+    detect_boilerplate, cached per file version (path, size, mtime) in memory and on disk,
+    so every window / page-range subtask of a document agrees on the same set.
+    """
+    stat = os.stat(file_path)
+    key = hashlib.sha1(f"{pathlib.Path(file_path).resolve()}|{stat.st_size}|{stat.st_mtime}".encode()).hexdigest()
+    if key in _boilerplate_cache:
+        return _boilerplate_cache[key]
+
+    cache_path = pathlib.Path(os.getcwd()) / "data" / "layout_cache" / f"{key}.json"
+    try:
+        with open(cache_path) as f:
+            lines = set(json.load(f))
+    except (FileNotFoundError, ValueError):
+        lines = detect_boilerplate(doc)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(sorted(lines), f)
+        os.replace(tmp, cache_path)
+
+    _boilerplate_cache[key] = lines
+    return lines
+
+
+def clean_page(page, boilerplate: set):
+    """
+    Text blocks of a page with repeated headers/footers and page numbers removed.
+    Returns (blocks, removed_line_count). Each block is one paragraph of text.
+    """
+    height = page.rect.height
+    blocks = []
+    removed = 0
+    for block in _text_blocks(page):
+        text = block[4]
+        if _in_margin(block, height):
+            kept = []
+            for line in text.splitlines():
+                stripped = line.strip()
+                if normalize_line(line) in boilerplate or PAGE_NUMBER_RE.match(stripped):
+                    removed += 1
+                else:
+                    kept.append(line)
+            text = "\n".join(kept)
+        text = HYPHEN_BREAK_RE.sub(r"\1\2", text)
+        text = SPACES_RE.sub(" ", text).strip()
+        if text:
+            blocks.append(text)
+    return blocks, removed
+
+
+def split_paragraphs(text: str):
+    """Paragraph blocks of a plain-text/markdown file (blank-line separated)."""
+    return [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def pack_blocks(blocks, max_chars: int, split_long):
+    """
+    Greedily pack consecutive blocks into chunks of at most max_chars, never
+    cutting inside a block. Blocks longer than max_chars are split with split_long.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for block in blocks:
+        if len(block) > max_chars:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            chunks.extend(part for part in split_long(block) if part.strip())
+            continue
+        if current and size + len(block) + 2 > max_chars:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(block)
+        size += len(block) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def naive_chunk_estimate(raw_text: str, chunk_size: int, chunk_overlap: int) -> int:
+    """Chunks the plain get_text() + SentenceSplitter path would have produced (~4 chars/token)."""
+    tokens = len(raw_text) / 4
+    if tokens <= 0:
+        return 1 if raw_text else 0
+    return max(1, math.ceil(max(tokens - chunk_overlap, 1) / max(chunk_size - chunk_overlap, 1)))
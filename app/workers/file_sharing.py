@@ -0,0 +1,115 @@
+"""
+File-level dedup of user uploads across sessions.
+
+Points of an ingested upload carry `file_hash` and `allowed_sessions` payloads.
+When another session uploads a byte-identical file, it is added to
+`allowed_sessions` of the existing points instead of re-embedding. From then on
+the points are owned by `shared:<hash>` (payload session_id), so per-session
+prune/delete filters never touch them; sessions leave through release_session,
+which keeps the reference counts in SQLite and deletes the points with the last
+reference. Payload updates and deletes also go to the reduced-vector collection
+when VECTOR_PROJECTION is set.
+
+Shared points keep the first uploader's filename. Each reference records the
+name its session uploaded the file under; query sources are shown under that
+name (app.db.get_shared_filenames), which is also where the session's copy is
+stored (data/uploads/<session>/<filename>).
+"""
+import logging
+
+from qdrant_client.http import models
+
+from app.core.projection import vector_collections
+from app.db import (
+    get_shared_file, register_shared_file, add_shared_ref, remove_shared_ref,
+    set_shared_owner, get_session_shared_files,
+)
+
+
+def _set_payload(client, collection_name: str, payload: dict, points):
+    for name in vector_collections(collection_name):
+        client.set_payload(collection_name=name, payload=payload, points=points, wait=True)
+
+
+def shared_owner(file_hash: str) -> str:
+    return f"shared:{file_hash}"
+
+
+def _points_filter(file_hash: str, owner: str) -> models.Filter:
+    # The owner condition leaves private copies of the same file (ingested concurrently) alone
+    return models.Filter(
+        must=[
+            models.FieldCondition(key="file_hash", match=models.MatchValue(value=file_hash)),
+            models.FieldCondition(key="session_id", match=models.MatchValue(value=owner)),
+        ]
+    )
+
+
+def register_upload(client, collection_name: str, file_hash: str, session_id: str, filename: str, point_count: int):
+    """Tag a freshly ingested upload's points so later identical uploads can share them."""
+    _set_payload(
+        client, collection_name,
+        {"file_hash": file_hash, "allowed_sessions": [session_id]},
+        models.Filter(
+            must=[
+                models.FieldCondition(key="session_id", match=models.MatchValue(value=session_id)),
+                models.FieldCondition(key="filename", match=models.MatchValue(value=filename)),
+            ]
+        ),
+    )
+    register_shared_file(file_hash, session_id, filename, session_id, point_count)
+    # A new version of a file this session already had replaces the old reference
+    for old in get_session_shared_files(session_id, filename):
+        if old["file_hash"] != file_hash:
+            _release(client, collection_name, old, session_id)
+
+
+def attach_session(client, collection_name: str, file_hash: str, session_id: str, filename: str):
+    """
+    Give `session_id` access to the existing points of an identical file.
+    Returns the shared file record, or None if the file has not been ingested yet.
+    """
+    shared = get_shared_file(file_hash)
+    if not shared:
+        return None
+
+    sessions = add_shared_ref(file_hash, session_id, filename)
+    owner = shared["owner"]
+    if owner != shared_owner(file_hash):
+        _set_payload(client, collection_name, {"session_id": shared_owner(file_hash)},
+                     _points_filter(file_hash, owner))
+        owner = shared_owner(file_hash)
+        set_shared_owner(file_hash, owner)
+
+    _set_payload(client, collection_name, {"allowed_sessions": sessions}, _points_filter(file_hash, owner))
+    logging.info(f"Shared {filename} ({file_hash[:12]}) with session {session_id}: {len(sessions)} references")
+    return shared
+
+
+def release_session(client, collection_name: str, session_id: str):
+    """
+    Drop a session's references to shared files: its ID is removed from
+    allowed_sessions, and points whose last reference goes are deleted.
+    The session's private points are left to the caller's session_id delete.
+    """
+    released = 0
+    for shared in get_session_shared_files(session_id):
+        _release(client, collection_name, shared, session_id)
+        released += 1
+    return released
+
+
+def _release(client, collection_name: str, shared: dict, session_id: str):
+    file_hash = shared["file_hash"]
+    remaining = remove_shared_ref(file_hash, session_id)
+    selector = _points_filter(file_hash, shared["owner"])
+    if remaining:
+        _set_payload(client, collection_name, {"allowed_sessions": remaining}, selector)
+    else:
+        for name in vector_collections(collection_name):
+            client.delete(
+                collection_name=name,
+                points_selector=models.FilterSelector(filter=selector),
+                wait=True,
+            )
+    logging.info(f"Released {shared['filename']} for session {session_id}: {len(remaining)} references left")
@@ -0,0 +1,127 @@
+import time
+import uuid
+from datetime import datetime
+
+from app.db import init_db, save_job, get_job, increment_job
+from app.core.notifications import publish_job_event
+from app.workers import catalog
+
+# Stages reported while a job runs (in order)
+STAGES = ("queued", "saving", "extracting", "embedding", "writing", "verifying", "done")
+
+# Counter updates are written at most this often; stage/status changes are always written.
+FLUSH_INTERVAL_SECONDS = 0.5
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled (status REVOKED)."""
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def cancel_job(job_id: str):
+    """Mark a job as cancelled. Running jobs stop at their next cancellation point."""
+    save_job(job_id, status="REVOKED", stage="cancelled", finished_at=datetime.utcnow().isoformat())
+    publish_job_event(job_id)
+
+
+def register_job(job_id: str, filename: str, category: str, session_id: str = None, size_bytes: int = 0,
+                 lane: str = "queue"):
+    """Record a freshly queued ingestion job ("queue" lane, or "fast" for inline ingestion)."""
+    init_db()
+    save_job(
+        job_id,
+        session_id=session_id or "",
+        filename=filename,
+        category=category,
+        status="PENDING",
+        stage="queued",
+        size_bytes=size_bytes,
+        lane=lane,
+    )
+    catalog.record(session_id, filename, category=category, size_bytes=size_bytes, status="queued",
+                   error=None, job_id=job_id)
+    publish_job_event(job_id)
+
+
+class JobTracker:
+    """
+    Progress reporter for one ingestion job.
+    Used by ingest_file_logic (Celery and local modes alike); persists to the job registry.
+    Counter updates are buffered and applied as atomic increments, so several
+    workers (page-range subtasks, worker processes) can report on the same job.
+    Every persisted change is also pushed to the session's event stream.
+    A tracker created without a job_id is a no-op.
+    """
+
+    def __init__(self, job_id: str = None):
+        self.job_id = job_id
+        self._pending = {}
+        self._last_flush = 0.0
+
+    def start(self, **fields):
+        if not self.job_id:
+            return
+        existing = get_job(self.job_id) or {}
+        if existing.get("status") == "REVOKED":
+            raise JobCancelled(self.job_id)
+        save_job(
+            self.job_id,
+            status="STARTED",
+            stage="saving",
+            started_at=existing.get("started_at") or datetime.utcnow().isoformat(),
+            error=None,
+            **fields,
+        )
+
+    def stage(self, name: str):
+        self.flush()
+        self._save(stage=name)
+
+    def add(self, **increments):
+        for key, value in increments.items():
+            self._pending[key] = self._pending.get(key, 0) + value
+        if time.time() - self._last_flush >= FLUSH_INTERVAL_SECONDS:
+            self.flush()
+
+    def set(self, **values):
+        """Overwrite counters with absolute values (e.g. when resuming from a checkpoint)."""
+        for key in values:
+            self._pending.pop(key, None)
+        self._save(**values)
+
+    def flush(self):
+        self._last_flush = time.time()
+        if self.job_id and self._pending:
+            increment_job(self.job_id, **self._pending)
+            publish_job_event(self.job_id)
+        self._pending = {}
+
+    def succeed(self):
+        self.flush()
+        now = datetime.utcnow()
+        fields = {"status": "SUCCESS", "stage": "done", "finished_at": now.isoformat()}
+        job = get_job(self.job_id) if self.job_id else None
+        if job and job.get("created_at"):
+            # Upload-to-queryable latency (queue wait included)
+            fields["latency_ms"] = round((now - datetime.fromisoformat(job["created_at"])).total_seconds() * 1000, 1)
+        self._save(**fields)
+
+    def check_cancelled(self):
+        """Cooperative cancellation point: raise JobCancelled if the job was revoked."""
+        if not self.job_id:
+            return
+        job = get_job(self.job_id)
+        if job and job.get("status") == "REVOKED":
+            raise JobCancelled(self.job_id)
+
+    def fail(self, error: str):
+        self.flush()
+        self._save(status="FAILURE", error=error[:2000], finished_at=datetime.utcnow().isoformat())
+
+    def _save(self, **fields):
+        if self.job_id:
+            save_job(self.job_id, **fields)
+            publish_job_event(self.job_id)
@@ -0,0 +1,298 @@
+"""
+Local-mode ingestion executor (REDIS_URL=redis://mock).
+
+A bounded priority queue feeds a pool of separate worker processes, each with
+its own preloaded embedding model, so PDF parsing and ONNX embedding never run
+inside the API server process. Workers return embedded points; the API process
+writes them to Qdrant (local Qdrant storage can only be opened by one process).
+Job status is reported through the same job registry as Celery, and the
+document catalog goes through the same states as in ingest_file_logic.
+"""
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import pathlib
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from datetime import datetime
+
+from app.core.config import settings
+from app.workers import catalog
+from app.workers.checkpoints import cached_file_sha256
+from app.workers.jobs import JobTracker, JobCancelled, cancel_job
+
+
+class QueueFull(Exception):
+    """The local ingestion queue is at capacity."""
+
+
+def _init_worker(nice: int, threads: int):
+    """Worker process initializer: lower CPU priority, cap ONNX threads, preload the model."""
+    if nice:
+        try:
+            os.nice(nice)
+        except (AttributeError, OSError):
+            pass
+    if threads:
+        os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    import app.workers.pipeline  # noqa: F401  (loads the embedding model once per process)
+
+
+def _prepare_in_worker(job_id, file_path, filename, category, session_id, start, end):
+    """Runs in a worker process: extract, chunk and embed pages [start, end). Returns Qdrant points."""
+    from app.workers.pipeline import prepare_window
+    tracker = JobTracker(job_id)
+    return prepare_window(pathlib.Path(file_path), filename, category, session_id, tracker, start, end)
+
+
+class LocalIngestionExecutor:
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._queued = {}       # job_id -> item (still waiting in the heap)
+        self._running = set()
+        self._slots = threading.Semaphore(workers)
+        self._stopped = False
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(settings.LOCAL_INGEST_NICE, settings.LOCAL_INGEST_THREADS),
+        )
+        # Qdrant writes happen in this process, one at a time
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="ingest-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    # --- Public API ---
+
+    def submit(self, job_id, file_path, filename, category="user", session_id=None, priority=5):
+        """Queue a saved file for ingestion. Lower priority value runs first."""
+        with self._cond:
+            if len(self._queued) >= self.queue_size:
+                raise QueueFull(f"Local ingestion queue full ({self.queue_size} jobs)")
+            item = {
+                "job_id": job_id,
+                "file_path": str(file_path),
+                "filename": filename,
+                "category": category,
+                "session_id": session_id,
+                "queued_at": time.time(),
+            }
+            self._queued[job_id] = item
+            heapq.heappush(self._heap, (priority, next(self._seq), job_id))
+            self._cond.notify()
+
+    def cancel(self, job_id) -> bool:
+        """Cancel a queued or running job. Running jobs stop at their next embed batch."""
+        with self._cond:
+            queued = self._queued.pop(job_id, None)
+            known = queued is not None or job_id in self._running
+        cancel_job(job_id)
+        if queued is not None:
+            catalog.record(queued["session_id"], queued["filename"], status="cancelled")
+            self._release(job_id)
+        return known
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"queued": len(self._queued), "running": len(self._running), "workers": self.workers}
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._writer.shutdown(wait=False)
+
+    # --- Internals ---
+
+    def _next_item(self):
+        with self._cond:
+            while not self._stopped:
+                while self._heap:
+                    _, _, job_id = heapq.heappop(self._heap)
+                    item = self._queued.pop(job_id, None)
+                    if item:  # cancelled items were removed from _queued
+                        self._running.add(job_id)
+                        return item
+                self._cond.wait()
+        return None
+
+    def _dispatch_loop(self):
+        while True:
+            self._slots.acquire()
+            item = self._next_item()
+            if item is None:
+                return
+            # All per-job state is handled on the single writer thread from here on
+            self._writer.submit(self._start, item)
+
+    def _start(self, item):
+        from app.workers.tasks import ensure_collection
+        from app.workers.pipeline import count_pages
+
+        try:
+            item["started_at"] = time.time()
+            ensure_collection()  # Fail fast on an embedding model mismatch
+            tracker = JobTracker(item["job_id"])
+            tracker.start(size_bytes=os.path.getsize(item["file_path"]))
+            file_path = pathlib.Path(item["file_path"])
+            item["total_pages"] = count_pages(file_path, item["filename"])
+            catalog.record(
+                item["session_id"], item["filename"], category=item["category"], path=str(file_path.resolve()),
+                size_bytes=file_path.stat().st_size, file_hash=cached_file_sha256(file_path),
+                page_count=item["total_pages"], status="processing", error=None, job_id=item["job_id"],
+            )
+            if self._attach_shared(item, tracker):
+                return
+            self._plan_windows(item, tracker)
+            self._fill_windows(item)
+        except JobCancelled:
+            self._finish(item, cancelled=True)
+        except Exception as e:
+            JobTracker(item["job_id"]).fail(str(e))
+            self._finish(item, error=e)
+
+    def _attach_shared(self, item, tracker) -> bool:
+        """Identical upload already ingested: share its vectors instead of queueing windows."""
+        from app.workers.tasks import attach_shared_upload
+
+        shared = attach_shared_upload(item["file_path"], item["filename"], item["category"], item["session_id"])
+        if not shared:
+            return False
+        tracker.set(vectors_written=shared["point_count"])
+        tracker.succeed()
+        self._record_ready(item, shared["point_count"])
+        self._finish(item)
+        return True
+
+    def _plan_windows(self, item, tracker):
+        """
+        Page windows still to do (resumes from the document's checkpoint, if any).
+        Documents of FANOUT_MIN_PAGES or more fan out: their windows run on all
+        worker processes in parallel (local equivalent of the Celery chord).
+        """
+        from app.workers.checkpoints import IngestionCheckpoint
+
+        total_pages = item["total_pages"]
+        checkpoint = IngestionCheckpoint(item["session_id"], item["filename"], item["file_path"],
+                                         settings.INGEST_WINDOW_PAGES)
+        done = len(checkpoint.point_ids)
+        tracker.set(pages_extracted=checkpoint.pages_done, chunks_embedded=done, vectors_written=done,
+                    pages_skipped=0, boilerplate_lines=0, chunks_avoided=0)
+
+        item["checkpoint"] = checkpoint
+        item["windows"] = list(checkpoint.windows(0, total_pages))
+        item["parallel"] = self.workers if total_pages >= settings.FANOUT_MIN_PAGES else 1
+        item["in_flight"] = 0
+        item["closed"] = False
+
+    def _fill_windows(self, item):
+        """Keep up to item["parallel"] windows in flight; finalize once all are written."""
+        if not item["windows"] and item["in_flight"] == 0:
+            self._complete(item)
+            return
+        while item["windows"] and item["in_flight"] < item["parallel"]:
+            start, end = item["windows"].pop(0)
+            item["in_flight"] += 1
+            future = self._pool.submit(
+                _prepare_in_worker, item["job_id"], item["file_path"],
+                item["filename"], item["category"], item["session_id"], start, end,
+            )
+            future.add_done_callback(
+                lambda f, item=item, start=start, end=end: self._writer.submit(self._write, item, f, start, end)
+            )
+
+    def _write(self, item, future, start, end):
+        # API process only (owns the Qdrant client)
+        from app.workers.tasks import write_window
+
+        item["in_flight"] -= 1
+        if item["closed"]:
+            return  # job already failed/cancelled; late window results are dropped
+
+        tracker = JobTracker(item["job_id"])
+        try:
+            points = future.result()
+            tracker.check_cancelled()
+            point_ids = write_window(points, tracker)
+            item["checkpoint"].commit(start, end, point_ids)
+            del points
+            self._fill_windows(item)
+        except JobCancelled:
+            logging.info(f"CANCELLED: Local ingestion of {item['filename']}")
+            self._finish(item, cancelled=True)
+        except Exception as e:
+            logging.error(f"FAILURE: Local ingestion of {item['filename']}: {e}", exc_info=True)
+            tracker.fail(str(e))
+            self._finish(item, error=e)
+
+    def _complete(self, item):
+        from app.workers.tasks import finalize_document
+
+        tracker = JobTracker(item["job_id"])
+        try:
+            finalize_document(item["session_id"], item["filename"], item["checkpoint"].point_ids,
+                              item["file_path"])
+            chunk_count = len(item["checkpoint"].point_ids)
+            item["checkpoint"].clear()
+            tracker.succeed()
+            self._record_ready(item, chunk_count)
+            self._finish(item)
+        except Exception as e:
+            logging.error(f"FAILURE: Finalizing {item['filename']}: {e}", exc_info=True)
+            tracker.fail(str(e))
+            self._finish(item, error=e)
+
+    def _record_ready(self, item, chunk_count):
+        catalog.record(item["session_id"], item["filename"], status="ready", chunk_count=chunk_count,
+                       ingested_at=datetime.utcnow().isoformat())
+
+    def _finish(self, item, error=None, cancelled=False):
+        item["closed"] = True
+        if cancelled:
+            catalog.record(item["session_id"], item["filename"], status="cancelled")
+        elif error is not None:
+            catalog.record(item["session_id"], item["filename"], status="failed", error=str(error)[:2000])
+        with self._cond:
+            self._running.discard(item["job_id"])
+        self._slots.release()
+        elapsed = None if (error or cancelled) else time.time() - item.get("started_at", item["queued_at"])
+        self._release(item["job_id"], elapsed)
+
+    def _release(self, job_id, elapsed=None):
+        from app.core.admission import get_admission_controller
+        get_admission_controller().release(job_id, elapsed)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_local_executor():
+    """Lazily start the local executor (None when LOCAL_INGEST_WORKERS=0)."""
+    global _executor
+    if settings.LOCAL_INGEST_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = LocalIngestionExecutor(settings.LOCAL_INGEST_WORKERS, settings.LOCAL_INGEST_QUEUE_SIZE)
+            print(f"Local ingestion executor started ({settings.LOCAL_INGEST_WORKERS} worker processes)")
+    return _executor
+
+
+def shutdown_local_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
@@ -0,0 +1,271 @@
+"""
+CPU-side ingestion stages: persist, extract, chunk, embed.
+
+Deliberately free of any Qdrant client so it can be imported by worker
+processes (local Qdrant storage is locked by the API process). Importing this
+module preloads the embedding model.
+"""
+import os
+import pathlib
+import logging
+
+import fitz # PyMuPDF
+from llama_index.core import Document, Settings
+from llama_index.core.schema import MetadataMode, TextNode, NodeRelationship
+from llama_index.core.node_parser import SentenceSplitter
+
+from app.core.config import settings
+from app.core import storage
+from app.core.embeddings import get_embed_model
+from app.workers import extraction, dedup, word_index
+from app.workers.checkpoints import cached_file_sha256
+from app.workers.vector_writer import assign_point_ids, build_points, document_id
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+EMBED_BATCH_SIZE = 64
+CHARS_PER_TOKEN = 4
+METADATA_TOKEN_RESERVE = 32  # Room for the metadata prepended to each chunk's embed text
+
+# --- LlamaIndex Settings ---
+Settings.embed_model = get_embed_model()
+if GEMINI_API_KEY:
+    Settings.node_parser = SentenceSplitter(chunk_size=512, chunk_overlap=50)
+
+
+def data_dir() -> pathlib.Path:
+    # Use relative path for local compatibility (vs Docker /app)
+    return pathlib.Path(os.getcwd()) / "data"
+
+
+def upload_path(filename: str, category: str, session_id: str) -> pathlib.Path:
+    """
+    Path of an upload under data/static or data/uploads/<session_id>. Static
+    files may keep their relative path in the corpus ("policies/a.pdf");
+    session uploads are flat. Raises ValueError for names (or sessions) that
+    would point anywhere else.
+    """
+    def plain(name):
+        return bool(name) and pathlib.Path(name).name == name and name not in (".", "..")
+
+    if category == "static":
+        relative = pathlib.PurePosixPath(filename or "")
+        valid = bool(relative.parts) and not relative.is_absolute() and ".." not in relative.parts
+        base_dir = data_dir() / "static"
+    else:
+        valid = plain(filename) and plain(session_id)
+        base_dir = data_dir() / "uploads" / session_id if valid else None
+    if not valid:
+        raise ValueError(f"Invalid upload name: {filename!r} (session {session_id!r})")
+
+    file_path = base_dir / filename
+    resolved = file_path.resolve()
+    if resolved == base_dir.resolve() or not resolved.is_relative_to(base_dir.resolve()):  # e.g. a symlink
+        raise ValueError(f"Invalid upload name: {filename!r}")
+    return file_path
+
+
+def save_upload(content_bytes: bytes, filename: str, category: str, session_id: str) -> pathlib.Path:
+    """Persist an uploaded file under data/static or data/uploads/<session_id>."""
+    file_path = upload_path(filename, category, session_id)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    previous = file_path.stat().st_size if file_path.exists() else None
+    with open(file_path, "wb") as f:
+        f.write(content_bytes)
+    storage.record_upload(category, session_id, len(content_bytes) - (previous or 0), 0 if previous is not None else 1)
+    return file_path
+
+
+def discard_upload(file_path: pathlib.Path, category: str, session_id: str):
+    """Remove a saved upload that was not accepted for ingestion, and its storage ledger entry."""
+    try:
+        size = file_path.stat().st_size
+        file_path.unlink()
+    except FileNotFoundError:
+        return
+    storage.record_upload(category, session_id, -size, -1)
+
+
+def count_pages(file_path, filename: str) -> int:
+    """Number of pages (windowing unit). Text files are a single page."""
+    if filename.lower().endswith(".pdf"):
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    return 1
+
+
+def index_words(doc, file_path, start: int, end: int):
+    """Persist the word-box index (for highlighting) of PDF pages [start, end) not indexed yet."""
+    if not settings.WORD_INDEX:
+        return
+    try:
+        file_hash = cached_file_sha256(file_path)
+        done = word_index.indexed_pages(file_hash, start, end)
+        pages = {
+            page_no: word_index.PageWords.from_words(doc[page_no].get_text("words", sort=True))
+            for page_no in range(start, end) if page_no not in done
+        }
+        if pages:
+            word_index.save_pages(file_hash, file_path, pages)
+    except Exception as e:
+        logging.warning(f"Word index skipped for {file_path}: {e}")
+
+
+def extract_documents(file_path: pathlib.Path, filename: str, category: str, session_id: str,
+                      content_bytes: bytes = None, start: int = 0, end: int = None):
+    """One Document per PDF page in [start, end) (or one for a text file), with deterministic IDs."""
+    documents = []
+    base_metadata = {
+        "filename": filename,
+        "category": category,
+        "session_id": session_id if session_id else ""
+    }
+
+    if filename.lower().endswith(".pdf"):
+        with fitz.open(file_path) as doc:
+            end = doc.page_count if end is None else min(end, doc.page_count)
+            for page_no in range(start, end):
+                page = doc[page_no]
+                text = page.get_text()
+                meta = base_metadata.copy()
+                meta["page_label"] = str(page_no + 1)
+                documents.append(Document(
+                    text=text, metadata=meta,
+                    id_=document_id(session_id, filename, meta["page_label"])
+                ))
+            index_words(doc, file_path, start, end)
+        # Drop MuPDF's object cache so memory does not grow with document size
+        fitz.TOOLS.store_shrink(100)
+    else:
+        if content_bytes is None:
+            content_bytes = pathlib.Path(file_path).read_bytes()
+        text = content_bytes.decode("utf-8", errors="ignore")
+        meta = base_metadata.copy()
+        meta["page_label"] = "1"
+        documents.append(Document(
+            text=text, metadata=meta,
+            id_=document_id(session_id, filename, "1")
+        ))
+    return documents
+
+
+def extract_layout_documents(file_path: pathlib.Path, filename: str, category: str, session_id: str,
+                             content_bytes: bytes = None, start: int = 0, end: int = None):
+    """
+    Layout-aware variant of extract_documents: PDF pages are read as text blocks,
+    repeated headers/footers and page numbers are dropped and near-empty pages
+    are skipped. Returns (documents, blocks per document, stats); stats include
+    an estimate of the chunks plain page text would have produced.
+    """
+    base_metadata = {
+        "filename": filename,
+        "category": category,
+        "session_id": session_id if session_id else ""
+    }
+    is_pdf = filename.lower().endswith(".pdf")
+    pages = []  # (page_label, blocks, raw_text)
+    stats = {"pages": 0, "pages_skipped": 0, "boilerplate_lines": 0, "naive_chunks": 0}
+
+    if is_pdf:
+        with fitz.open(file_path) as doc:
+            boilerplate = extraction.get_boilerplate(doc, file_path)
+            end = doc.page_count if end is None else min(end, doc.page_count)
+            for page_no in range(start, end):
+                page = doc[page_no]
+                blocks, removed = extraction.clean_page(page, boilerplate)
+                stats["boilerplate_lines"] += removed
+                pages.append((str(page_no + 1), blocks, page.get_text()))
+            index_words(doc, file_path, start, end)
+        fitz.TOOLS.store_shrink(100)
+    else:
+        if content_bytes is None:
+            content_bytes = pathlib.Path(file_path).read_bytes()
+        text = content_bytes.decode("utf-8", errors="ignore")
+        pages.append(("1", extraction.split_paragraphs(text), text))
+
+    documents, page_blocks = [], []
+    chunk_size, chunk_overlap = _chunk_params()
+    min_chars = settings.MIN_PAGE_CHARS if is_pdf else 1
+    for page_label, blocks, raw_text in pages:
+        stats["pages"] += 1
+        stats["naive_chunks"] += extraction.naive_chunk_estimate(raw_text, chunk_size, chunk_overlap)
+        if sum(len(b) for b in blocks) < min_chars:
+            stats["pages_skipped"] += 1
+            continue
+        meta = base_metadata.copy()
+        meta["page_label"] = page_label
+        documents.append(Document(
+            text="\n\n".join(blocks), metadata=meta,
+            id_=document_id(session_id, filename, page_label)
+        ))
+        page_blocks.append(blocks)
+    return documents, page_blocks, stats
+
+
+def _chunk_params():
+    parser = Settings.node_parser
+    return getattr(parser, "chunk_size", 1024), getattr(parser, "chunk_overlap", 200)
+
+
+def chunk_blocks(documents, page_blocks):
+    """
+    One node per group of whole blocks (paragraphs) of a page, packed up to the
+    node parser's chunk size; only blocks larger than a chunk are split further.
+    """
+    chunk_size, _ = _chunk_params()
+    max_chars = (chunk_size - METADATA_TOKEN_RESERVE) * CHARS_PER_TOKEN
+    nodes = []
+    for document, blocks in zip(documents, page_blocks):
+        for text in extraction.pack_blocks(blocks, max_chars, Settings.node_parser.split_text):
+            nodes.append(TextNode(
+                text=text,
+                metadata=dict(document.metadata),
+                excluded_embed_metadata_keys=list(document.excluded_embed_metadata_keys),
+                excluded_llm_metadata_keys=list(document.excluded_llm_metadata_keys),
+                relationships={NodeRelationship.SOURCE: document.as_related_node_info()},
+            ))
+    return nodes
+
+
+def embed_nodes(nodes, tracker):
+    """Embed nodes in batches."""
+    for i in range(0, len(nodes), EMBED_BATCH_SIZE):
+        tracker.check_cancelled()
+        batch = nodes[i:i + EMBED_BATCH_SIZE]
+        texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in batch]
+        embeddings = Settings.embed_model.get_text_embedding_batch(texts)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+        tracker.add(chunks_embedded=len(batch))
+    return nodes
+
+
+def prepare_window(file_path, filename: str, category: str, session_id: str, tracker,
+                   start: int = 0, end: int = None, content_bytes: bytes = None):
+    """Extract -> chunk -> embed pages [start, end). Returns Qdrant points ready to be written."""
+    tracker.stage("extracting")
+    if settings.LAYOUT_CLEANING:
+        documents, page_blocks, stats = extract_layout_documents(
+            file_path, filename, category, session_id, content_bytes, start, end
+        )
+        nodes = chunk_blocks(documents, page_blocks)
+        tracker.add(
+            pages_extracted=stats["pages"],
+            pages_skipped=stats["pages_skipped"],
+            boilerplate_lines=stats["boilerplate_lines"],
+            # Block-aligned chunking can yield more chunks than the naive estimate; never count those as avoided
+            chunks_avoided=max(0, stats["naive_chunks"] - len(nodes)),
+        )
+    else:
+        documents = extract_documents(file_path, filename, category, session_id, content_bytes, start, end)
+        nodes = Settings.node_parser.get_nodes_from_documents(documents)
+        tracker.add(pages_extracted=len(documents))
+
+    assign_point_ids(nodes, session_id, filename)
+    if settings.DEDUP_MODE != "off":
+        nodes, duplicates = dedup.filter_duplicates(nodes, category, session_id, filename, file_path)
+        tracker.add(duplicates_skipped=duplicates)
+
+    tracker.stage("embedding")
+    embed_nodes(nodes, tracker)
+    tracker.flush()
+    return build_points(nodes)
@@ -1,15 +1,28 @@
 import os
 from app.workers.celery_app import celery_app
-from llama_index.core import Document, VectorStoreIndex, StorageContext, Settings
-from llama_index.vector_stores.qdrant import QdrantVectorStore
-from llama_index.embeddings.fastembed import FastEmbedEmbedding
-from llama_index.core.node_parser import SentenceSplitter
+from celery import chord, group
+from llama_index.core import Settings
 from llama_index.llms.google_genai import GoogleGenAI
 import qdrant_client
 from qdrant_client.http.models import Distance, VectorParams
 import base64
-import fitz # PyMuPDF
 import pathlib
+from app.core.config import settings
+import time
+from datetime import datetime
+from app.db import save_job
+from app.core.admission import get_admission_controller
+from app.workers.jobs import JobTracker, JobCancelled
+from app.core.notifications import publish_job_event
+from app.core.embeddings import get_spec, record_collection_model, check_collection_model
+from app.core.projection import get_projection, ensure_reduced_collection, reduced_collection, reduced_points
+from app.workers.pipeline import count_pages, prepare_window, save_upload
+from app.workers.checkpoints import IngestionCheckpoint, cached_file_sha256
+from app.workers import catalog
+from app.workers.file_sharing import attach_session, register_upload
+from app.workers.vector_writer import upsert_points, verify_points, prune_stale_points, set_alternates
+from app.workers.dedup import document_version
+from app.db import prune_dedup_document, find_orphaned_duplicates, get_document_alternates, get_job
 
 # --- Configuration ---
 import logging
@@ -22,9 +35,8 @@ QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION_NAME", "knowledge_base")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # --- LlamaIndex Settings ---
-Settings.embed_model = FastEmbedEmbedding(model_name="BAAI/bge-base-en-v1.5")
+# (Embedding model & node parser are configured in app.workers.pipeline)
 if GEMINI_API_KEY:
-    Settings.node_parser = SentenceSplitter(chunk_size=512, chunk_overlap=50)
     # Use standard GoogleGenAI driver
     Settings.llm = GoogleGenAI(model="models/gemini-flash-latest", api_key=GEMINI_API_KEY)
 
@@ -34,98 +46,303 @@ if os.getenv("QDRANT_LOCATION"):
 else:
     client = qdrant_client.QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
 
-def ingest_file_logic(file_content_b64: str, filename: str, category: str = "user", session_id: str = None):
+_collection_ready = False
+
+def ensure_collection():
+    """
+    Create the collection sized for EMBED_MODEL (recording the model in it), or
+    check that an existing one was built with the same model.
+    """
+    global _collection_ready
+    if _collection_ready:
+        return
+    spec = get_spec()
+    try:
+        client.get_collection(QDRANT_COLLECTION)
+    except Exception:
+        client.create_collection(
+            collection_name=QDRANT_COLLECTION,
+            vectors_config=VectorParams(size=spec.dim, distance=Distance.COSINE),
+        )
+        record_collection_model(client, QDRANT_COLLECTION, spec)
+    check_collection_model(client, QDRANT_COLLECTION, spec)
+
+    projection = get_projection()
+    if projection and ensure_reduced_collection(client, QDRANT_COLLECTION, projection):
+        logging.warning(
+            f"Created {reduced_collection(QDRANT_COLLECTION, projection)}; existing points need "
+            f"`python -m app.scripts.vector_projection backfill {projection.name}`"
+        )
+    _collection_ready = True
+
+def write_window(points, tracker):
+    """Idempotent upsert + consistency check of one window. Returns the written point IDs."""
+    # Deterministic IDs -> retries overwrite instead of duplicating
+    ensure_collection()
+    tracker.stage("writing")
+    point_ids = upsert_points(
+        client, QDRANT_COLLECTION, points,
+        batch_size=settings.UPSERT_BATCH_SIZE,
+        parallel=settings.UPSERT_PARALLEL,
+    )
+    tracker.stage("verifying")
+    repaired = verify_points(client, QDRANT_COLLECTION, points, batch_size=settings.UPSERT_BATCH_SIZE)
+    if repaired:
+        logging.info(f"Consistency check: repaired={repaired}")
+
+    projection = get_projection()
+    if projection:
+        # Same points, projected vectors, in the companion collection queries search
+        reduced = reduced_points(points, projection)
+        target = reduced_collection(QDRANT_COLLECTION, projection)
+        upsert_points(client, target, reduced, batch_size=settings.UPSERT_BATCH_SIZE,
+                      parallel=settings.UPSERT_PARALLEL)
+        verify_points(client, target, reduced, batch_size=settings.UPSERT_BATCH_SIZE)
+    tracker.add(vectors_written=len(point_ids))
+    return point_ids
+
+def finalize_document(session_id: str, filename: str, point_ids, file_path=None):
+    """
+    Remove points left over from an earlier version of the same document, bring
+    the near-duplicate index up to date (linking alternates in link mode) and
+    make session uploads shareable with sessions uploading the identical file.
+    """
+    pruned = prune_stale_points(client, QDRANT_COLLECTION, session_id, filename, point_ids)
+    logging.info(f"Finalized {filename}: {len(point_ids)} points, pruned={pruned}")
+    if file_path is None:
+        return
+
+    if settings.DEDUP_MODE != "off":
+        prune_dedup_document(session_id, filename, document_version(file_path))
+        orphaned = find_orphaned_duplicates()
+        if orphaned:
+            logging.warning(f"Dedup: canonical chunks removed with {filename}; re-ingest {orphaned} to restore them")
+        if settings.DEDUP_MODE == "link":
+            linked = set_alternates(client, QDRANT_COLLECTION, get_document_alternates(session_id, filename))
+            logging.info(f"Dedup: linked alternates on {linked} canonical points")
+
+    if session_id:
+        register_upload(client, QDRANT_COLLECTION, cached_file_sha256(file_path), session_id, filename, len(point_ids))
+
+def attach_shared_upload(file_path, filename: str, category: str, session_id: str):
+    """
+    If a byte-identical file was already ingested (by any session), give this
+    session access to its points instead of re-embedding. Returns the shared
+    file record, or None if the file has to be ingested.
+    """
+    if category == "static" or not session_id:
+        return None
+    return attach_session(client, QDRANT_COLLECTION, cached_file_sha256(file_path), session_id, filename)
+
+def ingest_windows(file_path, filename: str, category: str, session_id: str, tracker, content_bytes: bytes = None,
+                   start_page: int = 0, end_page: int = None, finalize: bool = True):
+    """
+    Streaming ingestion: process INGEST_WINDOW_PAGES pages at a time
+    (extract -> chunk -> embed -> upsert) and checkpoint after every window,
+    so memory stays flat and a retry resumes from the last completed window.
+    With start_page/end_page only that page range is ingested (fan-out subtask);
+    such ranges use their own checkpoint and leave finalization to the caller.
+    """
+    total_pages = count_pages(file_path, filename)
+    end_page = total_pages if end_page is None else min(end_page, total_pages)
+    whole_document = start_page == 0 and end_page == total_pages
+    scope = "" if whole_document else f"{start_page}-{end_page}"
+
+    checkpoint = IngestionCheckpoint(session_id, filename, file_path, settings.INGEST_WINDOW_PAGES, scope=scope)
+    if whole_document:
+        # Counters restart from what the checkpoint already covers (0 on a fresh run)
+        done = len(checkpoint.point_ids)
+        tracker.set(pages_extracted=checkpoint.pages_done, chunks_embedded=done, vectors_written=done,
+                    pages_skipped=0, boilerplate_lines=0, chunks_avoided=0)
+    if checkpoint.resumed:
+        logging.info(f"Resuming {filename}: {checkpoint.pages_done} pages already ingested")
+
+    for start, end in checkpoint.windows(start_page, end_page):
+        logging.info(f"Window: pages {start + 1}-{end} of {total_pages}")
+        points = prepare_window(file_path, filename, category, session_id, tracker, start, end, content_bytes)
+        point_ids = write_window(points, tracker)
+        checkpoint.commit(start, end, point_ids)
+        del points
+
+    point_ids = checkpoint.point_ids
+    if finalize:
+        finalize_document(session_id, filename, point_ids, file_path)
+    checkpoint.clear()
+    return point_ids
+
+def plan_page_ranges(total_pages: int):
+    """Page ranges for cross-worker fan-out, or None if the document is too small to split."""
+    if total_pages < settings.FANOUT_MIN_PAGES:
+        return None
+    size = max(1, settings.FANOUT_RANGE_PAGES)
+    return [(start, min(start + size, total_pages)) for start in range(0, total_pages, size)]
+
+def fanout_supported() -> bool:
+    """Chords need a result backend that supports them (Redis), not rpc://."""
+    backend = str(celery_app.conf.result_backend or "")
+    return backend.startswith(("redis://", "rediss://"))
+
+def ingest_file_logic(file_content_b64: str, filename: str, category: str = "user", session_id: str = None,
+                      job_id: str = None, source_path: str = None, allow_fanout: bool = False):
     """
     Core ingestion logic, decoupled from Celery for easier local testing/execution.
+    Progress is reported to the job registry when a job_id is given.
+    If file_content_b64 is None, the file is read in place from source_path
+    (a path on the shared data volume) instead of being shipped through the broker.
+    With allow_fanout, large PDFs are split into page-range subtasks (a Celery chord)
+    and {"status": "fanned_out"} is returned; finalize_fanout completes the job.
     """
     logging.info(f"STARTING INGESTION for {filename}, session: {session_id}")
+    tracker = JobTracker(job_id)
+    started = time.time()
     try:
-        # 1. Decode & Persist File
-        logging.info("Step 1: Decoding file")
-        content_bytes = base64.b64decode(file_content_b64)
-        
-        # Use relative path for local compatibility (vs Docker /app)
-        project_root = pathlib.Path(os.getcwd())
-        data_dir = project_root / "data"
-        
-        if category == "static":
-            base_dir = data_dir / "static"
-        else:
-            if not session_id:
-                session_id = "default"
-            base_dir = data_dir / "uploads" / session_id
-        
-        base_dir.mkdir(parents=True, exist_ok=True)
-        file_path = base_dir / filename
-        with open(file_path, "wb") as f:
-            f.write(content_bytes)
-
-        logging.info(f"File saved to {file_path}")
-
-        # 2. Extract Text
-        logging.info("Step 2: Extracting Text")
-        documents = []
-        base_metadata = {
-            "filename": filename,
-            "category": category,
-            "session_id": session_id if session_id else ""
-        }
-        
-        if filename.lower().endswith(".pdf"):
-            with fitz.open(file_path) as doc:
-                for page in doc:
-                    text = page.get_text()
-                    meta = base_metadata.copy()
-                    meta["page_label"] = str(page.number + 1)
-                    documents.append(Document(text=text, metadata=meta))
+        if category != "static" and not session_id:
+            session_id = "default"
+
+        ensure_collection()  # Fail fast on an embedding model mismatch
+
+        if file_content_b64 is None:
+            # 1. Use File In Place
+            file_path = pathlib.Path(source_path)
+            content_bytes = None
+            tracker.start(size_bytes=file_path.stat().st_size)
+            logging.info(f"Step 1: Reading file in place from {file_path}")
         else:
-            text = content_bytes.decode("utf-8", errors="ignore")
-            meta = base_metadata.copy()
-            meta["page_label"] = "1"
-            documents.append(Document(text=text, metadata=meta))
-
-        logging.info(f"Extracted {len(documents)} document chunks")
-
-        # 3. Setup Qdrant Vector Store
-        logging.info("Step 3: Setup Qdrant")
-        try:
-             client.get_collection(QDRANT_COLLECTION)
-        except Exception:
-             client.create_collection(
-                 collection_name=QDRANT_COLLECTION,
-                 vectors_config=VectorParams(size=768, distance=Distance.COSINE),
-             )
-
-        vector_store = QdrantVectorStore(client=client, collection_name=QDRANT_COLLECTION)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-        # 4. Ingestion Pipeline
-        logging.info("Step 4: Running Ingestion Pipeline (Embedding)...")
-        VectorStoreIndex.from_documents(
-            documents,
-            storage_context=storage_context,
-            show_progress=True
+            # 1. Decode & Persist File
+            logging.info("Step 1: Decoding file")
+            content_bytes = base64.b64decode(file_content_b64)
+            tracker.start(size_bytes=len(content_bytes))
+            file_path = save_upload(content_bytes, filename, category, session_id)
+            logging.info(f"File saved to {file_path}")
+
+        catalog.record(
+            session_id, filename, category=category, path=str(file_path.resolve()),
+            size_bytes=file_path.stat().st_size, file_hash=cached_file_sha256(file_path),
+            page_count=count_pages(file_path, filename), status="processing", error=None, job_id=job_id,
         )
 
+        # Identical upload already ingested: share its vectors
+        shared = attach_shared_upload(file_path, filename, category, session_id)
+        if shared:
+            tracker.set(vectors_written=shared["point_count"])
+            tracker.succeed()
+            catalog.record(session_id, filename, status="ready", chunk_count=shared["point_count"],
+                           ingested_at=datetime.utcnow().isoformat())
+            return {
+                "status": "success",
+                "filename": filename,
+                "chunks": shared["point_count"],
+                "shared": True,
+                "elapsed_seconds": round(time.time() - started, 3),
+            }
+
+        # Large document: fan out page ranges across the worker fleet
+        if allow_fanout and filename.lower().endswith(".pdf"):
+            ranges = plan_page_ranges(count_pages(file_path, filename))
+            if ranges:
+                dispatch_fanout(job_id, str(file_path), filename, category, session_id, ranges, started)
+                return {"status": "fanned_out", "filename": filename, "subtasks": len(ranges)}
+
+        # 2-4. Extract, Chunk, Embed & Write (page window at a time)
+        point_ids = ingest_windows(file_path, filename, category, session_id, tracker, content_bytes)
+
         logging.info("SUCCESS: Ingestion Complete")
-        return {"status": "success", "filename": filename, "chunks": "processed"}
+        tracker.succeed()
+        catalog.record(session_id, filename, status="ready", chunk_count=len(point_ids),
+                       ingested_at=datetime.utcnow().isoformat())
+        return {
+            "status": "success",
+            "filename": filename,
+            "chunks": len(point_ids),
+            "elapsed_seconds": round(time.time() - started, 3),
+        }
 
+    except JobCancelled:
+        logging.info(f"CANCELLED: Ingestion of {filename}")
+        catalog.record(session_id, filename, status="cancelled")
+        raise
     except Exception as e:
         logging.error(f"FAILURE: Error processing {filename}: {e}", exc_info=True)
         print(f"Error processing {filename}: {e}")
+        tracker.fail(str(e))
+        catalog.record(session_id, filename, status="failed", error=str(e)[:2000])
         raise e
 
 @celery_app.task(bind=True)
-def process_document(self, file_content_b64: str, filename: str, category: str = "user", session_id: str = None):
+def process_document(self, file_content_b64: str, filename: str, category: str = "user", session_id: str = None,
+                     source_path: str = None):
+    # The Celery task ID doubles as the job ID in the job registry
+    job_id = self.request.id if getattr(self, "request", None) else None
     try:
-        return ingest_file_logic(file_content_b64, filename, category, session_id)
+        result = ingest_file_logic(file_content_b64, filename, category, session_id, job_id=job_id,
+                                   source_path=source_path, allow_fanout=fanout_supported())
+        if result["status"] != "fanned_out":  # finalize_fanout releases fanned-out jobs
+            get_admission_controller().release(job_id, result.get("elapsed_seconds"))
+        return result
+    except JobCancelled:
+        get_admission_controller().release(job_id)
+        return {"status": "cancelled", "filename": filename}
     except Exception as e:
         if hasattr(self, 'retry'):
+            if job_id and self.request.retries < 3:
+                save_job(job_id, status="RETRY", stage="queued")
+                publish_job_event(job_id)
+            else:
+                get_admission_controller().release(job_id)
             self.retry(exc=e, countdown=10, max_retries=3)
         return {"status": "failure", "error": str(e)}
 
+def dispatch_fanout(job_id, file_path, filename, category, session_id, ranges, started):
+    logging.info(f"Fan-out: {filename} split into {len(ranges)} page ranges")
+    save_job(job_id, stage="fanout")
+    publish_job_event(job_id)
+    header = group(
+        ingest_page_range.s(job_id, file_path, filename, category, session_id, start, end)
+        for start, end in ranges
+    )
+    callback = finalize_fanout.s(job_id, filename, session_id, started, file_path)
+    chord(header)(callback.on_error(fanout_failed.s(job_id, filename)))
+
+@celery_app.task(bind=True)
+def ingest_page_range(self, job_id, file_path, filename, category, session_id, start_page, end_page):
+    """Fan-out subtask: ingest pages [start_page, end_page) of a large document. Returns point IDs."""
+    tracker = JobTracker(job_id)
+    try:
+        return ingest_windows(file_path, filename, category, session_id, tracker,
+                              start_page=start_page, end_page=end_page, finalize=False)
+    except JobCancelled:
+        return []
+    except Exception as e:
+        logging.error(f"FAILURE: pages {start_page + 1}-{end_page} of {filename}: {e}", exc_info=True)
+        self.retry(exc=e, countdown=10, max_retries=3)
+
+@celery_app.task
+def finalize_fanout(results, job_id, filename, session_id, started, file_path=None):
+    """Chord callback: merge subtask results, prune stale points, mark the document queryable."""
+    tracker = JobTracker(job_id)
+    point_ids = [i for ids in results for i in (ids or [])]
+    try:
+        tracker.check_cancelled()
+        finalize_document(session_id, filename, point_ids, file_path)
+        tracker.succeed()
+        catalog.record(session_id, filename, status="ready", chunk_count=len(point_ids),
+                       ingested_at=datetime.utcnow().isoformat())
+        get_admission_controller().release(job_id, time.time() - started)
+    except JobCancelled:
+        catalog.record(session_id, filename, status="cancelled")
+        get_admission_controller().release(job_id)
+        return {"status": "cancelled", "filename": filename}
+    return {"status": "success", "filename": filename, "chunks": len(point_ids)}
+
+@celery_app.task
+def fanout_failed(request, exc, traceback, job_id, filename):
+    """Chord error callback: a page range failed for good."""
+    logging.error(f"FAILURE: Fan-out of {filename} failed: {exc}")
+    JobTracker(job_id).fail(f"Page range failed: {exc}")
+    job = get_job(job_id) or {}
+    catalog.record(job.get("session_id"), filename, status="failed", error=f"Page range failed: {exc}"[:2000])
+    get_admission_controller().release(job_id)
+
 @celery_app.task
 def run_cleanup_job():
     from app.scripts.cleanup_sessions import cleanup_expired_sessions
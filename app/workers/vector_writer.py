@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from qdrant_client.http import models
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+from app.core.projection import vector_collections
+
+# Fixed namespace so the same chunk always maps to the same Qdrant point ID,
+# across retries, re-runs and worker restarts.
+POINT_ID_NAMESPACE = uuid.UUID("6f2d1c9e-5b7a-4e0f-9a43-1d8e2c7b5a10")
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of chunk text (used as part of the point identity)."""
+    return hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def document_id(session_id, filename: str, page_label: str) -> str:
+    """Deterministic ID for a source page (used as the ref_doc_id of its chunks)."""
+    key = f"doc|{session_id or ''}|{filename}|{page_label}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, key))
+
+
+def point_id(session_id, filename: str, page_label: str, chunk_index: int, text: str) -> str:
+    """
+    Deterministic point ID derived from (session_id, filename, page, chunk_index, content hash).
+    Re-ingesting the same file overwrites points in place instead of duplicating them.
+    """
+    key = f"{session_id or ''}|{filename}|{page_label}|{chunk_index}|{content_hash(text)}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, key))
+
+
+def assign_point_ids(nodes, session_id, filename: str):
+    """Assign deterministic IDs to nodes in place. chunk_index restarts on every page."""
+    per_page = {}
+    for node in nodes:
+        page_label = str(node.metadata.get("page_label", "1"))
+        idx = per_page.get(page_label, 0)
+        per_page[page_label] = idx + 1
+        node.id_ = point_id(session_id, filename, page_label, idx, node.get_content())
+    return nodes
+
+
+def build_points(nodes):
+    """Convert embedded nodes into Qdrant points with a LlamaIndex-compatible payload."""
+    points = []
+    for node in nodes:
+        payload = node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+        points.append(models.PointStruct(id=node.node_id, vector=node.embedding, payload=payload))
+    return points
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def upsert_points(client, collection_name: str, points, batch_size: int = 256, parallel: int = 4):
+    """
+    Upsert points in batches of `batch_size`, `parallel` batches in flight at a time.
+    Batches are sent with wait=False so Qdrant can pipeline them; call
+    `verify_points` afterwards for the consistency check.
+    """
+    if not points:
+        return []
+
+    batches = list(_batches(points, max(1, batch_size)))
+
+    def _send(batch):
+        client.upsert(collection_name=collection_name, points=batch, wait=False)
+        return len(batch)
+
+    if parallel > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            sent = sum(pool.map(_send, batches))
+    else:
+        sent = sum(_send(b) for b in batches)
+
+    logging.info(f"Upserted {sent} points in {len(batches)} batches (parallel={parallel})")
+    return [p.id for p in points]
+
+
+def verify_points(client, collection_name: str, points, batch_size: int = 256, attempts: int = 5):
+    """
+    Final consistency check: every point must be readable back.
+    Points still missing after a few polls (wait=False upserts may lag) are
+    re-sent synchronously with wait=True. Returns the number of repaired points.
+    """
+    by_id = {str(p.id): p for p in points}
+    missing = set(by_id)
+    delay = 0.1
+
+    for _ in range(attempts):
+        for batch in _batches(sorted(missing), max(1, batch_size)):
+            found = client.retrieve(
+                collection_name=collection_name,
+                ids=batch,
+                with_payload=False,
+                with_vectors=False,
+            )
+            missing -= {str(r.id) for r in found}
+        if not missing:
+            return 0
+        time.sleep(delay)
+        delay *= 2
+
+    logging.warning(f"Consistency check: re-sending {len(missing)} missing points")
+    for batch in _batches([by_id[i] for i in sorted(missing)], max(1, batch_size)):
+        client.upsert(collection_name=collection_name, points=batch, wait=True)
+    return len(missing)
+
+
+def prune_stale_points(client, collection_name: str, session_id, filename: str, keep_ids):
+    """
+    Delete points of this (session, filename) that are not part of the latest run,
+    e.g. chunks left over from an earlier version of the same file.
+    """
+    keep = {str(i) for i in keep_ids}
+    doc_filter = models.Filter(
+        must=[
+            models.FieldCondition(key="filename", match=models.MatchValue(value=filename)),
+            models.FieldCondition(key="session_id", match=models.MatchValue(value=session_id or "")),
+        ]
+    )
+
+    stale = []
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=doc_filter,
+            limit=1000,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False,
+        )
+        stale.extend(str(r.id) for r in records if str(r.id) not in keep)
+        if offset is None:
+            break
+
+    if stale:
+        for name in vector_collections(collection_name):
+            client.delete(
+                collection_name=name,
+                points_selector=models.PointIdsList(points=stale),
+                wait=True,
+            )
+        logging.info(f"Pruned {len(stale)} stale points for {filename}")
+    return len(stale)
+
+
+def set_alternates(client, collection_name: str, alternates):
+    """
+    Record near-duplicate copies on their canonical points as an "alternates"
+    payload ([{filename, page_label}, ...]). `alternates` maps canonical point ID -> list.
+    """
+    linked = 0
+    for canonical_id, copies in alternates.items():
+        try:
+            for name in vector_collections(collection_name):
+                client.set_payload(
+                    collection_name=name,
+                    payload={"alternates": copies},
+                    points=[canonical_id],
+                    wait=False,
+                )
+            linked += 1
+        except Exception as e:
+            logging.warning(f"Could not link alternates on {canonical_id}: {e}")
+    return linked
@@ -0,0 +1,208 @@
+"""
+Per-page word-box index of PDFs, built once at ingestion (data/word_index.db).
+
+For every page: the normalized tokens in reading order, their rectangles and
+a sorted table of token 4-gram hashes -> word position. Highlighting a text
+(the viewer passes the start of the source chunk) is then a hash probe per
+query 4-gram instead of re-extracting the page and comparing word windows.
+Rows are keyed by file content hash, so re-ingested or shared copies of a
+file reuse them; rows of file versions that no longer exist are pruned by the
+session cleanup.
+"""
+import os
+import bisect
+import hashlib
+import pathlib
+from array import array
+from datetime import datetime
+
+from app.db import adjust_storage, connect
+
+NGRAM = 4
+PUNCTUATION = ".,!?;:\"'()[]"
+
+
+def index_path() -> pathlib.Path:
+    return pathlib.Path(os.getcwd()) / "data" / "word_index.db"
+
+
+def normalize_token(word: str) -> str:
+    return word.strip(PUNCTUATION).lower()
+
+
+def gram_hash(tokens) -> int:
+    return int.from_bytes(hashlib.blake2b(" ".join(tokens).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class PageWords:
+    """Tokens, word rectangles and the n-gram table of one page."""
+
+    def __init__(self, tokens, rects: array, gram_keys: array, gram_pos: array):
+        self.tokens = tokens
+        self.rects = rects          # 4 floats per token
+        self.gram_keys = gram_keys  # sorted n-gram hashes
+        self.gram_pos = gram_pos    # word position of each hash
+
+    @classmethod
+    def from_words(cls, words):
+        """From PyMuPDF get_text("words", sort=True) tuples (x0, y0, x1, y1, word, ...)."""
+        tokens, rects = [], array("f")
+        for w in words:
+            token = normalize_token(w[4])
+            if token:
+                tokens.append(token)
+                rects.extend(w[:4])
+        grams = sorted((gram_hash(tokens[i:i + NGRAM]), i) for i in range(len(tokens) - NGRAM + 1))
+        return cls(tokens, rects, array("Q", (g for g, _ in grams)), array("I", (i for _, i in grams)))
+
+    def rect(self, i: int):
+        return tuple(self.rects[4 * i:4 * i + 4])
+
+    def _positions(self, key: int):
+        i = bisect.bisect_left(self.gram_keys, key)
+        while i < len(self.gram_keys) and self.gram_keys[i] == key:
+            yield self.gram_pos[i]
+            i += 1
+
+    def match(self, text: str):
+        """Rectangles of the page words covered by runs of the text's words, in reading order."""
+        query = [t for t in (normalize_token(w) for w in text.split()) if t]
+        found = set()
+        if len(query) >= NGRAM:
+            for i in range(len(query) - NGRAM + 1):
+                gram = query[i:i + NGRAM]
+                for pos in self._positions(gram_hash(gram)):
+                    if self.tokens[pos:pos + NGRAM] == gram:  # Guard against hash collisions
+                        found.update(range(pos, pos + NGRAM))
+        elif query:
+            # Short text: plain scan for the whole token sequence
+            n = len(query)
+            for pos in range(len(self.tokens) - n + 1):
+                if self.tokens[pos:pos + n] == query:
+                    found.update(range(pos, pos + n))
+        return [self.rect(i) for i in sorted(found)]
+
+    def pack(self) -> tuple:
+        return " ".join(self.tokens), self.rects.tobytes(), self.gram_keys.tobytes(), self.gram_pos.tobytes()
+
+    @classmethod
+    def unpack(cls, tokens: str, rects: bytes, gram_keys: bytes, gram_pos: bytes):
+        def load(typecode, raw):
+            values = array(typecode)
+            values.frombytes(raw)
+            return values
+        return cls(tokens.split(" ") if tokens else [], load("f", rects), load("Q", gram_keys), load("I", gram_pos))
+
+
+# --- Storage ---
+
+_schema_ready = set()
+
+
+def _connect():
+    path = index_path()
+    if str(path) in _schema_ready and path.exists():
+        return connect(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = connect(path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS page_words (
+            file_hash TEXT,
+            page INTEGER,
+            tokens TEXT,
+            rects BLOB,
+            gram_keys BLOB,
+            gram_pos BLOB,
+            PRIMARY KEY (file_hash, page)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS indexed_files (
+            file_hash TEXT,
+            path TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            created_at TEXT,
+            PRIMARY KEY (file_hash, path)
+        )
+    ''')
+    _schema_ready.add(str(path))
+    return conn
+
+
+def indexed_pages(file_hash: str, start: int, end: int) -> set:
+    try:
+        conn = _connect()
+        rows = conn.execute(
+            "SELECT page FROM page_words WHERE file_hash = ? AND page >= ? AND page < ?",
+            (file_hash, start, end),
+        ).fetchall()
+        conn.close()
+        return {r[0] for r in rows}
+    except Exception as e:
+        print(f"Error reading word index: {e}")
+        return set()
+
+
+def save_pages(file_hash: str, file_path, pages: dict):
+    """Store {0-based page: PageWords} and remember which file version they belong to."""
+    try:
+        stat = os.stat(file_path)
+        rows = [(file_hash, page, *words.pack()) for page, words in pages.items()]
+        conn = _connect()
+        conn.executemany(
+            "INSERT OR REPLACE INTO page_words (file_hash, page, tokens, rects, gram_keys, gram_pos) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO indexed_files (file_hash, path, size, mtime_ns, created_at) VALUES (?, ?, ?, ?, ?)",
+            (file_hash, str(pathlib.Path(file_path).resolve()), stat.st_size, stat.st_mtime_ns,
+             datetime.utcnow().isoformat()),
+        )
+        conn.commit()
+        conn.close()
+        # Approximate growth of the index file (the reconciliation scan has the exact size)
+        adjust_storage("word_index", sum(len(r[2]) + len(r[3]) + len(r[4]) + len(r[5]) for r in rows))
+    except Exception as e:
+        print(f"Error saving word index: {e}")
+
+
+def load_page(file_hash: str, page: int):
+    """PageWords of a 0-based page, or None if the page was not indexed."""
+    try:
+        conn = _connect()
+        row = conn.execute(
+            "SELECT tokens, rects, gram_keys, gram_pos FROM page_words WHERE file_hash = ? AND page = ?",
+            (file_hash, page),
+        ).fetchone()
+        conn.close()
+        return PageWords.unpack(*row) if row else None
+    except Exception as e:
+        print(f"Error loading word index: {e}")
+        return None
+
+
+def prune_missing() -> int:
+    """Drop pages of file versions whose files were deleted or changed. Returns removed files."""
+    try:
+        conn = _connect()
+        stale = []
+        for file_hash, path, size, mtime_ns in conn.execute(
+            "SELECT file_hash, path, size, mtime_ns FROM indexed_files"
+        ).fetchall():
+            try:
+                stat = os.stat(path)
+                if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+                    continue
+            except FileNotFoundError:
+                pass
+            stale.append((file_hash, path))
+        conn.executemany("DELETE FROM indexed_files WHERE file_hash = ? AND path = ?", stale)
+        conn.execute("DELETE FROM page_words WHERE file_hash NOT IN (SELECT file_hash FROM indexed_files)")
+        conn.commit()
+        conn.close()
+        return len(stale)
+    except Exception as e:
+        print(f"Error pruning word index: {e}")
+        return 0
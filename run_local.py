@@ -21,7 +21,7 @@ from app.workers import tasks as worker_tasks
 def start_local_server():
     print("Starting RAG Knowledge Base in LOCAL DEV MODE")
     print("Using local Qdrant storage at ./qdrant_data")
-    print("Bypassing Celery/Redis for simple threading")
+    print("Bypassing Celery/Redis: ingestion runs in a local worker process pool")
     
     # Run FastAPI
     # reload=False is required for local Qdrant file locking (multiprocessing issue)
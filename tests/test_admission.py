@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.admission import AdmissionController, LocalAdmissionStore
+from app.core.config import settings
+
+
+def make_controller():
+    return AdmissionController(LocalAdmissionStore())
+
+
+def test_admits_within_limits():
+    ctrl = make_controller()
+    ctrl.admit("job-1", "s1", 1000, 1)
+    snap = ctrl.snapshot("s1")
+    assert snap["global"]["jobs"] == 1
+    assert snap["session"]["bytes"] == 1000
+
+
+def test_session_limit_returns_429_with_retry_after():
+    ctrl = make_controller()
+    for i in range(settings.ADMISSION_SESSION_MAX_JOBS):
+        ctrl.admit(f"job-{i}", "s1", 10, 1)
+    with pytest.raises(HTTPException) as exc:
+        ctrl.admit("job-x", "s1", 10, 1)
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 1
+
+
+def test_global_byte_limit_returns_503(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUED_BYTES", 1000)
+    ctrl = make_controller()
+    # Every session stays within its own limits; together they fill the global budget
+    for i in range(3):
+        ctrl.admit(f"job-{i}", f"s{i}", 300, 1)
+    with pytest.raises(HTTPException) as exc:
+        ctrl.admit("job-x", "s-new", 200, 1)
+    assert exc.value.status_code == 503
+    assert "Too much data queued" in exc.value.detail
+    assert exc.value.headers["Retry-After"] == "1"  # 100 excess bytes drain in well under a second
+
+
+def test_release_updates_throughput():
+    ctrl = make_controller()
+    ctrl.admit("job-1", "s1", 1_000_000, 1)
+    ctrl.release("job-1", processing_seconds=2.0)
+    assert ctrl.snapshot()["global"]["jobs"] == 0
+    assert ctrl.throughput() == pytest.approx(500_000)
+
+
+def test_concurrent_admissions_respect_limits(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUED_JOBS", 5)
+    ctrl = make_controller()
+
+    def admit(i):
+        try:
+            ctrl.admit(f"job-{i}", f"s{i}", 10, 1)
+            return True
+        except HTTPException:
+            return False
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        admitted = list(pool.map(admit, range(50)))
+    assert admitted.count(True) == 5
+    assert ctrl.snapshot()["global"]["jobs"] == 5
+
+
+def test_expired_tickets_are_deleted(monkeypatch):
+    ctrl = make_controller()
+    ctrl.admit("old", "s1", 1000, 1)
+    ctrl.admit("new", "s1", 10, 1)
+    ctrl.store._tickets["old"]["queued_at"] -= settings.ADMISSION_TICKET_TTL + 1
+
+    assert ctrl.snapshot()["global"] == {"jobs": 1, "bytes": 10, "pages": 1}
+    assert [job_id for job_id, _ in ctrl.store.tickets()] == ["new"]
+    assert ctrl.store.pop("new") and ctrl.store.pop("new") is None
+
+
+def test_retry_after_for_full_queue(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_DEFAULT_THROUGHPUT", 1000)
+    monkeypatch.setattr(settings, "INGEST_CONCURRENCY", 1)
+    ctrl = make_controller()
+    assert ctrl.retry_after() == 1
+    for i in range(4):
+        ctrl.admit(f"job-{i}", f"s{i}", 30_000, 1)
+    assert ctrl.retry_after() == 30  # One average job at 1000 bytes/s
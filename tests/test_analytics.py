@@ -0,0 +1,67 @@
+import random
+from datetime import datetime, timedelta
+
+from app import db
+from app.core.sketches import HyperLogLog, LatencyHistogram, QueryRollup
+
+
+def test_sketches_merge_and_estimate():
+    rng = random.Random(1)
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(20000):
+        (a if i % 2 else b).add(f"s{i % 15000}")
+    a.merge(HyperLogLog.from_bytes(b.to_bytes()))
+    assert abs(a.count() - 15000) / 15000 < 0.05
+
+    latencies = [rng.lognormvariate(7, 1) for _ in range(5000)]
+    first, second = LatencyHistogram(), LatencyHistogram()
+    for i, value in enumerate(latencies):
+        (first if i % 2 else second).add(value)
+    first.merge(LatencyHistogram.from_json(second.to_json()))
+    exact = sorted(latencies)
+    for q in (0.5, 0.9, 0.99):
+        assert abs(first.quantile(q) - exact[int(len(exact) * q)]) / exact[int(len(exact) * q)] <= 0.011
+
+
+def test_timeseries_from_rollups(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    now = datetime.utcnow()
+    rows = []
+    for i in range(300):
+        timings = {"embed": 5.0 + i % 10, "search": 20.0, "llm": 80.0, "persist": 1.0} if i % 3 else None
+        sql, params = db.query_log_row(f"s{i % 7}", "q", "a", [], (i % 100) / 100, 100.0 + i, 10, 20, timings)
+        when = now - timedelta(days=i % 5, minutes=i % 50)
+        rows.append((sql, (when.isoformat(), *params[1:])))
+    for start in range(0, len(rows), 50):  # Several batches, as the write-behind queue commits them
+        db.write_rows(rows[start:start + 50])
+
+    stats = db.get_timeseries_stats("7d")
+    assert stats["queries_total"] == 300 and sum(stats["queries"]) == 300
+    assert stats["sessions_total"] == 7
+    assert stats["input_tokens"] == 3000 and stats["output_tokens"] == 6000
+    assert stats["latency_avg"] == round(sum(100.0 + i for i in range(300)) / 300, 2)
+    scores = sorted((i % 100) / 100 for i in range(300))
+    assert stats["p50_score"] == scores[150] and stats["p90_score"] == scores[270]
+    # Stage timings: only the 200 queries that recorded them
+    assert stats["stages"]["search"]["count"] == 200 and stats["stages"]["search"]["avg"] == 20.0
+    assert abs(stats["stages"]["llm"]["p99"] - 80.0) <= 0.8
+    embeds = [5.0 + i % 10 for i in range(300) if i % 3]
+    assert stats["stages"]["embed"]["avg"] == round(sum(embeds) / len(embeds), 1)
+    assert stats["stages"]["llm_ttft"]["count"] == 0
+
+    # Rebuilding from query_logs (the migration) gives the same rollups as the inserts
+    conn = db.connect()
+    incremental = conn.execute("SELECT * FROM query_rollups ORDER BY granularity, bucket").fetchall()
+    db.rebuild_query_rollups(conn.cursor())
+    conn.commit()
+    rebuilt = conn.execute("SELECT * FROM query_rollups ORDER BY granularity, bucket").fetchall()
+    assert len(rebuilt) == len(incremental)
+    for old, new in zip(incremental, rebuilt):
+        assert old[:2] == new[:2]
+        old, new = QueryRollup.from_row(old[2:]), QueryRollup.from_row(new[2:])
+        assert (old.queries, old.input_tokens, old.output_tokens) == (new.queries, new.input_tokens, new.output_tokens)
+        assert abs(old.latency_sum - new.latency_sum) < 1e-6
+        assert old.sessions.registers == new.sessions.registers
+        assert old.latency.counts == new.latency.counts and old.confidence.counts == new.confidence.counts
+        assert {k: h.counts for k, h in old.stages.items()} == {k: h.counts for k, h in new.stages.items()}
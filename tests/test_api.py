@@ -19,3 +19,14 @@ def test_health():
 def test_invalid_upload():
     response = client.post("/api/v1/upload", files={"file": ("test.exe", b"fake", "application/octet-stream")})
     assert response.status_code == 400
+
+def test_fast_lane_upload_respects_admission(monkeypatch):
+    from app.core.config import settings
+    # A fast-lane sized text file is still subject to the per-session admission limits
+    monkeypatch.setattr(settings, "ADMISSION_SESSION_MAX_JOBS", 0)
+    response = client.post(
+        "/api/v1/upload?session_id=admission-test",
+        files={"file": ("note.txt", b"tiny note", "text/plain")},
+    )
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
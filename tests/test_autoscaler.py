@@ -0,0 +1,67 @@
+from app.core.config import settings
+from app.workers.autoscaler import Autoscaler, LocalQueueProbe, LocalPool, LocalMetricsStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_scales_with_backlog_and_respects_warmup(monkeypatch):
+    monkeypatch.setattr(settings, "AUTOSCALE_MIN_WORKERS", 1)
+    monkeypatch.setattr(settings, "AUTOSCALE_MAX_WORKERS", 4)
+    monkeypatch.setattr(settings, "AUTOSCALE_TARGET_DRAIN_SECONDS", 100)
+    monkeypatch.setattr(settings, "AUTOSCALE_WARMUP_SECONDS", 60)
+    monkeypatch.setattr(settings, "AUTOSCALE_SCALE_DOWN_DELAY", 300)
+
+    clock = Clock()
+    probe = LocalQueueProbe(depth=2, queued_bytes=5_000, throughput=1_000)
+    pool = LocalPool(processes=1)
+    metrics = LocalMetricsStore()
+    scaler = Autoscaler(probe, pool, metrics, clock=clock)
+
+    # 5s of work: drains before a new process would be warm
+    assert scaler.step()["action"] == "hold"
+
+    # Bulk upload: 1,000s of work for one process -> capped at max
+    probe.depth, probe.queued_bytes = 40, 1_000_000
+    assert scaler.step()["action"] == "scale_up"
+    assert pool.processes == 4
+
+    # Queue empties while the new processes are still warming up: keep them
+    probe.depth, probe.queued_bytes = 0, 0
+    clock.now += 30
+    decision = scaler.step()
+    assert decision["action"] == "hold" and decision["warming"] == 3
+
+    # Warm and idle: shrink only after the scale-down delay
+    clock.now += 60
+    assert scaler.step()["action"] == "hold"
+    clock.now += 300
+    assert scaler.step()["action"] == "scale_down"
+    assert pool.processes == 1
+
+    assert metrics.report()["counters"] == {"hold": 3, "scale_up": 1, "scale_down": 1}
+
+
+def test_scales_for_tasks_queued_without_admission(monkeypatch):
+    monkeypatch.setattr(settings, "AUTOSCALE_MIN_WORKERS", 1)
+    monkeypatch.setattr(settings, "AUTOSCALE_MAX_WORKERS", 4)
+    monkeypatch.setattr(settings, "AUTOSCALE_TARGET_DRAIN_SECONDS", 100)
+    monkeypatch.setattr(settings, "AUTOSCALE_WARMUP_SECONDS", 60)
+    monkeypatch.setattr(settings, "AUTOSCALE_DEFAULT_JOB_BYTES", 50_000)
+
+    # An admitted upload sets the mean job size: 20,000 bytes
+    probe = LocalQueueProbe(depth=1, queued_bytes=20_000, throughput=1_000)
+    pool = LocalPool(processes=1)
+    scaler = Autoscaler(probe, pool, LocalMetricsStore(), clock=Clock())
+    assert scaler.step()["action"] == "hold"
+
+    # Bulk static CLI / fan-out subtasks: no tickets, 20 x 20,000 bytes of work
+    probe.depth, probe.queued_bytes = 20, 0
+    decision = scaler.step()
+    assert decision["backlog_bytes"] == 400_000
+    assert decision["action"] == "scale_up" and pool.processes == 4
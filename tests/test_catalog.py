@@ -0,0 +1,42 @@
+from app import db
+from app.workers import catalog
+
+
+def test_cursor_pagination_and_filters(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    for i in range(5):
+        db.save_document("s1", f"doc{i}.pdf", category="user", size_bytes=i, status="ready")
+    db.save_document("static", "manual.pdf", category="static", status="ready")
+    db.save_document("s1", "doc4.pdf", status="failed", error="boom")
+
+    page, cursor = db.list_documents_page(session_id="s1", limit=2)
+    assert [r["filename"] for r in page] == ["doc4.pdf", "doc3.pdf"]
+    seen = [r["filename"] for r in page]
+    while cursor:
+        page, cursor = db.list_documents_page(session_id="s1", cursor=cursor, limit=2)
+        seen += [r["filename"] for r in page]
+    assert seen == ["doc4.pdf", "doc3.pdf", "doc2.pdf", "doc1.pdf", "doc0.pdf"]
+
+    failed, _ = db.list_documents_page(status="failed")
+    assert [(r["filename"], r["error"], r["size_bytes"]) for r in failed] == [("doc4.pdf", "boom", 4)]
+    static, cursor = db.list_documents_page(category="static")
+    assert [r["session_id"] for r in static] == ["static"] and cursor is None
+
+
+def test_reconcile_adds_untracked_and_drops_missing(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    (tmp_path / "data" / "static").mkdir(parents=True)
+    (tmp_path / "data" / "static" / "manual.pdf").write_bytes(b"%PDF")
+    (tmp_path / "data" / "uploads" / "s1").mkdir(parents=True)
+    (tmp_path / "data" / "uploads" / "s1" / "notes.txt").write_text("hello")
+    db.save_document("s2", "gone.pdf", path=str(tmp_path / "gone.pdf"), status="ready")
+
+    assert catalog.reconcile(tmp_path / "data") == (2, 1)
+    rows, _ = db.list_documents_page()
+    assert sorted((r["session_id"], r["filename"], r["category"]) for r in rows) == [
+        ("s1", "notes.txt", "user"), ("static", "manual.pdf", "static"),
+    ]
+    assert catalog.reconcile(tmp_path / "data") == (0, 0)
+    assert catalog.reconcile(tmp_path / "data", only_if_empty=True) == (0, 0)
@@ -0,0 +1,59 @@
+from app.workers.checkpoints import IngestionCheckpoint
+
+
+def test_checkpoint_resumes_after_last_window(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    doc = tmp_path / "big.pdf"
+    doc.write_bytes(b"fake pdf bytes")
+
+    ckpt = IngestionCheckpoint("s1", "big.pdf", doc, window_pages=10)
+    assert list(ckpt.windows(0, 25)) == [(0, 10), (10, 20), (20, 25)]
+    ckpt.commit(0, 10, ["a", "b"])
+
+    resumed = IngestionCheckpoint("s1", "big.pdf", doc, window_pages=10)
+    assert resumed.resumed
+    assert resumed.pages_done == 10
+    assert resumed.point_ids == ["a", "b"]
+    assert list(resumed.windows(0, 25)) == [(10, 20), (20, 25)]
+
+
+def test_out_of_order_windows_and_scopes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    doc = tmp_path / "big.pdf"
+    doc.write_bytes(b"fake pdf bytes")
+
+    ckpt = IngestionCheckpoint("s1", "big.pdf", doc, window_pages=10, scope="100-200")
+    ckpt.commit(120, 130, ["x"])
+    assert list(ckpt.windows(100, 140)) == [(100, 110), (110, 120), (130, 140)]
+
+    other = IngestionCheckpoint("s1", "big.pdf", doc, window_pages=10, scope="0-100")
+    assert not other.resumed
+
+
+def test_checkpoint_discarded_when_file_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    doc = tmp_path / "big.pdf"
+    doc.write_bytes(b"v1")
+    IngestionCheckpoint("s1", "big.pdf", doc, window_pages=10).commit(0, 10, ["a"])
+
+    doc.write_bytes(b"v2")
+    fresh = IngestionCheckpoint("s1", "big.pdf", doc, window_pages=10)
+    assert not fresh.resumed
+    assert fresh.point_ids == []
+
+
+def test_checkpoint_log_survives_a_torn_write(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    doc = tmp_path / "big.pdf"
+    doc.write_bytes(b"fake pdf bytes")
+    ckpt = IngestionCheckpoint("s1", "big.pdf", doc, window_pages=10)
+    ckpt.commit(0, 10, ["a"])
+    ckpt.commit(10, 20, ["b"])
+    with open(ckpt.path, "a") as f:
+        f.write('{"window": "20-30", "ids": ["c"')  # Crash mid-append
+
+    resumed = IngestionCheckpoint("s1", "big.pdf", doc, window_pages=10)
+    assert resumed.point_ids == ["a", "b"]
+    resumed.commit(20, 30, ["c"])
+    resumed.commit(30, 40, ["d"])
+    assert IngestionCheckpoint("s1", "big.pdf", doc, window_pages=10).point_ids == ["a", "b", "c", "d"]
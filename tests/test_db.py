@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+
+from app import db
+
+
+def test_migrates_legacy_database(tmp_path, monkeypatch):
+    path = tmp_path / "analytics.db"
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE query_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, "
+                   "session_id TEXT, query_text TEXT, answer_text TEXT, sources_json TEXT, "
+                   "confidence_score REAL, latency_ms REAL, token_count INTEGER DEFAULT 0)")
+    legacy.execute("INSERT INTO query_logs (timestamp, session_id, confidence_score, latency_ms) "
+                   "VALUES ('2024-05-01T13:05:00', 's1', 0.8, 120.0)")
+    legacy.execute("CREATE TABLE chat_sessions (session_id TEXT PRIMARY KEY, title TEXT, created_at TEXT)")
+    legacy.commit()
+    legacy.close()
+
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.init_db()
+    conn = db.connect()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db.MIGRATIONS[-1][0]
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(query_logs)").fetchall()}
+    assert {"input_tokens", "output_tokens"} <= columns
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()}
+    assert {"idx_chat_messages_session", "idx_query_logs_timestamp", "idx_query_logs_session"} <= indexes
+    # Rollups built by migration 4, before migration 5 added stages_json
+    rollups = conn.execute("SELECT granularity, queries, stages_json FROM query_rollups ORDER BY 1").fetchall()
+    assert rollups == [("day", 1, None), ("hour", 1, None)]
+
+    # Re-running is a no-op
+    assert db.migrate(conn) == db.MIGRATIONS[-1][0]
+
+
+def test_pooled_connection_per_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    assert db.connect()._conn is db.connect()._conn
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.connect()._conn))
+    thread.start()
+    thread.join()
+    assert other[0] is not db.connect()._conn
+
+    # A failed helper's open transaction does not leak into the next checkout
+    conn = db.connect()
+    conn.execute("INSERT INTO chat_sessions (session_id, title, created_at) VALUES ('s1', 't', 'now')")
+    assert db.connect().execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0] == 0
+
+    db.create_session("s1")
+    db.add_message("s1", "user", "hello")
+    assert [m["content"] for m in db.get_session_messages("s1")] == ["hello"]
+
+
+def test_message_pages_and_source_refs(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    db.create_session("s1")
+    source = {"filename": "a.pdf", "page_label": "3", "score": 0.9, "text": "chunk " * 200}
+    for i in range(5):
+        db.add_message("s1", "user", f"m{i}", [source])
+
+    rows, cursor = db.get_messages_page("s1", limit=2)
+    assert [r["content"] for r in rows] == ["m3", "m4"]
+    assert rows[0]["sources"] == [{"filename": "a.pdf", "page_label": "3", "score": 0.9}]
+    rows, cursor = db.get_messages_page("s1", before=cursor, limit=2)
+    assert [r["content"] for r in rows] == ["m1", "m2"]
+    rows, last = db.get_messages_page("s1", before=cursor, limit=2)
+    assert [r["content"] for r in rows] == ["m0"] and last is None
+
+    rows, cursor = db.get_messages_page("s1", after=rows[0]["id"], limit=3)
+    assert [r["content"] for r in rows] == ["m1", "m2", "m3"] and cursor == rows[-1]["id"]
+    assert db.get_message_sources("s1", rows[0]["id"]) == [source]
+    assert db.get_message_sources("s2", rows[0]["id"]) is None
+
+
+def test_source_refs_backfilled_for_existing_messages(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    conn = db.connect()
+    conn.execute("INSERT INTO chat_messages (session_id, role, content, sources_json, timestamp) VALUES (?, ?, ?, ?, ?)",
+                 ("s1", "assistant", "a", '[{"node": {"metadata": {"filename": "b.pdf", "page_label": "2"}}, "score": 0.5}]',
+                  "2024-01-01T00:00:00"))
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    db.migrate(conn)
+    rows, _ = db.get_messages_page("s1")
+    assert rows[0]["sources"] == [{"filename": "b.pdf", "page_label": "2", "score": 0.5}]
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import app.db as db
+from app.workers import dedup
+
+POLICY = (
+    "Employees may work remotely up to three days per week provided that their manager "
+    "approves the schedule in advance and core hours between ten and three are respected."
+)
+
+
+def make_node(point_id, text, page="1"):
+    return SimpleNamespace(id_=point_id, metadata={"page_label": page}, get_content=lambda: text)
+
+
+def test_minhash_similarity_tracks_overlap():
+    a = dedup.minhash(POLICY)
+    b = dedup.minhash(POLICY.replace("three days", "3 days"))
+    c = dedup.minhash("Quarterly revenue grew by twelve percent driven by strong demand in the enterprise segment.")
+
+    assert dedup.similarity(a, a) == 1.0
+    assert dedup.similarity(a, b) > dedup.similarity(a, c)
+    assert dedup.minhash("Too short to compare") is None
+
+
+def test_near_duplicates_across_documents_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    monkeypatch.setattr(dedup, "_db_ready", False)
+    source = tmp_path / "policy.pdf"
+    source.write_bytes(b"x")
+
+    kept, dupes = dedup.filter_duplicates([make_node("p1", POLICY)], "static", None, "policy_v1.pdf", source)
+    assert [n.id_ for n in kept] == ["p1"] and dupes == 0
+
+    # Same document re-ingested: never a duplicate of itself
+    kept, dupes = dedup.filter_duplicates([make_node("p1", POLICY)], "static", None, "policy_v1.pdf", source)
+    assert dupes == 0
+
+    kept, dupes = dedup.filter_duplicates([make_node("p2", POLICY, page="4")], "static", None, "policy_v2.pdf", source)
+    assert kept == [] and dupes == 1
+    assert db.get_document_alternates(None, "policy_v2.pdf") == {"p1": [{"filename": "policy_v2.pdf", "page_label": "4"}]}
+
+    # Session uploads are not deduplicated against the static library
+    kept, dupes = dedup.filter_duplicates([make_node("p3", POLICY)], "user", "s1", "policy_v1.pdf", source)
+    assert dupes == 0
+
+    report = {row["corpus"]: row for row in db.get_dedup_report()}
+    assert report["static"]["duplicates"] == 1 and report["static"]["duplication_ratio"] == 0.5
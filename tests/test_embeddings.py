@@ -0,0 +1,30 @@
+import pytest
+
+from app.core import embeddings
+
+
+class FakeClient:
+    def __init__(self, payload=None, exists=True):
+        self.payload = payload
+        self.exists = exists
+
+    def get_collection(self, collection_name):
+        if not self.exists:
+            raise ValueError("not found")
+
+    def retrieve(self, collection_name, ids, with_payload=True):
+        if self.payload is None:
+            return []
+        return [type("Record", (), {"payload": self.payload})()]
+
+
+def test_collection_model_mismatch_is_refused():
+    small = embeddings.get_spec("bge-small-int8")
+    assert small.dim == 384 and small.quantized
+
+    embeddings.check_collection_model(FakeClient(exists=False), "kb", small)
+    embeddings.check_collection_model(FakeClient({"embedding_model": "bge-small-int8"}), "kb", small)
+    # Collections without a recorded model were built with the legacy default
+    embeddings.check_collection_model(FakeClient(), "kb", embeddings.get_spec("bge-base"))
+    with pytest.raises(embeddings.EmbeddingModelMismatch):
+        embeddings.check_collection_model(FakeClient(), "kb", small)
@@ -0,0 +1,45 @@
+from app.workers.extraction import clean_page, detect_boilerplate, pack_blocks
+
+
+class FakeRect:
+    height = 800
+
+
+class FakePage:
+    rect = FakeRect()
+
+    def __init__(self, number, body):
+        self.number = number
+        self.body = body
+
+    def get_text(self, mode, sort=False):
+        return [
+            (50, 10, 500, 40, "ACME Corp — Annual Report 2023\n", 0, 0),
+            (50, 100, 500, 300, self.body, 1, 0),
+            (250, 770, 300, 790, f"Page {self.number} of 12\n", 2, 0),
+        ]
+
+
+class FakeDoc:
+    def __init__(self, pages):
+        self.pages = pages
+        self.page_count = len(pages)
+
+    def __getitem__(self, i):
+        return self.pages[i]
+
+
+def test_repeated_headers_and_page_numbers_are_removed():
+    doc = FakeDoc([FakePage(i + 1, f"Body text of page {i + 1} about revenue.") for i in range(12)])
+    boilerplate = detect_boilerplate(doc)
+
+    blocks, removed = clean_page(doc[3], boilerplate)
+    assert blocks == ["Body text of page 4 about revenue."]
+    assert removed == 2
+
+
+def test_pack_blocks_keeps_paragraphs_whole():
+    blocks = ["a" * 40, "b" * 40, "c" * 40, "d" * 200]
+    chunks = pack_blocks(blocks, max_chars=100, split_long=lambda text: [text[:100], text[100:]])
+
+    assert chunks == ["a" * 40 + "\n\n" + "b" * 40, "c" * 40, "d" * 100, "d" * 100]
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import app.db as db
+from app.workers import dedup, file_sharing
+
+
+class FakeClient:
+    def __init__(self):
+        self.payloads = []
+        self.deleted = []
+
+    def set_payload(self, collection_name, payload, points, wait=True):
+        self.payloads.append(payload)
+
+    def delete(self, collection_name, points_selector, wait=True):
+        self.deleted.append(points_selector)
+
+
+def test_identical_upload_is_shared_and_refcounted(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    client = FakeClient()
+
+    assert file_sharing.attach_session(client, "kb", "h1", "s2", "contract.pdf") is None
+
+    file_sharing.register_upload(client, "kb", "h1", "s1", "contract.pdf", point_count=42)
+    shared = file_sharing.attach_session(client, "kb", "h1", "s2", "contract.pdf")
+    assert shared["point_count"] == 42
+    assert client.payloads[-2] == {"session_id": "shared:h1"}
+    assert client.payloads[-1] == {"allowed_sessions": ["s1", "s2"]}
+    assert db.get_shared_file("h1")["refcount"] == 2
+
+    file_sharing.release_session(client, "kb", "s1")
+    assert client.payloads[-1] == {"allowed_sessions": ["s2"]}
+    assert not client.deleted
+
+    file_sharing.release_session(client, "kb", "s2")
+    assert len(client.deleted) == 1
+    assert db.get_shared_file("h1") is None
+
+
+def test_identical_upload_after_intra_session_duplicate(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    monkeypatch.setattr(dedup, "_db_ready", False)
+    db.init_db()
+    client = FakeClient()
+    source = tmp_path / "upload.pdf"
+    source.write_bytes(b"x")
+    text = ("Employees may work remotely up to three days per week provided that their manager "
+            "approves the schedule in advance.")
+
+    def nodes(prefix, count):
+        return [SimpleNamespace(id_=f"{prefix}{i}", metadata={"page_label": str(i)}, get_content=lambda: text)
+                for i in range(count)]
+
+    # s1 uploads a policy, then a pack that repeats it: the pack keeps all its chunks
+    dedup.filter_duplicates(nodes("a", 1), "user", "s1", "policy.pdf", source)
+    kept, dupes = dedup.filter_duplicates(nodes("b", 3), "user", "s1", "pack.pdf", source)
+    assert len(kept) == 3 and dupes == 0
+    file_sharing.register_upload(client, "kb", "h-pack", "s1", "pack.pdf", point_count=len(kept))
+
+    # s2 uploads the identical pack and gets every chunk of it
+    shared = file_sharing.attach_session(client, "kb", "h-pack", "s2", "pack.pdf")
+    assert shared["point_count"] == 3
+
+
+def test_shared_file_keeps_each_sessions_filename(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    client = FakeClient()
+
+    file_sharing.register_upload(client, "kb", "h1", "s1", "contract.pdf", point_count=5)
+    file_sharing.attach_session(client, "kb", "h1", "s2", "Contract (1).pdf")
+    file_sharing.attach_session(client, "kb", "h1", "s3", "contract.pdf")
+
+    # Sources of the shared points are shown (and resolved) under the session's own upload name
+    assert db.get_shared_filenames("s2") == {"contract.pdf": "Contract (1).pdf"}
+    assert db.get_shared_filenames("s1") == {} and db.get_shared_filenames("s3") == {}
@@ -0,0 +1,65 @@
+import sys
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from app import db
+from app.workers.jobs import register_job
+from app.workers.local_executor import LocalIngestionExecutor
+
+
+def fake_module(name, **functions):
+    module = types.ModuleType(name)
+    module.__dict__.update(functions)
+    return module
+
+
+def wait_for_status(session_id, filename, statuses, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        rows, _ = db.list_documents_page(session_id=session_id)
+        row = next((r for r in rows if r["filename"] == filename), None)
+        if row and row["status"] in statuses:
+            return row
+        time.sleep(0.02)
+    raise AssertionError(f"{filename} never reached {statuses}")
+
+
+def test_local_ingestion_updates_catalog(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+
+    def prepare_window(file_path, filename, category, session_id, tracker, start, end):
+        if filename == "broken.txt":
+            raise ValueError("unreadable")
+        return [f"{filename}:{start}:{i}" for i in range(3)]
+
+    # Parsing/embedding and Qdrant are out of scope: the executor's bookkeeping is under test
+    monkeypatch.setitem(sys.modules, "app.workers.pipeline", fake_module(
+        "app.workers.pipeline", count_pages=lambda file_path, filename: 1, prepare_window=prepare_window))
+    monkeypatch.setitem(sys.modules, "app.workers.tasks", fake_module(
+        "app.workers.tasks",
+        ensure_collection=lambda: None,
+        attach_shared_upload=lambda *args: None,
+        write_window=lambda points, tracker: list(points),
+        finalize_document=lambda *args: None,
+    ))
+
+    executor = LocalIngestionExecutor(workers=1, queue_size=4)
+    executor._pool.shutdown()
+    executor._pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        for job_id, filename in (("j1", "notes.txt"), ("j2", "broken.txt")):
+            path = tmp_path / filename
+            path.write_text("hello world")
+            register_job(job_id, filename, "user", "s1", size_bytes=path.stat().st_size)
+            executor.submit(job_id, path, filename, session_id="s1")
+
+        ready = wait_for_status("s1", "notes.txt", ("ready", "failed"))
+        assert ready["status"] == "ready" and ready["chunk_count"] == 3
+        assert ready["page_count"] == 1 and ready["file_hash"] and ready["path"]
+        failed = wait_for_status("s1", "broken.txt", ("ready", "failed"))
+        assert failed["status"] == "failed" and "unreadable" in failed["error"]
+    finally:
+        executor.shutdown()
@@ -0,0 +1,25 @@
+import asyncio
+import threading
+
+from app.core.notifications import LocalEventBus
+
+
+def test_local_bus_delivers_events_published_from_worker_threads():
+    bus = LocalEventBus()
+
+    async def scenario():
+        stream = bus.subscribe("s1")
+        first = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)  # let the subscriber register
+        assert bus.active
+
+        worker = threading.Thread(target=bus.publish, args=("s1", {"type": "job", "job": {"job_id": "j1"}}))
+        worker.start()
+        bus.publish("other-session", {"type": "job", "job": {"job_id": "j2"}})
+        event = await asyncio.wait_for(first, timeout=2)
+        worker.join()
+        await stream.aclose()
+        return event
+
+    assert asyncio.run(scenario())["job"]["job_id"] == "j1"
+    assert not bus.active
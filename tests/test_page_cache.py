@@ -0,0 +1,24 @@
+from app.core.page_render import PageCache, cache_key
+
+
+def test_page_cache_evicts_least_recently_used(tmp_path):
+    cache = PageCache(tmp_path, max_bytes=250)
+    keys = [cache_key("h", page, 2.0, "jpeg") for page in (1, 2, 3)]
+    cache.put(keys[0], b"a" * 100)
+    cache.put(keys[1], b"b" * 100)
+    assert cache.get(keys[0]) == b"a" * 100  # page 1 is now the most recent
+
+    cache.put(keys[2], b"c" * 100)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.stats()["bytes"] == 200
+
+    # Index rebuilt from disk after a restart
+    assert PageCache(tmp_path, max_bytes=250).get(keys[2]) == b"c" * 100
+
+
+def test_cache_key_covers_highlights_and_format():
+    base = cache_key("h", 1, 2.0, "jpeg", "Net  Revenue")
+    assert base == cache_key("h", 1, 2.0, "jpeg", "net revenue")
+    assert base != cache_key("h", 1, 2.0, "webp", "net revenue")
+    assert base != cache_key("h", 1, 1.0, "jpeg", "net revenue")
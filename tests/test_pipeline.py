@@ -0,0 +1,41 @@
+import base64
+
+import pytest
+
+from app import db
+from app.workers import tasks
+from app.workers.pipeline import upload_path
+
+
+def test_upload_path_stays_inside_the_session_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert upload_path("report.pdf", "user", "s1") == tmp_path / "data" / "uploads" / "s1" / "report.pdf"
+    assert upload_path("manual.pdf", "static", None) == tmp_path / "data" / "static" / "manual.pdf"
+    assert upload_path("policies/a.pdf", "static", None) == tmp_path / "data" / "static" / "policies" / "a.pdf"
+
+    for filename in ("../../x/y.md", "x/y.md", "/etc/passwd", "..", ""):
+        with pytest.raises(ValueError):
+            upload_path(filename, "user", "s1")
+    for session_id in ("../../outside", ".", None):
+        with pytest.raises(ValueError):
+            upload_path("notes.md", "user", session_id)
+    for filename in ("../a.pdf", "policies/../../a.pdf", "/etc/passwd", "."):
+        with pytest.raises(ValueError):
+            upload_path(filename, "static", None)
+
+
+def test_nested_static_file_ingested_from_base64(tmp_path, monkeypatch):
+    # What ingest_static sends for a corpus outside the shared data volume
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    monkeypatch.setattr(tasks, "ensure_collection", lambda: None)
+    monkeypatch.setattr(tasks, "ingest_windows", lambda *args, **kwargs: ["p1", "p2"])
+
+    content = base64.b64encode(b"Remote work is allowed three days per week.").decode("utf-8")
+    result = tasks.ingest_file_logic(content, "policies/remote.txt", "static", None)
+
+    assert result["status"] == "success" and result["chunks"] == 2
+    assert (tmp_path / "data" / "static" / "policies" / "remote.txt").exists()
+    rows, _ = db.list_documents_page(category="static")
+    assert [(r["filename"], r["status"]) for r in rows] == [("policies/remote.txt", "ready")]
@@ -0,0 +1,29 @@
+import numpy as np
+
+from app.core import projection as proj
+
+
+def test_pca_projection_round_trips_and_keeps_neighbours(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    # 64-dim vectors that really live in 8 dimensions
+    vectors = rng.standard_normal((300, 8)) @ rng.standard_normal((8, 64))
+
+    fitted = proj.fit_pca(vectors, 8, "bge-base", name=proj.next_name("pca", 8))
+    assert fitted.name == "pca8-v1"
+    assert fitted.explained_variance > 0.99
+    proj.save_projection(fitted)
+    assert proj.next_name("pca", 8) == "pca8-v2"
+
+    loaded = proj.load_projection("pca8-v1")
+    reduced = loaded.apply(vectors)
+    assert reduced.shape == (300, 8)
+    assert np.allclose(np.linalg.norm(reduced, axis=1), 1.0, atol=1e-5)
+
+    # Nearest neighbour of a vector in reduced space is the same as in full space
+    full = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = 7
+    full_scores = full @ full[query]
+    reduced_scores = reduced @ reduced[query]
+    full_scores[query] = reduced_scores[query] = -1
+    assert np.argmax(full_scores) == np.argmax(reduced_scores)
@@ -0,0 +1,39 @@
+import pytest
+from fastapi import HTTPException
+
+from app import db
+from app.core import storage
+from app.core.config import settings
+
+
+def test_ledger_reconcile_and_quota(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    data = tmp_path / "data"
+    (data / "uploads" / "s1").mkdir(parents=True)
+    (data / "uploads" / "s1" / "a.pdf").write_bytes(b"x" * 300)
+    (data / "page_cache").mkdir()
+    (data / "page_cache" / "k.webp").write_bytes(b"x" * 50)
+    (data / "word_index.db").write_bytes(b"x" * 20)
+
+    # Ledger knows only part of it: the scan corrects the drift
+    storage.record_upload("user", "s1", 100, 1)
+    assert storage.reconcile(data) == {"bytes": 270, "files": 2}
+    usage = storage.usage()
+    assert usage["used_bytes"] == 370
+    assert usage["categories"]["page_cache"] == {"bytes": 50, "files": 1}
+    assert usage["categories"]["word_index"]["bytes"] == 20
+    assert usage["sessions"] == [{"session_id": "s1", "bytes": 300, "files": 1}]
+
+    monkeypatch.setattr(settings, "STORAGE_SESSION_QUOTA_MB", 1)
+    storage.check_quota("s1", 1024)
+    with pytest.raises(HTTPException) as exc:
+        storage.check_quota("s1", 1024 * 1024)
+    assert exc.value.status_code == 413
+    monkeypatch.setattr(settings, "STORAGE_QUOTA_GB", 500 / 1024 ** 3)
+    with pytest.raises(HTTPException) as exc:
+        storage.check_quota("s2", 200)
+    assert exc.value.status_code == 507
+
+    db.forget_session_storage("s1")
+    assert storage.usage()["categories"]["uploads"]["bytes"] == 0
@@ -0,0 +1,19 @@
+from app.workers.vector_writer import point_id, document_id
+
+
+def test_point_id_is_deterministic():
+    a = point_id("s1", "report.pdf", "3", 0, "hello world")
+    b = point_id("s1", "report.pdf", "3", 0, "hello world")
+    assert a == b
+
+
+def test_point_id_changes_with_identity():
+    base = point_id("s1", "report.pdf", "3", 0, "hello world")
+    assert point_id("s2", "report.pdf", "3", 0, "hello world") != base
+    assert point_id("s1", "report.pdf", "4", 0, "hello world") != base
+    assert point_id("s1", "report.pdf", "3", 1, "hello world") != base
+    assert point_id("s1", "report.pdf", "3", 0, "hello there") != base
+
+
+def test_document_id_is_stable():
+    assert document_id(None, "a.txt", "1") == document_id("", "a.txt", "1")
@@ -0,0 +1,43 @@
+from app.workers import word_index
+from app.workers.word_index import PageWords
+
+
+def make_words(text):
+    """Fake PyMuPDF word tuples: one 10x10 box per word on a single line."""
+    return [(10.0 * i, 0.0, 10.0 * i + 9, 10.0, w, 0, 0, i) for i, w in enumerate(text.split())]
+
+
+PAGE = "The quick brown fox jumps over the lazy dog. Revenue grew (12%) in the third quarter."
+
+
+def test_match_long_text_uses_word_runs():
+    page = PageWords.from_words(make_words(PAGE))
+    rects = page.match("revenue grew (12%) in the THIRD")
+    assert [r[0] for r in rects] == [90.0, 100.0, 110.0, 120.0, 130.0, 140.0]
+
+
+def test_match_short_text_and_misses():
+    page = PageWords.from_words(make_words(PAGE))
+    assert [r[0] for r in page.match("lazy dog")] == [70.0, 80.0]
+    assert page.match("purple elephants dance at midnight") == []
+    assert page.match("") == []
+
+
+def test_pack_roundtrip_and_storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    page = PageWords.from_words(make_words(PAGE))
+    restored = PageWords.unpack(*page.pack())
+    assert restored.tokens == page.tokens
+    assert restored.match("fox jumps over the") == page.match("fox jumps over the")
+
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF")
+    word_index.save_pages("abc", pdf, {0: page})
+    assert word_index.indexed_pages("abc", 0, 5) == {0}
+    assert word_index.load_page("abc", 0).tokens == page.tokens
+    assert word_index.load_page("abc", 1) is None
+
+    # Changed file: its pages are pruned
+    pdf.write_bytes(b"%PDF-changed")
+    assert word_index.prune_missing() == 1
+    assert word_index.load_page("abc", 0) is None
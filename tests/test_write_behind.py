@@ -0,0 +1,67 @@
+import threading
+
+from app import db
+from app.core.write_behind import WriteBehindQueue
+
+
+def test_batches_rows_and_flushes(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "analytics.db")
+    db.init_db()
+    batches = []
+
+    def write(rows):
+        batches.append(len(rows))
+        db.write_rows(rows)
+
+    queue = WriteBehindQueue(write, batch_rows=50, interval_ms=1000, queue_size=1000)
+    for i in range(120):
+        queue.submit(db.message_row("s1", "user", f"m{i}"))
+    assert queue.flush(timeout=5)
+    assert [m["content"] for m in db.get_session_messages("s1")] == [f"m{i}" for i in range(120)]
+    assert sum(batches) == 120 and max(batches) == 50
+    assert queue.stats()["written"] == 120
+
+    queue.close(timeout=5)
+    queue.submit(db.query_log_row("s1", "q", "a", [], 0.5, 10.0))  # Synchronous once stopped
+    assert queue.stats()["inline"] == 1
+
+
+def test_overflow_policies():
+    release = threading.Event()
+    written = []
+
+    def slow_write(rows):
+        if threading.current_thread().name == "write-behind":  # Disk stalls for the writer thread only
+            release.wait(5)
+        written.extend(rows)
+
+    dropping = WriteBehindQueue(slow_write, batch_rows=1, interval_ms=0, queue_size=2, overflow="drop")
+    results = [dropping.submit(("sql", (i,))) for i in range(10)]
+    assert not all(results) and dropping.stats()["dropped"] == results.count(False)
+
+    blocking = WriteBehindQueue(slow_write, batch_rows=1, interval_ms=0, queue_size=2, overflow="block", block_ms=10)
+    assert all(blocking.submit(("sql", (i,))) for i in range(10))
+    release.set()
+    assert dropping.flush(timeout=5) and blocking.flush(timeout=5)
+    assert blocking.stats()["inline"] > 0
+    # Rows are lost only by the "drop" policy
+    assert len(written) == 20 - dropping.stats()["dropped"]
+    dropping.close(timeout=5)
+    blocking.close(timeout=5)
+
+
+def test_failed_batch_retried_row_by_row():
+    committed = []
+
+    def write(rows):
+        if any(params is None for _, params in rows):
+            raise ValueError("bad row")
+        committed.extend(rows)
+
+    queue = WriteBehindQueue(write, batch_rows=10, interval_ms=50, queue_size=100)
+    for params in [(1,), None, (2,)]:
+        queue.submit(("sql", params))
+    assert queue.flush(timeout=5)
+    assert [params for _, params in committed] == [(1,), (2,)]
+    assert queue.stats()["failed"] == 1
+    queue.close(timeout=5)